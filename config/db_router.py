@@ -0,0 +1,95 @@
+"""
+Read replicas: reads go to one of the DATABASE_REPLICAS aliases, writes and
+select_for_update() to "default", the primary.
+
+Replicas lag a little behind the primary, so reads go to the primary
+(read-your-writes) when
+ - the current request already wrote something,
+ - a transaction is open on the primary (reads inside it must see its writes),
+ - the user wrote in the last REPLICA_PIN_SECONDS: ReplicaStickinessMiddleware
+   sets a short-lived cookie on the response of every request that wrote.
+Code outside requests (management commands, shell) can use `use_primary()`.
+Without replicas configured everything goes to "default".
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = "db_primary"
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar("db_routing", default=None)
+
+
+def is_pinned() -> bool:
+    state = _state.get()
+    if state is not None and (state.pinned or state.wrote):
+        return True
+    return connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+@contextmanager
+def use_primary():
+    token = _state.set(RoutingState(pinned=True))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or is_pinned():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Also asked for select_for_update(), which counts as a write too
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """Put it before SessionMiddleware, so the session is read from the primary too."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite="Lax"
+            )
+        return response
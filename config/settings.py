@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -24,7 +25,8 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
-    'django.contrib.staticfiles',
+    'django.contrib.postgres',
+    'website.apps.WebsiteStaticFilesConfig',
     'website',
     'accounts',
 ]
@@ -38,6 +40,12 @@ LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 
 MIDDLEWARE = [
+    # Collected static files, before everything else (no session, metrics, ...)
+    'website.staticfiles.StaticFilesMiddleware',
+    # First, so its view time covers all other middleware
+    'website.instrumentation.RequestMetricsMiddleware',
+    # Before the session, see config/db_router.py
+    'config.db_router.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,13 +53,15 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'website.htmx.HtmxMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render time for the request metrics
+        'BACKEND': 'website.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -59,6 +69,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'website.htmx.base_template',
             ],
         },
     },
@@ -90,6 +101,56 @@ DATABASES = {
     }
 }
 
+# Read replicas (config/db_router.py)
+# DB_REPLICA_HOSTS=replica1,replica2 adds the aliases "replica1", "replica2" with
+# the same credentials as "default". Reads go to them, writes to "default".
+# After a write the user reads from "default" for REPLICA_PIN_SECONDS.
+DATABASE_REPLICAS = []
+for n, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica{n}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{n}')
+DATABASE_ROUTERS = ['config.db_router.PrimaryReplicaRouter']
+
+# Covering indexes (Index.include) are PostgreSQL-only, other databases build them without the extra columns
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+REPLICA_PIN_SECONDS = 5
+
+# Cache
+# The booking list caches rendered timeslot cards (website/fragment_cache.py).
+# Local memory is per process: use a shared backend (Redis/Memcached) with several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Logging
+# One JSON line per request with its queries and timings (website/instrumentation.py).
+# REQUEST_LOG_LEVEL=WARNING switches them off.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'website.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Metrics
+# /metrics (website/metrics.py): every worker process writes its values to
+# METRICS_DIR, empty it on deploy. Scrapers authenticate with
+# "Authorization: Bearer <METRICS_TOKEN>", staff can open it in the browser.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -125,3 +186,10 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+# Hashed names plus .gz/.br variants on collectstatic, see website/staticfiles.py
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'website.staticfiles.CompressedManifestStaticFilesStorage'},
+}
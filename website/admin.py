@@ -2,10 +2,14 @@ from django.contrib import admin
 from django import forms
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.db.models import F
 from django.utils.dateparse import parse_date, parse_time
 from datetime import datetime
 
-from .models import Timeslot, Booking, BookingStatus
+from . import fragment_cache
+from .models import ArchivedBooking, Timeslot, TimeslotSeatShard, TimeslotSeries, Booking
+from .pagination import EstimatedCountPaginator
+from .search import search_timeslots
 
 
 class TimeslotSplitAdminForm(forms.ModelForm):
@@ -75,33 +79,141 @@ class BookingInline(admin.TabularInline):
     autocomplete_fields = ("user",)
     show_change_link = True
 
+    # Big events have thousands of bookings, the inline only shows the latest ones
+    max_shown = 50
+    verbose_name_plural = f"Bookings (latest {max_shown}, all of them are under Bookings)"
+
+    def get_queryset(self, request):
+        # The change link prints str(booking), which needs user and timeslot
+        return super().get_queryset(request).select_related("user", "timeslot")
+
+    def latest_ids(self, request, timeslot: Timeslot) -> list[int]:
+        return list(
+            self.get_queryset(request)
+            .filter(timeslot=timeslot)
+            .order_by("-booked_at", "-pk")
+            .values_list("pk", flat=True)[: self.max_shown]
+        )
+
+
+class SeatShardInline(admin.TabularInline):
+    model = TimeslotSeatShard
+    extra = 0
+    fields = ("index", "capacity", "confirmed_count")
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        # Shards are created by rebalancing, see Timeslot.seat_shards
+        return False
+
 
 @admin.register(Timeslot)
 class TimeslotAdmin(admin.ModelAdmin):
     form = TimeslotSplitAdminForm
 
-    list_display = ("start_at", "end_at", "address", "capacity", "status", "confirmed_count", "free_spots")
+    list_display = ("start_at", "end_at", "address", "capacity", "status", "booked", "free_spots")
     list_filter = ("status",)
-    search_fields = ("address",)
+    # Only shows the search box, get_search_results() does the searching
+    search_fields = ("event_name", "event_description", "address")
     date_hierarchy = "start_at"
     ordering = ("-start_at",)
+    readonly_fields = ("confirmed_count",)
+
+    inlines = [SeatShardInline, BookingInline]
 
-    inlines = [BookingInline]
+    def get_queryset(self, request):
+        # Seats come from the annotation, not from a query per row
+        return super().get_queryset(request).with_free_spots()
 
-    def confirmed_count(self, obj: Timeslot) -> int:
-        return obj.bookings.filter(status=BookingStatus.CONFIRMED).count()
-    confirmed_count.short_description = "Confirmed"
+    def get_search_results(self, request, queryset, search_term):
+        # Same indexed search as the booking page (also used by the booking autocomplete)
+        return search_timeslots(queryset, search_term), False
+
+    def get_formset_kwargs(self, request, obj, inline, prefix):
+        kwargs = super().get_formset_kwargs(request, obj, inline, prefix)
+        if isinstance(inline, BookingInline) and obj.pk:
+            kwargs["queryset"] = kwargs["queryset"].filter(pk__in=inline.latest_ids(request, obj))
+        return kwargs
+
+    def booked(self, obj: Timeslot) -> int:
+        return obj.booked_db
+    booked.short_description = "Booked"
+    booked.admin_order_field = "booked_db"
 
     def free_spots(self, obj: Timeslot) -> int:
-        return obj.free_spots()
+        return obj.free_spots_db
     free_spots.short_description = "Free spots"
+    free_spots.admin_order_field = F("capacity") - F("booked_db")
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if {"capacity", "seat_shards"} & set(form.changed_data):
+            obj.rebalance_seat_shards()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        fragment_cache.timeslots_changed()
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Bookings may have been added/cancelled/deleted through the inline
+        Timeslot.objects.filter(pk=form.instance.pk).recount_seats()
 
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
     list_display = ("timeslot", "user", "status", "booked_at", "cancelled_at")
+    list_select_related = ("timeslot", "user")
     list_filter = ("status", "timeslot__status")
     search_fields = ("user__username", "user__email", "timeslot__address")
     autocomplete_fields = ("timeslot", "user")
     readonly_fields = ("booked_at",)
     ordering = ("-booked_at",)
+
+    # No COUNT(*) over the whole bookings table per changelist
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # Every write recounts the affected timeslot(s) inside the admin's transaction
+
+    def save_model(self, request, obj, form, change):
+        old_timeslot_id = form.initial.get("timeslot") if change else None
+        super().save_model(request, obj, form, change)
+        Timeslot.objects.filter(pk__in={obj.timeslot_id, old_timeslot_id}).recount_seats()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Timeslot.objects.filter(pk=obj.timeslot_id).recount_seats()
+
+    def delete_queryset(self, request, queryset):
+        timeslot_ids = set(queryset.values_list("timeslot_id", flat=True))
+        super().delete_queryset(request, queryset)
+        Timeslot.objects.filter(pk__in=timeslot_ids).recount_seats()
+
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(admin.ModelAdmin):
+    list_display = ("timeslot", "user", "status", "booked_at", "cancelled_at", "archived_at")
+    list_select_related = ("timeslot", "user")
+    list_filter = ("status",)
+    search_fields = ("user__username", "user__email", "timeslot__address")
+    ordering = ("-booked_at",)
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # History only, written by manage.py archive_bookings
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TimeslotSeries)
+class TimeslotSeriesAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "frequency", "until", "count", "created_at")
+    list_filter = ("frequency",)
+    readonly_fields = ("created_at",)
@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.contrib.staticfiles import apps as staticfiles_apps
+from django.db.models.signals import post_migrate
 
 
 class WebsiteConfig(AppConfig):
     name = 'website'
+
+    def ready(self):
+        from . import partitions
+
+        post_migrate.connect(partitions.ensure_sqlite_trigger, sender=self)
+
+
+class WebsiteStaticFilesConfig(staticfiles_apps.StaticFilesConfig):
+    # Replaces django.contrib.staticfiles in INSTALLED_APPS. static/src holds
+    # the Tailwind input, only the built css/ is collected.
+    default = False
+    ignore_patterns = staticfiles_apps.StaticFilesConfig.ignore_patterns + ["src"]
@@ -0,0 +1,86 @@
+"""
+Archival of past bookings and the my_bookings history.
+
+Bookings of finished timeslots never change again, but they would stay in
+the bookings table, and its indexes, forever. `manage.py archive_bookings`
+moves them to ArchivedBooking in batches of BATCH_SIZE rows, one
+transaction per batch (copy, then delete), so the live table only holds
+what the booking pages actually work on.
+
+booking_history() reads a my_bookings tab from both tables (UNION ALL), as
+flat rows the template renders the same way whichever table they came from.
+"""
+from django.db import transaction
+from django.db.models import F, Func, Subquery
+from django.utils import timezone
+
+from .models import ArchivedBooking, Booking, BookingStatus, Timeslot
+
+BATCH_SIZE = 5000
+
+TABS = ("upcoming", "past", "cancelled")
+
+HISTORY_FIELDS = ("id", "status", "message", "cancelled_at", "timeslot_id")
+TIMESLOT_FIELDS = {
+    "event_name": F("timeslot__event_name"),
+    "start_at": F("timeslot__start_at"),
+    "end_at": F("timeslot__end_at"),
+    "address": F("timeslot__address"),
+    "timeslot_status": F("timeslot__status"),
+}
+
+ARCHIVED_FIELDS = ("id", "timeslot_id", "user_id", "message", "status", "booked_at", "cancelled_at")
+
+
+def archive_batch(before, batch_size: int = BATCH_SIZE) -> int:
+    """Move up to batch_size bookings of timeslots that ended before `before`, return how many."""
+    with transaction.atomic():
+        # Locked, a cancel running right now finishes before its row is copied
+        rows = list(
+            Booking.objects.select_for_update(of=("self",))
+            .filter(timeslot__end_at__lt=before, timeslot_start_at__lt=before)
+            .order_by("pk")
+            .values_list(*ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        now = timezone.now()
+        ArchivedBooking.objects.bulk_create(
+            [ArchivedBooking(**dict(zip(ARCHIVED_FIELDS, row)), archived_at=now) for row in rows]
+        )
+        Booking.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def booking_history(user, tab: str):
+    """The rows of a my_bookings tab: upcoming bookings, or past/cancelled ones including the archive."""
+    now = timezone.now()
+    # The timeslot_start_at bounds only help PostgreSQL skip bookings partitions
+    if tab == "upcoming":
+        # MIN() as a plain Func: Min() would GROUP BY every timeslot column
+        unfinished = Timeslot.objects.filter(end_at__gte=now).order_by().values(
+            start=Func("start_at", function="MIN")
+        )
+        return (
+            _rows(Booking.objects.filter(
+                user=user,
+                status=BookingStatus.CONFIRMED,
+                timeslot__end_at__gte=now,
+                timeslot_start_at__gte=Subquery(unfinished),
+            ))
+            .order_by("start_at", "id")
+        )
+
+    if tab == "past":
+        live = Booking.objects.filter(
+            user=user, status=BookingStatus.CONFIRMED, timeslot__end_at__lt=now, timeslot_start_at__lt=now
+        )
+        archived = ArchivedBooking.objects.filter(user=user, status=BookingStatus.CONFIRMED)
+    else:
+        live = Booking.objects.filter(user=user, status=BookingStatus.CANCELLED)
+        archived = ArchivedBooking.objects.filter(user=user, status=BookingStatus.CANCELLED)
+    return _rows(live).union(_rows(archived), all=True).order_by("-start_at", "-id")
+
+
+def _rows(queryset):
+    return queryset.order_by().values(*HISTORY_FIELDS, **TIMESLOT_FIELDS)
@@ -0,0 +1,72 @@
+"""
+ETags for the booking pages (conditional GET).
+
+A page's ETag hashes a cheap version probe together with who is looking.
+The probe is a single query of four index lookups:
+ - the latest Timeslot.updated_at (edits, cancels, seats on single-counter
+   timeslots),
+ - the highest Booking id and the latest Booking.cancelled_at (bookings and
+   cancellations, also on sharded timeslots),
+ - the next end_at still to come (the lists drop timeslots when they end),
+plus the fragment cache's list version, which the deletes and bulk writes
+bump. The ETag also covers the CSRF secret, so a page whose forms carry an
+old token is never revalidated. A matching If-None-Match is answered with
+304 before the view runs its queries or renders anything.
+"""
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.db import connections, router
+from django.middleware.csrf import get_token
+from django.utils import timezone
+
+from . import fragment_cache, htmx
+from .models import Booking, Timeslot
+
+
+def content_version() -> str:
+    # Read where the page itself would be read, see config/db_router.py
+    connection = connections[router.db_for_read(Timeslot)]
+    timeslots, bookings = Timeslot._meta.db_table, Booking._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT (SELECT MAX(updated_at) FROM {timeslots}),"
+            f" (SELECT MIN(end_at) FROM {timeslots} WHERE end_at >= %s),"
+            f" (SELECT MAX(id) FROM {bookings}),"
+            f" (SELECT MAX(cancelled_at) FROM {bookings})",
+            [connection.ops.adapt_datetimefield_value(timezone.now())],
+        )
+        row = cursor.fetchone()
+    return ":".join(str(value) for value in row)
+
+
+def page_etag(request, *args, **kwargs) -> str | None:
+    """etag_func for django.views.decorators.http.condition()."""
+    if request.method not in ("GET", "HEAD"):
+        return None
+    # Flash messages are shown once, the page with them is never the cached one
+    if len(get_messages(request)):
+        return None
+    # A replaced CSRF cookie: the page has to carry tokens of the new secret
+    if request.META.get("CSRF_COOKIE_NEEDS_UPDATE"):
+        return None
+    # Creates the secret of a first visit now, so it is the one hashed and
+    # the next visit (with the cookie) matches
+    get_token(request)
+
+    user = request.user
+    parts = [
+        content_version(),
+        fragment_cache.list_key(None),
+        user.pk if user.is_authenticated else "anonymous",
+        user.is_staff,
+        # The CSRF secret the page's tokens are made from (cookie or session),
+        # a login rotates it
+        request.META["CSRF_COOKIE"],
+        htmx.partial_navigation(request),
+        # HTMX actions on the same URL get a fragment (the in-card booking form)
+        request.headers.get("HX-Request") == "true",
+        # The footer's year
+        timezone.localdate().year,
+    ]
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
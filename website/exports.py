@@ -0,0 +1,101 @@
+"""
+Streaming CSV/JSON exports of timeslots and bookings.
+
+Rows are read with .values().iterator(chunk_size=...), which uses a
+server-side cursor on PostgreSQL, and written out one chunk at a time, so
+memory stays flat no matter how many rows there are.
+"""
+import csv
+import itertools
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ArchivedBooking, Booking, Timeslot
+
+CHUNK_SIZE = 2000
+
+TIMESLOT_FIELDS = [
+    "id",
+    "event_name",
+    "event_description",
+    "start_at",
+    "end_at",
+    "address",
+    "capacity",
+    "booked_db",
+    "status",
+    "series_id",
+]
+
+BOOKING_FIELDS = [
+    "id",
+    "timeslot_id",
+    "timeslot__event_name",
+    "timeslot__start_at",
+    "user__username",
+    "user__email",
+    "status",
+    "message",
+    "booked_at",
+    "cancelled_at",
+]
+
+KINDS = ("timeslots", "bookings")
+FORMATS = ("csv", "json")
+
+
+def export_rows(kind: str, timeslot_id: int | None = None):
+    """(header, row dicts) of an export, bookings optionally of one timeslot only."""
+    if kind == "timeslots":
+        fields = TIMESLOT_FIELDS
+        rows = (
+            Timeslot.objects.with_free_spots().order_by("start_at", "id")
+            .values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+        )
+    elif kind == "bookings":
+        fields = BOOKING_FIELDS
+        live, archived = Booking.objects.all(), ArchivedBooking.objects.all()
+        if timeslot_id is not None:
+            live, archived = live.filter(timeslot_id=timeslot_id), archived.filter(timeslot_id=timeslot_id)
+        # Archived bookings (finished timeslots) first, each table in index order
+        rows = itertools.chain.from_iterable(
+            qs.order_by("timeslot_id", "id").values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+            for qs in (archived, live)
+        )
+    else:
+        raise ValueError(f"Unknown export {kind!r}, expected one of {KINDS}.")
+    # booked_db is the seat count, exported as "booked"
+    header = [field.replace("__", "_").replace("booked_db", "booked") for field in fields]
+    return header, rows
+
+
+class _Echo:
+    # csv.writer wants a file, this one hands the line back instead of storing it
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_json(header, rows):
+    """A JSON array of objects, written row by row."""
+    yield "["
+    for n, row in enumerate(rows):
+        item = json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder)
+        yield item if n == 0 else "," + item
+    yield "]\n"
+
+
+def stream(kind: str, fmt: str, timeslot_id: int | None = None):
+    header, rows = export_rows(kind, timeslot_id)
+    if fmt == "csv":
+        return stream_csv(header, rows)
+    if fmt == "json":
+        return stream_json(header, rows)
+    raise ValueError(f"Unknown format {fmt!r}, expected one of {FORMATS}.")
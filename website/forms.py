@@ -1,9 +1,14 @@
 from datetime import datetime
 from django import forms
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Now
 from django.utils import timezone
 
-from .models import Timeslot
+from . import fragment_cache
+from .models import SeriesFrequency, Timeslot, TimeslotSeatShard, TimeslotSeries, TimeslotStatus
+from .recurrence import MAX_OCCURRENCES, local_datetime, occurrence_dates, overlapping
 
 
 BASE_INPUT_CLASSES = (
@@ -25,6 +30,18 @@ LABEL_CLASSES = "block text-sm font-medium text-slate-700"
 HELP_CLASSES = "mt-1 text-xs text-slate-500"
 ERROR_CLASSES = "mt-1 text-sm text-red-600"
 
+# Edits of a timeslot that belongs to a series
+SCOPE_THIS = "this"
+SCOPE_FOLLOWING = "following"
+SCOPE_CHOICES = [
+    (SCOPE_THIS, "Only this timeslot"),
+    (SCOPE_FOLLOWING, "This and all following timeslots of the series"),
+]
+
+WEEKDAY_CHOICES = [
+    ("0", "Mo"), ("1", "Di"), ("2", "Mi"), ("3", "Do"), ("4", "Fr"), ("5", "Sa"), ("6", "So"),
+]
+
 
 class TimeslotCreateForm(forms.ModelForm):
     date = forms.DateField(
@@ -50,12 +67,20 @@ class TimeslotCreateForm(forms.ModelForm):
             "event_description",
             "address",
             "capacity",
+            "seat_shards",
         ]
+        labels = {
+            "seat_shards": "Seat shards",
+        }
+        help_texts = {
+            "seat_shards": "Only for very large events: split the seats over this many counters (0 = off).",
+        }
         widgets = {
             "event_name": forms.TextInput(attrs={"class": BASE_INPUT_CLASSES}),
             "event_description": forms.Textarea(attrs={"rows": 4, "class": BASE_TEXTAREA_CLASSES}),
             "address": forms.TextInput(attrs={"class": BASE_INPUT_CLASSES}),
             "capacity": forms.NumberInput(attrs={"class": BASE_INPUT_CLASSES, "min": 1}),
+            "seat_shards": forms.NumberInput(attrs={"class": BASE_INPUT_CLASSES, "min": 0}),
         }
 
     def __init__(self, *args, **kwargs):
@@ -75,6 +100,17 @@ class TimeslotCreateForm(forms.ModelForm):
             self.initial.setdefault("start_time", start.time().replace(second=0, microsecond=0))
             self.initial.setdefault("end_time", end.time().replace(second=0, microsecond=0))
 
+        # Timeslots of a series can pass their changes on to the later ones
+        if self.instance.pk and self.instance.series_id:
+            self.fields["scope"] = forms.ChoiceField(
+                choices=SCOPE_CHOICES,
+                initial=SCOPE_THIS,
+                widget=forms.RadioSelect,
+                label="Apply to",
+            )
+            self._old_start = self.instance.start_at
+            self._old_end = self.instance.end_at
+
     def clean(self):
         cleaned = super().clean()
 
@@ -104,15 +140,197 @@ class TimeslotCreateForm(forms.ModelForm):
         if end_at < timezone.now():
             raise forms.ValidationError("Timeslot must be in the future.")
 
+        if cleaned.get("scope") == SCOPE_FOLLOWING:
+            self._clean_following(cleaned)
+
         return cleaned
 
+    def _following(self):
+        return Timeslot.objects.filter(
+            series_id=self.instance.series_id, start_at__gt=self._old_start
+        ).exclude(pk=self.instance.pk)
+
+    def _clean_following(self, cleaned):
+        shift_start = cleaned["start_at"] - self._old_start
+        shift_end = cleaned["end_at"] - self._old_end
+        following = self._following()
+
+        capacity = cleaned.get("capacity")
+        if capacity and following.with_free_spots().filter(booked_db__gt=capacity).exists():
+            raise forms.ValidationError(
+                "A following timeslot already has more bookings than the new capacity."
+            )
+        if following.filter(end_at__lte=F("start_at") + (shift_start - shift_end)).exists():
+            raise forms.ValidationError("The new times would end a following timeslot before it starts.")
+
     def save(self, commit=True):
         instance = super().save(commit=False)
         instance.start_at = self.cleaned_data["start_at"]
         instance.end_at = self.cleaned_data["end_at"]
         if commit:
-            instance.save()
+            with transaction.atomic():
+                instance.save()
+                if {"capacity", "seat_shards"} & set(self.changed_data):
+                    instance.rebalance_seat_shards()
+                if self.cleaned_data.get("scope") == SCOPE_FOLLOWING:
+                    self._save_following(instance)
         return instance
+
+    def _save_following(self, instance):
+        # One UPDATE for the whole rest of the series, times move by the same offset
+        following = self._following()
+        sharded_before = list(following.filter(seat_shards__gt=0).values_list("pk", flat=True))
+        following.update(
+            event_name=instance.event_name,
+            event_description=instance.event_description,
+            address=instance.address,
+            capacity=instance.capacity,
+            seat_shards=instance.seat_shards,
+            start_at=F("start_at") + (instance.start_at - self._old_start),
+            end_at=F("end_at") + (instance.end_at - self._old_end),
+            updated_at=Now(),
+        )
+        fragment_cache.timeslots_changed()
+
+        # Only sharded timeslots have rows beyond the timeslot itself to adjust
+        if {"capacity", "seat_shards"} & set(self.changed_data):
+            for ts in following.filter(Q(pk__in=sharded_before) | Q(seat_shards__gt=0)):
+                ts.rebalance_seat_shards()
+
+
+class TimeslotSeriesForm(TimeslotCreateForm):
+    """
+    A TimeslotCreateForm whose date is the first of a recurring series.
+
+    After validation `occurrences` holds the (start_at, end_at) of every
+    timeslot, save() writes all of them with one bulk_create.
+    """
+
+    frequency = forms.ChoiceField(
+        choices=SeriesFrequency.choices,
+        initial=SeriesFrequency.WEEKLY,
+        widget=forms.Select(attrs={"class": BASE_SELECT_CLASSES}),
+        label="Repeat",
+    )
+    weekdays = forms.MultipleChoiceField(
+        choices=WEEKDAY_CHOICES,
+        required=False,
+        widget=forms.CheckboxSelectMultiple,
+        label="Days",
+        help_text="Only for custom days.",
+    )
+    until = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={"type": "date", "class": BASE_INPUT_CLASSES}),
+        label="Until",
+    )
+    count = forms.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=MAX_OCCURRENCES,
+        widget=forms.NumberInput(attrs={"class": BASE_INPUT_CLASSES, "min": 1, "max": MAX_OCCURRENCES}),
+        label="Number of timeslots",
+    )
+    skip_dates = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={"rows": 2, "class": BASE_TEXTAREA_CLASSES, "placeholder": "2026-12-24, 2026-12-31"}),
+        label="Skip dates",
+        help_text="Holidays etc., as YYYY-MM-DD separated by commas or new lines.",
+    )
+
+    occurrences = ()
+    conflicts = ()
+
+    def clean_skip_dates(self):
+        field = forms.DateField()
+        raw = self.cleaned_data["skip_dates"].replace(",", " ").split()
+        return sorted({field.clean(value) for value in raw})
+
+    def clean(self):
+        cleaned = super().clean()
+        if self.errors:
+            return cleaned
+
+        first = cleaned["date"]
+        until, count = cleaned.get("until"), cleaned.get("count")
+        if not until and not count:
+            raise forms.ValidationError("Set an end date or a number of timeslots.")
+        if until and until < first:
+            raise forms.ValidationError("The series must end after its first date.")
+        if cleaned["frequency"] == SeriesFrequency.CUSTOM and not cleaned["weekdays"]:
+            raise forms.ValidationError("Pick at least one day.")
+
+        dates = occurrence_dates(
+            first, cleaned["frequency"], cleaned["weekdays"], until, count, cleaned["skip_dates"],
+        )
+        if not dates:
+            raise forms.ValidationError("This series has no timeslots.")
+        if len(dates) > MAX_OCCURRENCES:
+            raise forms.ValidationError(
+                f"A series can have at most {MAX_OCCURRENCES} timeslots, choose an earlier end date."
+            )
+        if count and not until and len(dates) != count:
+            raise forms.ValidationError(f"This series has {len(dates)} instead of {count} timeslots.")
+        self.occurrences = [
+            (local_datetime(day, cleaned["start_time"]), local_datetime(day, cleaned["end_time"]))
+            for day in dates
+        ]
+
+        # Same place, same time: one query for the whole range of the series
+        existing = (
+            Timeslot.objects.filter(
+                address=cleaned["address"],
+                start_at__lt=self.occurrences[-1][1],
+                end_at__gt=self.occurrences[0][0],
+            )
+            .exclude(status=TimeslotStatus.CANCELLED)
+            .values_list("start_at", "end_at")
+        )
+        self.conflicts = overlapping(self.occurrences, existing)
+        if self.conflicts:
+            days = ", ".join(f"{timezone.localtime(start):%d.%m.%Y}" for start, _ in self.conflicts[:5])
+            more = f" (+{len(self.conflicts) - 5} more)" if len(self.conflicts) > 5 else ""
+            raise forms.ValidationError(f"Overlaps existing timeslots at this address on {days}{more}.")
+        return cleaned
+
+    def preview_rows(self):
+        conflicts = set(self.conflicts)
+        return [(start, end, (start, end) in conflicts) for start, end in self.occurrences]
+
+    def save(self, commit=True):
+        template = super().save(commit=False)
+        series = TimeslotSeries(
+            frequency=self.cleaned_data["frequency"],
+            weekdays=",".join(self.cleaned_data["weekdays"]),
+            until=self.cleaned_data["until"],
+            count=self.cleaned_data["count"],
+            skip_dates=[day.isoformat() for day in self.cleaned_data["skip_dates"]],
+        )
+        fields = self._meta.fields
+        timeslots = [
+            Timeslot(
+                **{name: getattr(template, name) for name in fields},
+                start_at=start_at,
+                end_at=end_at,
+                series=series,
+            )
+            for start_at, end_at in self.occurrences
+        ]
+        if not commit:
+            return timeslots
+
+        with transaction.atomic():
+            series.save()
+            Timeslot.objects.bulk_create(timeslots)
+            if template.seat_shards:
+                TimeslotSeatShard.objects.bulk_create(
+                    TimeslotSeatShard(timeslot=ts, index=index, capacity=capacity)
+                    for ts in timeslots
+                    for index, (capacity, _) in enumerate(ts.shard_sizes())
+                )
+            # bulk_create skips Timeslot.save()
+            fragment_cache.timeslots_changed()
+        return timeslots
     
 
 class BookingCreateForm(forms.Form):
@@ -127,3 +345,21 @@ class BookingCreateForm(forms.Form):
         ),
         label="Message",
     )
+
+
+class DataImportForm(forms.Form):
+    kind = forms.ChoiceField(
+        choices=[("timeslots", "Timeslots"), ("bookings", "Bookings")],
+        widget=forms.Select(attrs={"class": BASE_SELECT_CLASSES}),
+        label="Import",
+    )
+    file = forms.FileField(
+        label="File",
+        help_text="CSV with a header row, or a JSON array of objects (same columns as the export).",
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data["file"]
+        if not file.name.lower().endswith((".csv", ".json")):
+            raise forms.ValidationError("Only .csv and .json files can be imported.")
+        return file
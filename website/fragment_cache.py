@@ -0,0 +1,116 @@
+"""
+Versioned fragment cache for the booking list.
+
+Every timeslot card is cached per viewer role under a key that carries the
+timeslot's version (updated_at plus the seats taken), so a write only
+invalidates the cards it touched. The anonymous list pages are cached whole
+under a list version that every timeslot/booking write bumps.
+
+Works with any cache backend. The local-memory backend is per process, so use
+a shared backend (Redis, Memcached, ...) when running several workers.
+"""
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .pagination import EPOCH
+
+CARD_TEMPLATE = "partials/_timeslot_card.html"
+CARD_TIMEOUT = 60 * 60
+# Short, because timeslots also leave the list when they end
+LIST_TIMEOUT = 30
+LIST_VERSION_KEY = "timeslots:list-version"
+STATS_KEY = "timeslots:cache-stats:{}"
+STATS = ("card_hits", "card_misses", "list_hits", "list_misses")
+
+# Cards are shared between users, their forms get the real token on the way out
+CSRF_PLACEHOLDER = "__CSRF_TOKEN__"
+
+
+def viewer_role(user) -> str:
+    if not user.is_authenticated:
+        return "anonymous"
+    return "staff" if user.is_staff else "user"
+
+
+def card_key(ts, role: str) -> str:
+    updated = (ts.updated_at - EPOCH) // timedelta(microseconds=1)
+    key = f"timeslot-card:{ts.pk}:{updated}:{ts.booked_db}:{role}"
+    if role == "user":
+        # The user's own booking decides between Buchen and Stornieren
+        key += f":{ts.my_booking_id}:{ts.my_booking_status}"
+    return key
+
+
+def render_cards(request, timeslots) -> list[str]:
+    """Rendered timeslot cards (annotated with with_free_spots/with_user_booking)."""
+    role = viewer_role(request.user)
+    keys = [card_key(ts, role) for ts in timeslots]
+    cached = cache.get_many(keys)
+
+    rendered = {}
+    for key, ts in zip(keys, timeslots):
+        if key not in cached:
+            rendered[key] = render_to_string(
+                CARD_TEMPLATE,
+                {"ts": ts, "user": request.user, "csrf_token": CSRF_PLACEHOLDER},
+            )
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+    _count("card_hits", len(cached))
+    _count("card_misses", len(rendered))
+
+    cards = [cached.get(key) or rendered[key] for key in keys]
+    if any(CSRF_PLACEHOLDER in card for card in cards):
+        token = get_token(request)
+        cards = [card.replace(CSRF_PLACEHOLDER, token) for card in cards]
+    return [mark_safe(card) for card in cards]
+
+
+def list_key(cursor: str | None) -> str:
+    # A fresh timestamp if the version got evicted, never an old version number
+    version = cache.get_or_set(LIST_VERSION_KEY, time.time_ns, None)
+    return f"timeslot-list:{version}:{cursor or 'first'}"
+
+
+def get_list(cursor: str | None) -> str | None:
+    html = cache.get(list_key(cursor))
+    _count("list_hits" if html is not None else "list_misses")
+    return mark_safe(html) if html is not None else None
+
+
+def set_list(cursor: str | None, html: str) -> None:
+    cache.set(list_key(cursor), html, LIST_TIMEOUT)
+
+
+def timeslots_changed() -> None:
+    """Drop the cached anonymous list pages once the current transaction commits."""
+    transaction.on_commit(_bump_list_version)
+
+
+def _bump_list_version() -> None:
+    try:
+        cache.incr(LIST_VERSION_KEY)
+    except ValueError:
+        cache.set(LIST_VERSION_KEY, time.time_ns(), None)
+
+
+def stats() -> dict[str, int]:
+    values = cache.get_many([STATS_KEY.format(name) for name in STATS])
+    return {name: values.get(STATS_KEY.format(name), 0) for name in STATS}
+
+
+def _count(name: str, n: int = 1) -> None:
+    if not n:
+        return
+    key = STATS_KEY.format(name)
+    try:
+        cache.incr(key, n)
+    except ValueError:
+        if not cache.add(key, n, None):
+            cache.incr(key, n)
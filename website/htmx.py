@@ -0,0 +1,48 @@
+"""
+Partial pages for boosted HTMX navigation.
+
+base.html sets hx-boost on <body>, so links and forms inside the site load
+their page with HTMX instead of a full page load. For those requests the
+base_template context processor makes every page extend partial.html
+instead of base.html (`{% extends base_template|default:"base.html" %}`):
+only the title, the header (swapped out of band), the messages and the
+page's hero/content/scripts blocks are rendered, and HtmxMiddleware tells
+HTMX to swap them into <main>. History restores (back button with an
+evicted HTMX cache) still get the full page.
+
+Links that don't lead to a page (downloads) need hx-boost="false".
+"""
+from django.utils.cache import patch_vary_headers
+
+PARTIAL_HEADERS = ("HX-Boosted", "HX-History-Restore-Request")
+# Sent by every HTMX request; actions (not navigation) may get a fragment of the same URL
+VARY_HEADERS = ("HX-Request", *PARTIAL_HEADERS)
+
+
+def partial_navigation(request) -> bool:
+    return (
+        request.headers.get("HX-Boosted") == "true"
+        and request.headers.get("HX-History-Restore-Request") != "true"
+    )
+
+
+def base_template(request):
+    return {"base_template": "partial.html" if partial_navigation(request) else "base.html"}
+
+
+class HtmxMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or not response.get("Content-Type", "").startswith("text/html"):
+            return response
+
+        patch_vary_headers(response, VARY_HEADERS)
+        if partial_navigation(request) and response.status_code == 200:
+            response["HX-Retarget"] = "#main"
+            response["HX-Reswap"] = "innerHTML show:window:top"
+            # The URL after redirects (login -> next page, form -> list)
+            response["HX-Push-Url"] = request.get_full_path()
+        return response
@@ -0,0 +1,95 @@
+"""
+Responsive image variants.
+
+`manage.py build_images` crops and resizes the source images in
+static/src/img/<group>/ to WIDTHS, saves each width as AVIF, WebP and JPEG
+under static/img/<group>/ and lists them in static/img/manifest.json.
+slides() turns a group of that manifest into the <picture> sources of a
+template (the hero gallery); the pages need no Pillow, only the manifest.
+Until variants are built, placeholder_slides() gives the same shape for the
+remote placeholder photos, which picsum.photos crops and scales to WIDTHS.
+"""
+import json
+import os
+
+from django.conf import settings
+from django.templatetags.static import static
+
+SOURCE_DIR = os.path.join(settings.BASE_DIR, "website", "static", "src", "img")
+OUTPUT_DIR = os.path.join(settings.BASE_DIR, "website", "static", "img")
+MANIFEST = os.path.join(OUTPUT_DIR, "manifest.json")
+
+WIDTHS = (480, 800, 1120, 1600)
+
+# Extension -> (Pillow format, MIME type, quality), best compression first;
+# the last one is the <img> fallback every browser can show
+FORMATS = {
+    "avif": ("AVIF", "image/avif", 50),
+    "webp": ("WEBP", "image/webp", 75),
+    "jpg": ("JPEG", "image/jpeg", 80),
+}
+
+# picsum.photos ids of the hero gallery's placeholders, cropped like build_images does
+PLACEHOLDERS = (1018, 1015, 1016)
+PLACEHOLDER_ASPECT = 2.5
+
+_cache = {}
+
+
+def load_manifest(path: str = None) -> dict:
+    # Re-read when build_images rewrote it
+    path = path or MANIFEST
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    if _cache.get(path, (None,))[0] != mtime:
+        with open(path, encoding="utf-8") as f:
+            _cache[path] = (mtime, json.load(f))
+    return _cache[path][1]
+
+
+def slides(group: str) -> list[dict]:
+    """The images of `group` as {"sources", "src", "srcset", "width", "height"} for <picture>."""
+    result = []
+    for image in load_manifest().get(group, []):
+        srcsets = {
+            ext: ", ".join(f"{static(path)} {width}w" for path, width in image["variants"][ext])
+            for ext in FORMATS
+            if image["variants"].get(ext)
+        }
+        fallback = list(srcsets)[-1]
+        result.append({
+            "sources": [
+                {"type": FORMATS[ext][1], "srcset": srcset}
+                for ext, srcset in srcsets.items()
+                if ext != fallback
+            ],
+            "srcset": srcsets[fallback],
+            # The middle width for browsers without srcset
+            "src": static(image["variants"][fallback][len(image["variants"][fallback]) // 2][0]),
+            "width": image["width"],
+            "height": image["height"],
+        })
+    return result
+
+
+def placeholder_slides() -> list[dict]:
+    """The PLACEHOLDERS in the shape of slides(), WebP with a JPEG fallback."""
+    def srcset(image_id, extension):
+        return ", ".join(
+            f"https://picsum.photos/id/{image_id}/{width}/{round(width / PLACEHOLDER_ASPECT)}{extension} {width}w"
+            for width in WIDTHS
+        )
+
+    middle = WIDTHS[len(WIDTHS) // 2]
+    return [
+        {
+            "sources": [{"type": FORMATS["webp"][1], "srcset": srcset(image_id, ".webp")}],
+            "srcset": srcset(image_id, ".jpg"),
+            "src": f"https://picsum.photos/id/{image_id}/{middle}/{round(middle / PLACEHOLDER_ASPECT)}.jpg",
+            "width": WIDTHS[-1],
+            "height": round(WIDTHS[-1] / PLACEHOLDER_ASPECT),
+        }
+        for image_id in PLACEHOLDERS
+    ]
@@ -0,0 +1,311 @@
+"""
+Bulk import of timeslots and bookings from CSV/JSON.
+
+Both formats are read as a stream, row by row (JSON item by item). Every row is validated in Python first (field types and lengths, choices and
+the Timeslot check constraints), invalid rows end up in the report with their
+line number and never reach the database. Valid rows are written in batches,
+one transaction per batch: bulk_create, or COPY for timeslots on PostgreSQL.
+"""
+import csv
+import functools
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import fragment_cache
+from .models import Booking, BookingStatus, Timeslot, TimeslotStatus
+
+BATCH_SIZE = 5000
+
+# JSON files are decoded item by item from chunks of this many characters
+JSON_CHUNK_SIZE = 64 * 1024
+
+# Required columns; event_description, message and status (open/confirmed) are optional
+TIMESLOT_COLUMNS = ("event_name", "start_at", "end_at", "address", "capacity")
+BOOKING_COLUMNS = ("timeslot_id", "username")
+
+
+class ImportReport:
+    """Outcome of an import: rows created and the rejected rows with the reason."""
+
+    # Only the first errors are kept, all of them are counted
+    MAX_ERRORS = 1000
+
+    def __init__(self):
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def __str__(self) -> str:
+        return f"{self.created} created, {self.error_count} rejected"
+
+
+def read_rows(file, fmt: str):
+    """(line number, row dict) of a text file, streamed; JSON must be an array of objects."""
+    if fmt == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "json":
+        for n, row in enumerate(_json_items(file), start=1):
+            yield n, row if isinstance(row, dict) else {}
+    else:
+        raise ValueError(f"Unknown format {fmt!r}.")
+
+
+def _json_items(file):
+    """The items of the JSON array in `file`, decoded one at a time, so memory stays flat."""
+    decoder = json.JSONDecoder()
+    buffer, pos = "", 0
+
+    def read_more() -> bool:
+        nonlocal buffer, pos
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer, pos = buffer[pos:] + chunk, 0
+        return bool(chunk)
+
+    def next_char() -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read_more():
+                raise ValueError("The JSON array ends early.")
+
+    if next_char() != "[":
+        raise ValueError("Expected a JSON array of objects.")
+    pos += 1
+    if next_char() == "]":
+        return
+    while True:
+        next_char()
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The item goes on in the next chunk
+            if not read_more():
+                raise
+            continue
+        if end == len(buffer) and read_more():
+            # A number or literal at the end of the buffer may be cut off
+            continue
+        pos = end
+        yield item
+
+        separator = next_char()
+        pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' between the JSON array items, not {separator!r}.")
+
+
+def import_timeslots(rows, batch_size: int = BATCH_SIZE, use_copy: bool | None = None) -> ImportReport:
+    """Validate and insert timeslots, `rows` as returned by read_rows()."""
+    if use_copy is None:
+        use_copy = connection.vendor == "postgresql"
+    write = _copy_timeslots if use_copy else Timeslot.objects.bulk_create
+
+    report = ImportReport()
+    # Looked up once, naive dates in the file are local time
+    tz = timezone.get_current_timezone()
+    build = functools.partial(_timeslot_from_row, tz=tz)
+    for batch in _batches(_valid(rows, build, report), batch_size):
+        with transaction.atomic():
+            write([ts for _, ts in batch])
+            fragment_cache.timeslots_changed()
+        report.created += len(batch)
+    return report
+
+
+def import_bookings(rows, batch_size: int = BATCH_SIZE) -> ImportReport:
+    """Validate and insert bookings; seat limits and double bookings are checked per batch."""
+    report = ImportReport()
+    for batch in _batches(_valid(rows, _booking_from_row, report), batch_size):
+        with transaction.atomic():
+            bookings = _bookable(batch, report)
+            Booking.objects.bulk_create(bookings)
+            Timeslot.objects.filter(pk__in={b.timeslot_id for b in bookings}).recount_seats()
+        report.created += len(bookings)
+    return report
+
+
+def _valid(rows, build, report):
+    for line, row in rows:
+        try:
+            yield line, build(row)
+        except ValidationError as e:
+            report.add_error(line, "; ".join(e.messages))
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _require(row, columns):
+    missing = [name for name in columns if row.get(name) in (None, "")]
+    if missing:
+        raise ValidationError(f"Missing {', '.join(missing)}.")
+
+
+def _datetime(value, name, tz):
+    parsed = parse_datetime(str(value or "").strip())
+    if parsed is None:
+        raise ValidationError(f"{name}: not a date/time ({value!r}).")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, tz)
+    return parsed
+
+
+def _timeslot_from_row(row, tz) -> Timeslot:
+    _require(row, TIMESLOT_COLUMNS)
+
+    ts = Timeslot(
+        event_name=row["event_name"],
+        event_description=row.get("event_description") or "",
+        start_at=_datetime(row["start_at"], "start_at", tz),
+        end_at=_datetime(row["end_at"], "end_at", tz),
+        address=row["address"],
+        capacity=row["capacity"],
+        status=row.get("status") or TimeslotStatus.OPEN,
+    )
+    # Types, lengths and choices; raises ValidationError with all field errors
+    ts.clean_fields(exclude=["created_at", "updated_at", "series"])
+
+    # Same rules as the timeslot_* check constraints, without a query per row
+    if ts.end_at <= ts.start_at:
+        raise ValidationError("end_at must be after start_at.")
+    if ts.capacity < 1:
+        raise ValidationError("capacity must be at least 1.")
+    return ts
+
+
+def _booking_from_row(row) -> Booking:
+    _require(row, BOOKING_COLUMNS)
+    try:
+        timeslot_id = int(row["timeslot_id"])
+    except (TypeError, ValueError):
+        raise ValidationError(f"timeslot_id: not a number ({row['timeslot_id']!r}).")
+
+    booking = Booking(
+        timeslot_id=timeslot_id,
+        status=row.get("status") or BookingStatus.CONFIRMED,
+        message=row.get("message") or "",
+    )
+    booking.clean_fields(exclude=["timeslot", "user", "booked_at", "cancelled_at"])
+    if booking.status == BookingStatus.CANCELLED:
+        booking.cancelled_at = timezone.now()
+    # Resolved to a user per batch, see _bookable()
+    booking.username = row["username"]
+    return booking
+
+
+def _bookable(batch, report) -> list[Booking]:
+    """The bookings of a batch that fit, with a handful of queries for the whole batch."""
+    timeslot_ids = {b.timeslot_id for _, b in batch}
+    users = dict(
+        get_user_model().objects.filter(username__in={b.username for _, b in batch})
+        .values_list("username", "pk")
+    )
+    # Locked, so live bookings can't take the seats counted here
+    seats, starts, closed = {}, {}, {}
+    now = timezone.now()
+    for pk, capacity, booked, start_at, end_at, status in (
+        Timeslot.objects.select_for_update()
+        .filter(pk__in=timeslot_ids)
+        .with_free_spots()
+        .values_list("pk", "capacity", "booked_db", "start_at", "end_at", "status")
+    ):
+        seats[pk], starts[pk] = capacity - booked, start_at
+        # Same rules as book_timeslot()
+        if status != TimeslotStatus.OPEN:
+            closed[pk] = f"Timeslot {pk} is not open for booking."
+        elif end_at < now:
+            closed[pk] = f"Timeslot {pk} is in the past."
+    confirmed = set(
+        Booking.objects.filter(
+            timeslot_id__in=timeslot_ids, user_id__in=users.values(), status=BookingStatus.CONFIRMED
+        ).values_list("timeslot_id", "user_id")
+    )
+
+    bookings = []
+    for line, booking in batch:
+        booking.user_id = users.get(booking.username)
+        if booking.user_id is None:
+            report.add_error(line, f"Unknown user {booking.username!r}.")
+            continue
+        if booking.timeslot_id not in seats:
+            report.add_error(line, f"Unknown timeslot {booking.timeslot_id}.")
+            continue
+        if booking.status == BookingStatus.CONFIRMED:
+            if booking.timeslot_id in closed:
+                report.add_error(line, closed[booking.timeslot_id])
+                continue
+            key = (booking.timeslot_id, booking.user_id)
+            if key in confirmed:
+                report.add_error(line, f"{booking.username} already booked timeslot {booking.timeslot_id}.")
+                continue
+            if seats[booking.timeslot_id] <= 0:
+                report.add_error(line, f"Timeslot {booking.timeslot_id} is fully booked.")
+                continue
+            confirmed.add(key)
+            seats[booking.timeslot_id] -= 1
+        # bulk_create skips Booking.save()
+        booking.timeslot_start_at = starts[booking.timeslot_id]
+        bookings.append(booking)
+    return bookings
+
+
+def _copy_timeslots(batch: list[Timeslot]) -> None:
+    """COPY a batch into the timeslot table (PostgreSQL only, skips the ORM entirely)."""
+    now = timezone.now().isoformat()
+    copy_rows(
+        Timeslot._meta.db_table,
+        ["event_name", "event_description", "start_at", "end_at", "address", "capacity",
+         "confirmed_count", "seat_shards", "status", "created_at", "updated_at"],
+        (
+            [ts.event_name, ts.event_description, ts.start_at.isoformat(), ts.end_at.isoformat(),
+             ts.address, ts.capacity, 0, 0, ts.status, now, now]
+            for ts in batch
+        ),
+    )
+
+
+def copy_rows(table: str, columns: list[str], rows) -> None:
+    """COPY rows (lists of values, None for NULL) into a table, PostgreSQL only."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # With NULL '\N' an empty field stays an empty string (the csv default
+    # would turn it into NULL)
+    writer.writerows([r"\N" if value is None else value for value in row] for row in rows)
+    buffer.seek(0)
+
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, "copy_expert"):
+            # psycopg2
+            raw.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
@@ -0,0 +1,116 @@
+"""
+Per-request cost: number of queries, DB time, template render time and
+total view time.
+
+RequestMetricsMiddleware collects them for every request and sends them back
+as a Server-Timing header (shown in the browser's network tab) and as one
+JSON log line on the "website.requests" logger, tagged with the URL name.
+Latency and query totals per URL name also go to the /metrics counters.
+Template time is measured by TimedDjangoTemplates, which has to be the
+template BACKEND for that. Streaming responses are only measured until the
+response starts, rows written afterwards are not counted.
+"""
+import json
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics as prometheus
+
+logger = logging.getLogger("website.requests")
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.view_ms = 0.0
+        self._rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_ms += (time.perf_counter() - started) * 1000
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.db_ms:.1f};desc="{self.queries} queries", '
+            f"tpl;dur={self.template_ms:.1f}, "
+            f"view;dur={self.view_ms:.1f}"
+        )
+
+
+class RequestMetricsMiddleware:
+    """Put it first in MIDDLEWARE, so view time covers the other middleware too."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            metrics.view_ms = (time.perf_counter() - started) * 1000
+            _current.reset(token)
+
+        response["Server-Timing"] = metrics.server_timing()
+        match = request.resolver_match
+        url_name = match.view_name if match else None
+        view = url_name or "unmatched"
+        prometheus.request_latency.observe(metrics.view_ms / 1000, view=view)
+        prometheus.db_queries.inc(metrics.queries, view=view)
+        prometheus.db_time.inc(metrics.db_ms / 1000, view=view)
+        logger.info(json.dumps({
+            "url_name": url_name,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": metrics.queries,
+            "db_ms": round(metrics.db_ms, 1),
+            "template_ms": round(metrics.template_ms, 1),
+            "view_ms": round(metrics.view_ms, 1),
+        }))
+        return response
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        # Templates rendered inside another render are already part of its time
+        if metrics is None or metrics._rendering:
+            return super().render(context, request)
+
+        metrics._rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_ms += (time.perf_counter() - started) * 1000
+            metrics._rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time added to the request metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
@@ -0,0 +1,207 @@
+"""
+Live seat availability for the booking page (Server-Sent Events).
+
+The booking, cancel and timeslot-cancel paths call seats_changed(). After the
+commit it reads the timeslot's seats and status and publishes them:
+ - on PostgreSQL with NOTIFY on CHANNEL, so every worker process hears it;
+   each process with open streams runs one listener thread (LISTEN, as
+   LISTENER_NAME) that hands the notifications to its in-process BROKER,
+ - elsewhere (SQLite, tests) straight to the in-process BROKER.
+Nothing is read or sent while no stream is open: on PostgreSQL the read and
+the NOTIFY are one statement that only runs while a listener is connected.
+The BROKER renders the seat badge once and fans it out to the open
+/booking/events/ streams (one asyncio queue each), static/js/live_seats.js
+swaps it into the card.
+
+The stream is an async view and needs an ASGI server (config/asgi.py), see
+the README; under WSGI it answers 204, which tells browsers to stop retrying.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.template.loader import render_to_string
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "timeslot_seats"
+
+# application_name of the LISTEN connections, publish() looks for it
+LISTENER_NAME = "seat-listener"
+
+# Queued events per stream; a client that falls further behind misses updates
+QUEUE_SIZE = 100
+
+
+class SeatEvent:
+    def __init__(self, timeslot_id, status, html):
+        self.timeslot_id = timeslot_id
+        self.status = status
+        self.html = html
+
+    def sse(self) -> str:
+        data = "".join(f"data: {line}\n" for line in self.html.strip().splitlines())
+        return f"event: seats-{self.timeslot_id}\n{data}\n"
+
+
+class Broker:
+    """In-process pub/sub: publish() from any thread, subscribers are asyncio queues."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> asyncio.Queue:
+        # Called from the stream's event loop
+        queue = asyncio.Queue(QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        _ensure_listener()
+        return queue
+
+    def unsubscribe(self, queue) -> None:
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def has_subscribers(self) -> bool:
+        with self._lock:
+            return bool(self._subscribers)
+
+    def publish(self, seats: dict) -> None:
+        """Send {"id", "status", "booked", "capacity"} of a timeslot to all streams."""
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        if not subscribers:
+            return
+        event = SeatEvent(
+            seats["id"],
+            seats["status"],
+            # The Timeslot attributes the badge reads
+            render_to_string("partials/_seat_badge.html", {"ts": {
+                "pk": seats["id"],
+                "status": seats["status"],
+                "booked_db": seats["booked"],
+                "capacity": seats["capacity"],
+            }}),
+        )
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # The stream's loop is gone
+                self.unsubscribe(queue)
+
+
+def _offer(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+BROKER = Broker()
+
+
+def seats_changed(timeslot_id: int) -> None:
+    """Publish a timeslot's seats and status once the current transaction commits."""
+    transaction.on_commit(lambda: publish(timeslot_id))
+
+
+def publish(timeslot_id: int) -> None:
+    from .models import Timeslot
+
+    # Read from the primary, a replica may not have the commit yet
+    seats = (
+        Timeslot.objects.using(DEFAULT_DB_ALIAS).with_free_spots()
+        .filter(pk=timeslot_id)
+        .values("id", "status", "booked_db", "capacity")
+    )
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor == "postgresql":
+        # The listeners are in other processes: read and notify in one statement,
+        # which skips both (one-time filter) unless one of them is connected
+        sql, params = seats.query.get_compiler(DEFAULT_DB_ALIAS).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_notify(%s, json_build_object("
+                "'id', id, 'status', status, 'booked', booked_db, 'capacity', capacity)::text)"
+                f" FROM ({sql}) seats"
+                " WHERE EXISTS (SELECT 1 FROM pg_stat_activity"
+                " WHERE datname = current_database() AND application_name = %s)",
+                [CHANNEL, *params, LISTENER_NAME],
+            )
+        return
+
+    if not BROKER.has_subscribers():
+        return
+    seats = seats.first()
+    if seats is None:
+        return
+    seats["booked"] = seats.pop("booked_db")
+    BROKER.publish(seats)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _ensure_listener():
+    # One LISTEN connection per process, started with the first stream
+    global _listener
+    if connections[DEFAULT_DB_ALIAS].vendor != "postgresql":
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, name=LISTENER_NAME, daemon=True)
+            _listener.start()
+
+
+def _idle() -> bool:
+    """Whether the listener should stop (and disconnect), its last stream is gone."""
+    global _listener
+    # Under the lock, so a stream that subscribes meanwhile starts a new listener
+    with _listener_lock:
+        if BROKER.has_subscribers():
+            return False
+        _listener = None
+        return True
+
+
+def _listen():
+    while True:
+        connection = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            connection.ensure_connection()
+            connection.set_autocommit(True)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('application_name', %s, false)", [LISTENER_NAME])
+                cursor.execute(f"LISTEN {CHANNEL}")
+            raw = connection.connection
+            while True:
+                for payload in _notifications(raw):
+                    BROKER.publish(json.loads(payload))
+                if _idle():
+                    return
+        except Exception:
+            logger.exception("Seat listener failed, reconnecting")
+            time.sleep(5)
+        finally:
+            connection.close()
+        if _idle():
+            return
+
+
+def _notifications(raw, timeout=5.0):
+    """Payloads received within `timeout` seconds (psycopg2 or psycopg 3)."""
+    if hasattr(raw, "poll"):
+        # psycopg2
+        if select.select([raw], [], [], timeout)[0]:
+            raw.poll()
+        payloads = [notify.payload for notify in raw.notifies]
+        raw.notifies.clear()
+        return payloads
+    return [notify.payload for notify in raw.notifies(timeout=timeout)]
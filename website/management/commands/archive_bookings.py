@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from website import archive
+from website.models import Booking
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the bookings of timeslots that ended more than --days days ago to the archive "
+        "table, in batches of --batch-size rows, one transaction per batch. My bookings, "
+        "the exports and the seat counts read the archive too."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Only timeslots that ended at least this many days ago.")
+        parser.add_argument("--batch-size", type=int, default=archive.BATCH_SIZE)
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="Stop after this many batches (to spread a big backlog over several runs).",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count the bookings that would be moved.")
+
+    def handle(self, *args, **options):
+        if options["days"] < 0 or options["batch_size"] < 1:
+            raise CommandError("--days must be 0 or more, --batch-size at least 1.")
+        before = timezone.now() - timezone.timedelta(days=options["days"])
+
+        if options["dry_run"]:
+            count = Booking.objects.filter(timeslot__end_at__lt=before).count()
+            self.stdout.write(self.style.WARNING(f"{count} booking(s) to archive (dry run)."))
+            return
+
+        started = time.perf_counter()
+        moved = batches = 0
+        while options["max_batches"] is None or batches < options["max_batches"]:
+            n = archive.archive_batch(before, options["batch_size"])
+            if not n:
+                break
+            moved += n
+            batches += 1
+            self.stdout.write(f"{moved} bookings archived ({time.perf_counter() - started:.1f}s)")
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} booking(s) in {batches} batch(es)."))
@@ -0,0 +1,389 @@
+import json
+import math
+import multiprocessing
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Count, F, Q
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from website.models import Booking, BookingStatus, Timeslot, TimeslotStatus
+
+# SQLSTATEs worth retrying (PostgreSQL), everything else is a real error
+RETRYABLE = {"40P01": "deadlock", "40001": "serialization"}
+MAX_RETRIES = 5
+
+
+class Command(BaseCommand):
+    help = (
+        "Stress the booking views with concurrent clients (booking, cancelling, staff "
+        "cancelling whole timeslots) and report throughput, latency percentiles, lock "
+        "waits and retries as JSON. Fails if a timeslot ends up over capacity. Creates "
+        "its own users/timeslots and deletes them afterwards; meant for a local PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=500, help="Concurrent clients.")
+        parser.add_argument("--ops", type=int, default=10, help="Requests per client.")
+        parser.add_argument("--timeslots", type=int, default=1, help="Timeslots the clients fight over.")
+        parser.add_argument("--capacity", type=int, default=100, help="Seats per timeslot.")
+        parser.add_argument("--shards", type=int, default=0, help="Seat shards per timeslot (0 = single counter).")
+        parser.add_argument("--cancel-ratio", type=float, default=0.2, help="Share of requests that cancel the client's booking.")
+        parser.add_argument("--staff-cancels", type=int, default=0, help="Timeslots a staff client cancels during the run.")
+        parser.add_argument("--pool", choices=("thread", "process"), default="thread")
+        parser.add_argument("--processes", type=int, default=4, help="Worker processes for --pool process.")
+        parser.add_argument(
+            "--max-connections",
+            type=int,
+            default=80,
+            help="Database connections open at once over all workers, like an app server's pool "
+            "(PostgreSQL allows 100 by default). Latencies include waiting for one.",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--json", dest="json_path", help="Write the results to this file.")
+        parser.add_argument("--compare", help="Earlier results (JSON) to compare against.")
+
+    def handle(self, *args, **options):
+        if options["clients"] < 1 or options["ops"] < 1 or options["timeslots"] < 1:
+            raise CommandError("--clients, --ops and --timeslots must be at least 1.")
+        if options["max_connections"] < 4:
+            raise CommandError("--max-connections must be at least 4.")
+        if options["staff_cancels"] > options["timeslots"]:
+            raise CommandError("--staff-cancels can't exceed --timeslots.")
+        if connection.vendor != "postgresql":
+            self.stderr.write(self.style.WARNING(
+                f"Lock behaviour differs on {connection.vendor}, run this against PostgreSQL."
+            ))
+
+        prefix = f"bench-booking-{int(time.time())}"
+        timeslot_ids, client_ids, staff_id = self.setup(prefix, options)
+        try:
+            results = self.run(timeslot_ids, client_ids, staff_id, options)
+            results["invariants"] = check_invariants(timeslot_ids)
+        finally:
+            Timeslot.objects.filter(pk__in=timeslot_ids).delete()
+            get_user_model().objects.filter(username__startswith=prefix).delete()
+
+        self.report(results, options)
+        broken = results["invariants"]
+        if broken["over_capacity"] or broken["counter_drift"] or broken["booked_after_cancel"]:
+            raise CommandError(f"Invariants violated: {json.dumps(broken)}")
+
+    def setup(self, prefix, options):
+        User = get_user_model()
+        start_at = timezone.now() + timezone.timedelta(days=1)
+        timeslots = Timeslot.objects.bulk_create([
+            Timeslot(
+                event_name=f"Booking benchmark {n}",
+                start_at=start_at,
+                end_at=start_at + timezone.timedelta(hours=1),
+                address=prefix,
+                capacity=options["capacity"],
+                seat_shards=options["shards"],
+            )
+            for n in range(options["timeslots"])
+        ])
+        if options["shards"]:
+            with transaction.atomic():
+                for ts in timeslots:
+                    ts.rebalance_seat_shards()
+        users = User.objects.bulk_create(
+            [User(username=f"{prefix}-{n}") for n in range(options["clients"])]
+        )
+        staff = User.objects.create(username=f"{prefix}-staff", is_staff=True)
+        return [ts.pk for ts in timeslots], [u.pk for u in users], staff.pk
+
+    def run(self, timeslot_ids, client_ids, staff_id, options):
+        plans = [
+            (user_id, timeslot_ids, options["ops"], options["cancel_ratio"], options["seed"] + n)
+            for n, user_id in enumerate(client_ids)
+        ]
+        sampler = LockWaitSampler()
+        staff_records = []
+        staff = threading.Thread(
+            target=staff_cancels,
+            args=(
+                staff_id,
+                random.Random(options["seed"]).sample(timeslot_ids, options["staff_cancels"]),
+                staff_records,
+            ),
+        )
+
+        # This thread, the lock sampler and the staff client keep one each
+        connections_left = options["max_connections"] - 3
+        pool = None
+        if options["pool"] == "process":
+            workers = min(options["processes"], len(plans), connections_left)
+            connections.close_all()  # no connection may be shared with the forked workers
+            pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+            # Fork all workers now, before this process starts any thread
+            pool.submit(int).result()
+
+        started = time.perf_counter()
+        sampler.start()
+        staff.start()
+        try:
+            if pool is None:
+                records = run_clients(plans, connections_left)
+            else:
+                chunks = [plans[n::workers] for n in range(workers)]
+                per_worker = partial(run_clients, max_connections=connections_left // workers)
+                records = [r for chunk in pool.map(per_worker, chunks) for r in chunk]
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            staff.join()
+        seconds = time.perf_counter() - started
+        sampler.stop()
+
+        return summarize(records + staff_records, seconds, sampler, options)
+
+    def report(self, results, options):
+        self.stdout.write(f"{'operation':<14} {'count':>7} {'ok':>7} {'rejected':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name, op in results["operations"].items():
+            self.stdout.write(
+                f"{name:<14} {op['count']:>7} {op['ok']:>7} {op['rejected']:>9} {op['errors']:>7} "
+                f"{op['p50_ms']:>8.1f} {op['p95_ms']:>8.1f} {op['p99_ms']:>8.1f}"
+            )
+        lock_wait = results["lock_wait_seconds"]
+        self.stdout.write(
+            f"{results['throughput']:.1f} requests/s, retries {results['retries']}, "
+            f"lock wait {'n/a' if lock_wait is None else f'{lock_wait:.2f}s'}"
+        )
+
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as f:
+                before = json.load(f)
+            self.stdout.write(f"vs {before.get('commit') or options['compare']}:")
+            self.stdout.write(f"  throughput {_change(before['throughput'], results['throughput'])}")
+            for name, op in results["operations"].items():
+                if name in before["operations"]:
+                    self.stdout.write(f"  {name} p95 {_change(before['operations'][name]['p95_ms'], op['p95_ms'])}")
+
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        else:
+            self.stdout.write(json.dumps(results))
+
+
+def run_clients(plans, max_connections) -> list[tuple[str, str, float, dict]]:
+    """Run one thread per client plan, (operation, outcome, seconds, retries) per request."""
+    records = []
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max_connections)
+
+    def client(user_id, timeslot_ids, ops, cancel_ratio, seed):
+        rng = random.Random(seed)
+        http = Client(SERVER_NAME="localhost")
+        with db_slot(slots):
+            http.force_login(get_user_model().objects.get(pk=user_id))
+        mine = []
+        for _ in range(ops):
+            if mine and rng.random() < cancel_ratio:
+                booking_id = mine.pop(rng.randrange(len(mine)))
+                record = request(http, "cancel", reverse("booking_cancel", args=[booking_id]), slots)
+            else:
+                timeslot_id = rng.choice(timeslot_ids)
+                record = request(http, "book", reverse("timeslot_book", args=[timeslot_id]), slots)
+                if record[1] == "ok":
+                    with db_slot(slots):
+                        mine.extend(
+                            Booking.objects.filter(
+                                user_id=user_id, timeslot_id=timeslot_id, status=BookingStatus.CONFIRMED
+                            ).values_list("pk", flat=True)
+                        )
+            with lock:
+                records.append(record)
+
+    threads = [threading.Thread(target=client, args=plan) for plan in plans]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return records
+
+
+def staff_cancels(staff_id, timeslot_ids, records):
+    slots = threading.BoundedSemaphore(1)
+    http = Client(SERVER_NAME="localhost")
+    with db_slot(slots):
+        http.force_login(get_user_model().objects.get(pk=staff_id))
+    for timeslot_id in timeslot_ids:
+        # Let the booking traffic get going first
+        time.sleep(0.05)
+        records.append(request(http, "staff_cancel", reverse("timeslot_cancel", args=[timeslot_id]), slots))
+
+
+@contextmanager
+def db_slot(slots):
+    """Hold one of the connection slots; the thread's connection is closed afterwards, like at the end of a request."""
+    with slots:
+        try:
+            yield
+        finally:
+            connections.close_all()
+
+
+def request(http, operation, url, slots):
+    """POST `url`, retrying deadlocks and serialization failures; (operation, outcome, seconds, retries)."""
+    retries = {}
+    started = time.perf_counter()
+    while True:
+        try:
+            with db_slot(slots):
+                response = http.post(url)
+        except OperationalError as e:
+            reason = _retry_reason(e)
+            if reason is None or sum(retries.values()) >= MAX_RETRIES:
+                return operation, "error", time.perf_counter() - started, retries
+            retries[reason] = retries.get(reason, 0) + 1
+            time.sleep(random.uniform(0, 0.01 * 2 ** sum(retries.values())))
+            continue
+        # Every action redirects on success and re-renders (200) when rejected
+        outcome = "ok" if response.status_code == 302 else "rejected" if response.status_code == 200 else "error"
+        return operation, outcome, time.perf_counter() - started, retries
+
+
+def _retry_reason(error):
+    cause = error.__cause__
+    code = getattr(cause, "pgcode", None) or getattr(cause, "sqlstate", None)
+    if code in RETRYABLE:
+        return RETRYABLE[code]
+    if "database is locked" in str(error):
+        # SQLite's version of a lock timeout
+        return "locked"
+    return None
+
+
+class LockWaitSampler:
+    """Estimates time spent waiting on row locks by sampling pg_stat_activity (PostgreSQL only)."""
+
+    INTERVAL = 0.05
+
+    def __init__(self):
+        self.enabled = connection.vendor == "postgresql"
+        self.waiting_samples = 0
+        self.deadlocks = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample)
+
+    def start(self):
+        if self.enabled:
+            self._deadlocks_before = self._deadlock_count()
+            self._thread.start()
+
+    def stop(self):
+        if self.enabled:
+            self._stop.set()
+            self._thread.join()
+            self.deadlocks = self._deadlock_count() - self._deadlocks_before
+
+    @property
+    def lock_wait_seconds(self):
+        return self.waiting_samples * self.INTERVAL if self.enabled else None
+
+    def _sample(self):
+        try:
+            with connections["default"].cursor() as cursor:
+                while not self._stop.wait(self.INTERVAL):
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                    )
+                    self.waiting_samples += cursor.fetchone()[0]
+        finally:
+            connections.close_all()
+
+    def _deadlock_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+            return cursor.fetchone()[0]
+
+
+def summarize(records, seconds, sampler, options) -> dict:
+    operations = {}
+    for name in ("book", "cancel", "staff_cancel"):
+        mine = [r for r in records if r[0] == name]
+        if not mine:
+            continue
+        latencies = sorted(r[2] * 1000 for r in mine)
+        operations[name] = {
+            "count": len(mine),
+            "ok": sum(r[1] == "ok" for r in mine),
+            "rejected": sum(r[1] == "rejected" for r in mine),
+            "errors": sum(r[1] == "error" for r in mine),
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "p99_ms": _percentile(latencies, 99),
+        }
+
+    retries = {}
+    for *_, counts in records:
+        for reason, n in counts.items():
+            retries[reason] = retries.get(reason, 0) + n
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": timezone.now().isoformat(),
+        "database": connection.vendor,
+        "config": {
+            key: options[key]
+            for key in (
+                "clients", "ops", "timeslots", "capacity", "shards", "cancel_ratio",
+                "staff_cancels", "pool", "processes", "max_connections", "seed",
+            )
+        },
+        "wall_seconds": seconds,
+        "throughput": len(records) / seconds,
+        "operations": operations,
+        "retries": retries,
+        "deadlocks": sampler.deadlocks,
+        "lock_wait_seconds": sampler.lock_wait_seconds,
+    }
+
+
+def check_invariants(timeslot_ids) -> dict:
+    """Timeslots over capacity, with a drifted seat counter, or cancelled but still booked."""
+    rows = (
+        Timeslot.objects.filter(pk__in=timeslot_ids)
+        .with_free_spots()
+        .annotate(confirmed=Count("bookings", filter=Q(bookings__status=BookingStatus.CONFIRMED)))
+    )
+    return {
+        "over_capacity": list(rows.filter(confirmed__gt=F("capacity")).values_list("pk", flat=True)),
+        "counter_drift": list(rows.exclude(booked_db=F("confirmed")).values_list("pk", flat=True)),
+        "booked_after_cancel": list(
+            rows.filter(status=TimeslotStatus.CANCELLED, confirmed__gt=0).values_list("pk", flat=True)
+        ),
+    }
+
+
+def _percentile(values, p):
+    # Nearest rank on sorted values
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _change(before, after):
+    if not before:
+        return f"{after:.1f}"
+    return f"{before:.1f} -> {after:.1f} ({(after - before) / before:+.0%})"
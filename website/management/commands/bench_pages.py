@@ -0,0 +1,178 @@
+import json
+import logging
+import time
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from website.models import BookingStatus, Timeslot, TimeslotStatus
+
+from .bench_booking import _git_commit, _percentile
+
+# Page name -> (client, URL name)
+PAGES = {
+    "booking (anonymous)": ("anonymous", "timeslots"),
+    "booking (user)": ("user", "timeslots"),
+    "booking (staff)": ("staff", "timeslots"),
+    "my_bookings": ("user", "my_bookings"),
+    "timeslot_book GET": ("user", "timeslot_book"),
+    "admin timeslots": ("staff", "admin:website_timeslot_changelist"),
+    "admin bookings": ("staff", "admin:website_booking_changelist"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure latency, query count and response size of the main pages with the "
+        "Django test client at growing numbers of timeslots (seeded with seed_bookings, "
+        "deleted afterwards). Prints one table per metric; with --max-p95-ms / "
+        "--max-queries it fails when a page exceeds them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scales", type=int, nargs="+", default=[10, 1000, 100_000], help="Timeslot counts.")
+        parser.add_argument("--bookings-per-timeslot", type=int, default=5)
+        parser.add_argument("--users", type=int, default=1000, help="Users seeded per scale.")
+        parser.add_argument("--repeat", type=int, default=20, help="Measured requests per page and scale.")
+        parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests before that (caches).")
+        parser.add_argument("--max-p95-ms", type=float, help="Fail when a page's p95 latency is above this.")
+        parser.add_argument("--max-queries", type=int, help="Fail when a page runs more queries than this.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--json", dest="json_path", help="Write the results to this file.")
+
+    def handle(self, *args, **options):
+        scales = sorted(options["scales"])
+        if scales[0] < 1 or options["repeat"] < 1:
+            raise CommandError("--scales and --repeat must be at least 1.")
+        if Timeslot.objects.exists():
+            self.stderr.write(self.style.WARNING(
+                "The database already has timeslots, they are counted into every scale."
+            ))
+
+        # One JSON log line per request would drown the table
+        logging.getLogger("website.requests").setLevel(logging.WARNING)
+
+        prefix = f"bench-pages-{int(time.time())}"
+        first_timeslot = (Timeslot.objects.order_by("-pk").values_list("pk", flat=True).first() or 0) + 1
+        staff = get_user_model().objects.create_superuser(username=f"{prefix}-staff", password="bench")
+        results = {"commit": _git_commit(), "timestamp": timezone.now().isoformat(),
+                   "database": connection.vendor, "scales": {}}
+        try:
+            seeded = 0
+            for n, scale in enumerate(scales):
+                self.seed(f"{prefix}-{n}", scale - seeded, options)
+                seeded = scale
+                self.stdout.write(f"{scale} timeslots seeded, measuring ...")
+                results["scales"][scale] = self.measure(prefix, staff, options)
+        finally:
+            Timeslot.objects.filter(pk__gte=first_timeslot).delete()
+            get_user_model().objects.filter(username__startswith=prefix).delete()
+
+        self.report(results, scales, options)
+
+    def seed(self, prefix, timeslots, options):
+        if timeslots < 1:
+            return
+        call_command(
+            "seed_bookings",
+            users=options["users"],
+            timeslots=timeslots,
+            bookings=timeslots * options["bookings_per_timeslot"],
+            prefix=prefix,
+            seed=options["seed"],
+            stdout=StringIO(),
+        )
+
+    def measure(self, prefix, staff, options) -> dict:
+        # The booker with the most upcoming bookings, the worst case for my_bookings
+        user = (
+            get_user_model().objects.filter(username__startswith=prefix)
+            .annotate(upcoming=Count("timeslot_bookings", filter=Q(
+                timeslot_bookings__status=BookingStatus.CONFIRMED,
+                timeslot_bookings__timeslot__end_at__gte=timezone.now(),
+            )))
+            .order_by("-upcoming", "pk")
+            .first()
+        )
+        bookable = Timeslot.objects.future().filter(status=TimeslotStatus.OPEN).values_list("pk", flat=True).first()
+
+        clients = {"anonymous": Client(SERVER_NAME="localhost")}
+        for name, who in (("user", user), ("staff", staff)):
+            clients[name] = Client(SERVER_NAME="localhost")
+            clients[name].force_login(who)
+
+        pages = {}
+        for page, (client_name, url_name) in PAGES.items():
+            if url_name == "timeslot_book":
+                if bookable is None:
+                    continue
+                url = reverse(url_name, args=[bookable])
+            else:
+                url = reverse(url_name)
+            pages[page] = self.measure_page(clients[client_name], url, options)
+        return pages
+
+    def measure_page(self, client, url, options) -> dict:
+        for _ in range(options["warmup"]):
+            client.get(url)
+
+        latencies, queries, size = [], 0, 0
+        for _ in range(options["repeat"]):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = client.get(url)
+                latencies.append((time.perf_counter() - started) * 1000)
+                queries = len(ctx.captured_queries)
+            if response.status_code != 200:
+                raise CommandError(f"GET {url} returned {response.status_code}.")
+            size = len(response.content)
+
+        latencies.sort()
+        return {
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "queries": queries,
+            "bytes": size,
+        }
+
+    def report(self, results, scales, options):
+        columns = "".join(f"{scale:>12}" for scale in scales)
+        for title, key, fmt in (
+            ("p50 ms", "p50_ms", "{:.1f}"),
+            ("p95 ms", "p95_ms", "{:.1f}"),
+            ("queries", "queries", "{}"),
+            ("KB", "bytes", "{:.1f}"),
+        ):
+            self.stdout.write(f"\n{title:<22}{columns}")
+            for page in PAGES:
+                cells = []
+                for scale in scales:
+                    row = results["scales"][scale].get(page)
+                    if row is None:
+                        cells.append(f"{'-':>12}")
+                        continue
+                    value = row[key] / 1024 if key == "bytes" else row[key]
+                    cells.append(f"{fmt.format(value):>12}")
+                self.stdout.write(f"{page:<22}{''.join(cells)}")
+
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+
+        exceeded = []
+        for scale in scales:
+            for page, row in results["scales"][scale].items():
+                if options["max_p95_ms"] is not None and row["p95_ms"] > options["max_p95_ms"]:
+                    exceeded.append(f"{page} at {scale} timeslots: p95 {row['p95_ms']:.1f} ms")
+                if options["max_queries"] is not None and row["queries"] > options["max_queries"]:
+                    exceeded.append(f"{page} at {scale} timeslots: {row['queries']} queries")
+        if exceeded:
+            raise CommandError("Thresholds exceeded:\n" + "\n".join(exceeded))
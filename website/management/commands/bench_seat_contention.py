@@ -0,0 +1,103 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from website.models import Timeslot
+from website.services import book_timeslot
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent bookings on one big timeslot: single seat counter "
+        "vs. seat shards. Creates its own users/timeslots and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--capacity", type=int, default=5000, help="Seats of the benchmark timeslot.")
+        parser.add_argument("--bookings", type=int, default=2000, help="Booking attempts per run.")
+        parser.add_argument("--threads", type=int, default=32, help="Concurrent bookers.")
+        parser.add_argument("--shards", type=int, default=16, help="Seat shards for the sharded run.")
+
+    def handle(self, *args, **options):
+        if options["threads"] < 1 or options["shards"] < 1:
+            raise CommandError("--threads and --shards must be at least 1.")
+        if connection.vendor != "postgresql":
+            self.stderr.write(self.style.WARNING(
+                f"Row-lock contention only shows on PostgreSQL, numbers on {connection.vendor} are not meaningful."
+            ))
+
+        User = get_user_model()
+        prefix = f"bench-seat-{int(time.time())}"
+        users = User.objects.bulk_create(
+            [User(username=f"{prefix}-{i}") for i in range(options["bookings"])]
+        )
+        try:
+            results = [
+                self.run_mode("single counter", users, 0, options),
+                self.run_mode(f"{options['shards']} shards", users, options["shards"], options),
+            ]
+        finally:
+            User.objects.filter(username__startswith=prefix).delete()
+
+        self.stdout.write(f"{'mode':<16} {'booked':>8} {'seconds':>9} {'bookings/s':>11}")
+        for mode, booked, seconds in results:
+            self.stdout.write(f"{mode:<16} {booked:>8} {seconds:>9.2f} {booked / seconds:>11.1f}")
+
+        (_, single, single_s), (_, sharded, sharded_s) = results
+        if single and sharded:
+            speedup = (sharded / sharded_s) / (single / single_s)
+            self.stdout.write(self.style.SUCCESS(f"Sharded throughput: {speedup:.2f}x the single counter"))
+
+    def run_mode(self, mode, users, shards, options):
+        start_at = timezone.now() + timezone.timedelta(days=1)
+        ts = Timeslot.objects.create(
+            event_name="Seat contention benchmark",
+            start_at=start_at,
+            end_at=start_at + timezone.timedelta(hours=1),
+            address="benchmark",
+            capacity=options["capacity"],
+            seat_shards=shards,
+        )
+        if shards:
+            with transaction.atomic():
+                ts.rebalance_seat_shards()
+
+        threads = options["threads"]
+        chunks = [users[i::threads] for i in range(threads)]
+        barrier = threading.Barrier(threads + 1)
+        booked = [0] * threads
+
+        def worker(n):
+            barrier.wait()
+            try:
+                for user in chunks[n]:
+                    try:
+                        book_timeslot(ts.pk, user)
+                    except ValidationError:
+                        continue
+                    booked[n] += 1
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for t in workers:
+            t.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for t in workers:
+            t.join()
+        seconds = time.perf_counter() - started
+
+        ts.refresh_from_db()
+        stored = ts.booked_seats()
+        try:
+            if stored != sum(booked) or stored > ts.capacity:
+                raise CommandError(f"{mode}: {sum(booked)} bookings but {stored} seats taken (capacity {ts.capacity}).")
+        finally:
+            ts.delete()
+        return mode, sum(booked), seconds
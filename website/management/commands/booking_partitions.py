@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from website import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain the monthly partitions of the bookings table (PostgreSQL, after migration "
+        "0014): split months with rows in the DEFAULT partition into their own partition, "
+        "create the next --ahead months and, with --retention, drop months that ended more "
+        "than that many months ago. Run it daily or at least monthly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=3, help="Months after the current one to create.")
+        parser.add_argument(
+            "--retention",
+            type=int,
+            default=None,
+            metavar="MONTHS",
+            help="Drop the partitions of months older than this. Off by default.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help=(
+                "Also drop partitions that still hold bookings (archive_bookings empties them). "
+                "The seats of their timeslots are recounted."
+            ),
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only print what would be done.")
+
+    def handle(self, *args, **options):
+        if options["ahead"] < 0 or (options["retention"] is not None and options["retention"] < 1):
+            raise CommandError("--ahead must be 0 or more, --retention at least 1.")
+        if not partitions.is_partitioned():
+            raise CommandError(
+                f"{partitions.TABLE} is not partitioned. Partitioning needs PostgreSQL "
+                "(migration 0014_partition_bookings)."
+            )
+
+        current = partitions.month_start(timezone.now())
+        existing = partitions.partitions()
+        wanted = set(partitions.default_months())
+        wanted.update(partitions.add_months(current, n) for n in range(options["ahead"] + 1))
+
+        for month in sorted(wanted - set(existing)):
+            name = partitions.partition_name(month)
+            if options["dry_run"]:
+                self.stdout.write(f"Would create {name}")
+                continue
+            moved = partitions.create_partition(month)
+            self.stdout.write(f"Created {name}" + (f" ({moved} bookings moved from the default partition)" if moved else ""))
+
+        if options["retention"] is None:
+            self.stdout.write(self.style.SUCCESS("Partitions are up to date."))
+            return
+
+        # Old months just split off the default partition are dropped right away
+        oldest = partitions.add_months(current, -options["retention"])
+        dropped = 0
+        for month, name in sorted(partitions.partitions().items()):
+            if month >= oldest:
+                continue
+            rows = partitions.partition_rows(name)
+            if rows and not options["force"]:
+                self.stderr.write(self.style.WARNING(
+                    f"Kept {name}: {rows} bookings, run archive_bookings first or use --force."
+                ))
+                continue
+            if options["dry_run"]:
+                self.stdout.write(f"Would drop {name} ({rows} bookings)")
+                continue
+            recounted = partitions.drop_partition(name)
+            dropped += 1
+            self.stdout.write(
+                f"Dropped {name} ({rows} bookings)"
+                + (f", recounted the seats of {recounted} timeslots" if recounted else "")
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Partitions are up to date, {dropped} dropped."))
@@ -0,0 +1,101 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from website import images
+
+SOURCE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Build responsive image variants: every image in <source>/<group>/ is cropped to "
+        "--aspect, resized to --widths (never enlarged) and saved as AVIF, WebP and JPEG in "
+        "<output>/<group>/. Writes <output>/manifest.json, which the templates read. "
+        "Needs Pillow."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=images.SOURCE_DIR)
+        parser.add_argument("--output", default=images.OUTPUT_DIR)
+        parser.add_argument("--widths", type=int, nargs="+", default=list(images.WIDTHS))
+        parser.add_argument(
+            "--aspect",
+            type=float,
+            default=2.5,
+            help="Width/height to crop to (centered), 0 keeps the source's. The hero banner "
+            "is 2.9:1 (mobile) to 5.8:1 (desktop), object-cover only shows the middle of that.",
+        )
+        parser.add_argument("--formats", nargs="+", choices=list(images.FORMATS), default=list(images.FORMATS))
+
+    def handle(self, *args, **options):
+        try:
+            from PIL import Image, ImageOps, features
+        except ImportError:
+            raise CommandError("build_images needs Pillow (pip install pillow).")
+        if not os.path.isdir(options["source"]):
+            raise CommandError(f"No source directory {options['source']}.")
+        if min(options["widths"]) < 1 or options["aspect"] < 0:
+            raise CommandError("--widths must be positive, --aspect 0 or more.")
+
+        formats = [ext for ext in images.FORMATS if ext in options["formats"]]
+        for ext in formats[:-1]:
+            if not features.check(ext):
+                self.stderr.write(self.style.WARNING(f"This Pillow can't write {ext}, skipped."))
+                formats.remove(ext)
+        self.Image, self.ImageOps = Image, ImageOps
+
+        manifest = {}
+        for group in sorted(os.listdir(options["source"])):
+            source_dir = os.path.join(options["source"], group)
+            if not os.path.isdir(source_dir):
+                continue
+            output_dir = os.path.join(options["output"], group)
+            os.makedirs(output_dir, exist_ok=True)
+            manifest[group], written = [], set()
+            for filename in sorted(os.listdir(source_dir)):
+                name, extension = os.path.splitext(filename)
+                if extension.lower() not in SOURCE_EXTENSIONS:
+                    continue
+                image = self.build(os.path.join(source_dir, filename), output_dir, name, formats, options)
+                image["variants"] = {
+                    ext: [[f"img/{group}/{file}", width] for file, width in files]
+                    for ext, files in image["variants"].items()
+                }
+                written.update(path.rsplit("/", 1)[1] for files in image["variants"].values() for path, _ in files)
+                manifest[group].append(image)
+                self.stdout.write(f"{group}/{filename}: {len(image['variants'][formats[-1]])} widths")
+
+            # Variants of removed or renamed sources
+            for filename in os.listdir(output_dir):
+                if filename not in written:
+                    os.remove(os.path.join(output_dir, filename))
+
+        with open(os.path.join(options["output"], "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f"{sum(len(group) for group in manifest.values())} images in {len(manifest)} groups."
+        ))
+
+    def build(self, path, output_dir, name, formats, options) -> dict:
+        Image, ImageOps = self.Image, self.ImageOps
+        with Image.open(path) as source:
+            image = ImageOps.exif_transpose(source).convert("RGB")
+        if options["aspect"]:
+            width = min(image.width, round(image.height * options["aspect"]))
+            image = ImageOps.fit(image, (width, round(width / options["aspect"])), Image.Resampling.LANCZOS)
+
+        # Every width up to the source's own; a smaller source gets one variant at its size
+        widths = sorted({min(width, image.width) for width in options["widths"]})
+        variants = {ext: [] for ext in formats}
+        for width in widths:
+            resized = image if width == image.width else image.resize(
+                (width, round(image.height * width / image.width)), Image.Resampling.LANCZOS
+            )
+            for ext in formats:
+                pillow_format, _, quality = images.FORMATS[ext]
+                filename = f"{name}-{width}.{ext}"
+                resized.save(os.path.join(output_dir, filename), pillow_format, quality=quality, optimize=ext == "jpg")
+                variants[ext].append([filename, width])
+        return {"name": name, "width": image.width, "height": image.height, "variants": variants}
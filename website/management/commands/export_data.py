@@ -0,0 +1,24 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from website import exports
+
+
+class Command(BaseCommand):
+    help = "Stream timeslots or bookings as CSV/JSON to stdout or a file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=exports.KINDS)
+        parser.add_argument("--format", choices=exports.FORMATS, default="csv")
+        parser.add_argument("--timeslot", type=int, help="Only the bookings of this timeslot.")
+        parser.add_argument("--output", "-o", help="File to write (default: stdout).")
+
+    def handle(self, *args, **options):
+        chunks = exports.stream(options["kind"], options["format"], options["timeslot"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as out:
+                out.writelines(chunks)
+        else:
+            # Bypass self.stdout, it would append a newline to every chunk
+            sys.stdout.writelines(chunks)
@@ -0,0 +1,55 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from website import imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import timeslots or bookings from a CSV/JSON file. Invalid rows are "
+        "skipped and reported with their line number."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=("timeslots", "bookings"))
+        parser.add_argument("path", help=".csv or .json file")
+        parser.add_argument("--batch-size", type=int, default=imports.BATCH_SIZE, help="Rows per transaction.")
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Use bulk_create instead of COPY for timeslots on PostgreSQL.",
+        )
+        parser.add_argument("--errors", help="Write the rejected rows (line, error) to this CSV file.")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        path = options["path"]
+        fmt = "json" if path.lower().endswith(".json") else "csv"
+
+        started = time.perf_counter()
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as file:
+                rows = imports.read_rows(file, fmt)
+                if options["kind"] == "timeslots":
+                    report = imports.import_timeslots(
+                        rows, options["batch_size"], use_copy=False if options["no_copy"] else None
+                    )
+                else:
+                    report = imports.import_bookings(rows, options["batch_size"])
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+        seconds = time.perf_counter() - started
+
+        for line, message in report.errors[:20]:
+            self.stderr.write(f"line {line}: {message}")
+        if options["errors"] and report.errors:
+            with open(options["errors"], "w", encoding="utf-8", newline="") as out:
+                writer = csv.writer(out)
+                writer.writerow(["line", "error"])
+                writer.writerows(report.errors)
+
+        style = self.style.SUCCESS if not report.error_count else self.style.WARNING
+        self.stdout.write(style(f"{report} in {seconds:.1f}s."))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from website.models import Timeslot
+
+
+class Command(BaseCommand):
+    help = "Compare the stored seat counters with the booking rows and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drifted timeslots, do not repair them.",
+        )
+
+    def handle(self, *args, **options):
+        drifted = list(
+            Timeslot.objects.with_free_spots()
+            .with_counted_bookings()
+            .exclude(booked_db=F("counted_bookings"))
+            .values_list("pk", "booked_db", "counted_bookings")
+        )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All confirmed counters match."))
+            return
+
+        for pk, stored, counted in drifted:
+            self.stdout.write(f"Timeslot {pk}: stored {stored}, counted {counted}")
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} timeslot(s) drifted (dry run)."))
+            return
+
+        ids = [pk for pk, _, _ in drifted]
+        with transaction.atomic():
+            # Wait for in-flight bookings on these rows before counting
+            list(Timeslot.objects.select_for_update().filter(pk__in=ids).values_list("pk"))
+            Timeslot.objects.filter(pk__in=ids).recount_seats()
+
+        self.stdout.write(self.style.SUCCESS(f"Repaired {len(ids)} timeslot(s)."))
@@ -0,0 +1,242 @@
+import itertools
+import math
+import random
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from website import fragment_cache
+from website.imports import copy_rows
+from website.models import Booking, BookingStatus, Timeslot, TimeslotStatus
+
+# Attempts to find a timeslot with a free seat before a booking is skipped
+MAX_TRIES = 10
+
+EVENTS = ["Yoga", "Pilates", "Kochkurs", "Workshop", "Vortrag", "Lauftreff", "Sprachcafé", "Führung", "Konzert", "Sprechstunde"]
+STREETS = ["Hauptstraße", "Bahnhofstraße", "Schulweg", "Marktplatz", "Gartenstraße", "Lindenallee"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users, timeslots (past and future) and bookings "
+        "for load testing. Bookings are Zipf-distributed over the timeslots (a few hot "
+        "events, a long tail), never exceed a timeslot's capacity and never book a user "
+        "twice. The same --seed gives the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--timeslots", type=int, default=10_000)
+        parser.add_argument("--bookings", type=int, default=1_000_000, help="Booking rows to generate.")
+        parser.add_argument("--past", type=float, default=0.7, help="Share of timeslots in the past.")
+        parser.add_argument("--days", type=int, default=365, help="Timeslots are spread over this many days.")
+        parser.add_argument("--capacity", type=int, nargs=2, default=(5, 200), metavar=("MIN", "MAX"))
+        parser.add_argument("--zipf", type=float, default=1.1, help="Skew of the booking distribution (0 = uniform).")
+        parser.add_argument("--cancel-rate", type=float, default=0.15, help="Share of cancelled bookings.")
+        parser.add_argument("--batch-size", type=int, default=20_000, help="Rows per INSERT/COPY.")
+        parser.add_argument("--no-copy", action="store_true", help="Use bulk_create instead of COPY on PostgreSQL.")
+        parser.add_argument("--prefix", default="seed", help="Usernames are <prefix>-<n>.")
+        parser.add_argument("--password", default="seed", help="Password of all generated users.")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        if min(options["users"], options["timeslots"], options["batch_size"]) < 1:
+            raise CommandError("--users, --timeslots and --batch-size must be at least 1.")
+        if not 0 <= options["past"] <= 1 or not 0 <= options["cancel_rate"] <= 1:
+            raise CommandError("--past and --cancel-rate must be between 0 and 1.")
+        low, high = options["capacity"]
+        if not 1 <= low <= high:
+            raise CommandError("--capacity needs 1 <= MIN <= MAX.")
+        User = get_user_model()
+        if User.objects.filter(username__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(f"Users {options['prefix']}-* exist already, pick another --prefix.")
+
+        self.options = options
+        self.rng = random.Random(options["seed"])
+        self.now = timezone.now()
+        self.use_copy = connection.vendor == "postgresql" and not options["no_copy"]
+
+        started = time.perf_counter()
+        user_ids = self.create_users()
+        self.stdout.write(f"{len(user_ids)} users ({time.perf_counter() - started:.1f}s)")
+        timeslots = self.create_timeslots()
+        self.stdout.write(f"{len(timeslots)} timeslots ({time.perf_counter() - started:.1f}s)")
+        created, confirmed, skipped = self.create_bookings(user_ids, timeslots)
+
+        # Timeslots got consecutive ids per batch, recounting a few others on the way is harmless
+        ids = [ts["pk"] for ts in timeslots]
+        for batch in _batches(ids, options["batch_size"]):
+            with transaction.atomic():
+                Timeslot.objects.filter(pk__range=(min(batch), max(batch))).recount_confirmed()
+        fragment_cache.timeslots_changed()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{created} bookings ({confirmed} confirmed, {created - confirmed} cancelled, "
+            f"{skipped} skipped: no free seat found) in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def create_users(self) -> list[int]:
+        User = get_user_model()
+        # Hashing is slow on purpose, all users share one hash
+        password = make_password(self.options["password"])
+        prefix = self.options["prefix"]
+        ids = []
+        for batch in _batches(range(self.options["users"]), self.options["batch_size"]):
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    [User(username=f"{prefix}-{n}", email=f"{prefix}-{n}@example.com", password=password) for n in batch]
+                )
+            ids += [user.pk for user in users]
+        return ids
+
+    def create_timeslots(self) -> list[dict]:
+        """Timeslots as {pk, start_at, capacity, status} (kept small, there can be millions)."""
+        rng, options = self.rng, self.options
+        span = options["days"] * 86400
+        low, high = options["capacity"]
+        timeslots = []
+        for batch in _batches(range(options["timeslots"]), options["batch_size"]):
+            objs = []
+            for n in batch:
+                past = rng.random() < options["past"]
+                offset = rng.uniform(0, span * (options["past"] if past else 1 - options["past"]))
+                # Full hours between 8:00 and 20:00 local time
+                start_at = timezone.localtime(self.now + timezone.timedelta(seconds=-offset if past else offset)).replace(
+                    hour=rng.randrange(8, 20), minute=0, second=0, microsecond=0
+                )
+                status = rng.choices(
+                    [TimeslotStatus.OPEN, TimeslotStatus.HIDDEN, TimeslotStatus.CANCELLED], [94, 3, 3]
+                )[0]
+                created_at = start_at - timezone.timedelta(days=rng.randrange(7, 90))
+                objs.append(Timeslot(
+                    event_name=f"{rng.choice(EVENTS)} {n}",
+                    start_at=start_at,
+                    # timeslot_end_after_start: 1-4 hours
+                    end_at=start_at + timezone.timedelta(minutes=rng.choice([60, 90, 120, 240])),
+                    address=f"{rng.choice(STREETS)} {rng.randrange(1, 200)}",
+                    capacity=rng.randint(low, high),
+                    status=status,
+                    created_at=min(created_at, self.now),
+                    updated_at=min(created_at, self.now),
+                ))
+            with transaction.atomic(), _keep_timestamps(Timeslot, "created_at", "updated_at"):
+                objs = Timeslot.objects.bulk_create(objs)
+            timeslots += [
+                {"pk": ts.pk, "start_at": ts.start_at, "capacity": ts.capacity, "status": ts.status}
+                for ts in objs
+            ]
+        return timeslots
+
+    def create_bookings(self, user_ids, timeslots) -> tuple[int, int, int]:
+        rng, options = self.rng, self.options
+        n_users = len(user_ids)
+
+        # Zipf: the timeslot with rank r gets bookings in proportion to 1 / r^s,
+        # ranks are shuffled so hot events are spread over the calendar
+        ranks = list(range(1, len(timeslots) + 1))
+        rng.shuffle(ranks)
+        cum_weights = list(itertools.accumulate(1 / rank ** options["zipf"] for rank in ranks))
+
+        # Confirmed bookings of a timeslot take users offset, offset + step,
+        # offset + 2 * step, ... (mod n_users) with step coprime to n_users, so
+        # they are all different users without remembering who booked what
+        steps = [s for s in range(1, min(n_users, 1000) + 1) if math.gcd(s, n_users) == 1]
+        plan = [
+            {
+                "offset": rng.randrange(n_users),
+                "step": rng.choice(steps),
+                "seats": 0 if ts["status"] == TimeslotStatus.CANCELLED else min(ts["capacity"], n_users),
+                "taken": 0,
+            }
+            for ts in timeslots
+        ]
+
+        created = confirmed = skipped = 0
+        for batch in _batches(range(options["bookings"]), options["batch_size"]):
+            rows = []
+            picks = rng.choices(range(len(timeslots)), cum_weights=cum_weights, k=len(batch))
+            for index in picks:
+                cancelled = rng.random() < options["cancel_rate"]
+                if cancelled:
+                    user_id = user_ids[rng.randrange(n_users)]
+                else:
+                    # Sold out hot events send the booker to a random other timeslot
+                    for _ in range(MAX_TRIES):
+                        if plan[index]["taken"] < plan[index]["seats"]:
+                            break
+                        index = rng.randrange(len(timeslots))
+                    else:
+                        skipped += 1
+                        continue
+                    slot = plan[index]
+                    user_id = user_ids[(slot["offset"] + slot["taken"] * slot["step"]) % n_users]
+                    slot["taken"] += 1
+                ts = timeslots[index]
+
+                # Booked in the weeks before the start, never in the future
+                latest = min(ts["start_at"], self.now)
+                booked_at = latest - timezone.timedelta(seconds=rng.uniform(0, 30 * 86400))
+                cancelled_at = booked_at + (latest - booked_at) * rng.random() if cancelled else None
+                rows.append((ts["pk"], ts["start_at"], user_id, cancelled, booked_at, cancelled_at))
+
+            with transaction.atomic():
+                self.write_bookings(rows)
+            created += len(rows)
+            confirmed += sum(1 for row in rows if not row[3])
+            self.stdout.write(f"  {created} bookings", ending="\r")
+        self.stdout.write("")
+        return created, confirmed, skipped
+
+    def write_bookings(self, rows) -> None:
+        status = {False: BookingStatus.CONFIRMED, True: BookingStatus.CANCELLED}
+        if self.use_copy:
+            copy_rows(
+                Booking._meta.db_table,
+                ["timeslot_id", "timeslot_start_at", "user_id", "message", "status", "booked_at", "cancelled_at"],
+                (
+                    [timeslot_id, start_at.isoformat(), user_id, "", status[cancelled], booked_at.isoformat(),
+                     cancelled_at and cancelled_at.isoformat()]
+                    for timeslot_id, start_at, user_id, cancelled, booked_at, cancelled_at in rows
+                ),
+            )
+            return
+        with _keep_timestamps(Booking, "booked_at"):
+            Booking.objects.bulk_create(
+                [
+                    Booking(
+                        timeslot_id=timeslot_id,
+                        timeslot_start_at=start_at,
+                        user_id=user_id,
+                        status=status[cancelled],
+                        booked_at=booked_at,
+                        cancelled_at=cancelled_at,
+                    )
+                    for timeslot_id, start_at, user_id, cancelled, booked_at, cancelled_at in rows
+                ],
+                batch_size=self.options["batch_size"],
+            )
+
+
+def _batches(items, size):
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def _keep_timestamps(model, *names):
+    # bulk_create would overwrite auto_now/auto_now_add fields with the current time
+    fields = [model._meta.get_field(name) for name in names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
@@ -0,0 +1,249 @@
+"""
+In-process metrics registry exposed in the Prometheus text format at /metrics.
+
+Counters and histograms live in memory, every worker process also writes its
+values to a JSON file <pid>.json in METRICS_DIR (at most once per
+FLUSH_INTERVAL). The /metrics view adds up the files of all processes, so it
+doesn't matter which worker a scrape hits. Files of exited processes are kept,
+counters must not go backwards; empty METRICS_DIR when (re)deploying.
+
+Rates such as bookings per second come from rate() over the counters in
+Prometheus, e.g. rate(booking_bookings_created_total[1m]).
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+FLUSH_INTERVAL = 1.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOCK_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def metrics_dir() -> str:
+    return getattr(settings, "METRICS_DIR", None) or os.path.join(tempfile.gettempdir(), "website_metrics")
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flushed_at = 0.0
+        self._timer = None
+
+    def reset(self):
+        # Forked workers start from zero, their parent's values are in the parent's file
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._timer = None
+        for metric in self.metrics.values():
+            metric.values.clear()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def changed(self):
+        # Called under self._lock by the metrics
+        self._dirty = True
+        if self._timer is None:
+            delay = max(0.0, self._flushed_at + FLUSH_INTERVAL - time.monotonic())
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    def flush(self) -> None:
+        """Write this process's values to METRICS_DIR (atomic rename, readers never see half a file)."""
+        with self._lock:
+            self._timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+            self._flushed_at = time.monotonic()
+            data = {name: metric.dump() for name, metric in self.metrics.items()}
+
+        directory = metrics_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def collect(self) -> dict:
+        """Values of all processes added up: {name: {labels json: value}}."""
+        totals = self.snapshot()
+        directory = metrics_dir()
+        own = f"{os.getpid()}.json"
+        try:
+            names = [n for n in os.listdir(directory) if n.endswith(".json") and n != own]
+        except FileNotFoundError:
+            names = []
+        for filename in names:
+            try:
+                with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, values in data.items():
+                metric = self.metrics.get(name)
+                if metric is not None:
+                    metric.merge(totals.setdefault(name, {}), values)
+        return totals
+
+    def render(self) -> str:
+        totals = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(totals.get(name, {}).items()):
+                lines.extend(metric.lines(json.loads(labels), value))
+        lines.extend(_connection_lines())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+os.register_at_fork(after_in_child=REGISTRY.reset)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, registry=REGISTRY):
+        self.name, self.help, self.registry = name, help, registry
+        self.values = {}
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = _labels_key(labels)
+        with self.registry._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+            self.registry.changed()
+
+    def dump(self):
+        return dict(self.values)
+
+    def merge(self, into, values):
+        for key, value in values.items():
+            into[key] = into.get(key, 0) + value
+
+    def lines(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {value}"]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets, registry=REGISTRY):
+        self.name, self.help, self.registry = name, help, registry
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self.values = {}
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = _labels_key(labels)
+        with self.registry._lock:
+            counts = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            counts[index] += 1
+            counts[-1] += value
+            self.registry.changed()
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def dump(self):
+        return {key: list(counts) for key, counts in self.values.items()}
+
+    def merge(self, into, values):
+        for key, counts in values.items():
+            if len(counts) != len(self.buckets) + 2:
+                continue  # written with other buckets
+            mine = into.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            into[key] = [a + b for a, b in zip(mine, counts)]
+
+    def lines(self, labels, counts):
+        lines, cumulative = [], 0
+        for bound, n in zip((*self.buckets, "+Inf"), counts):
+            cumulative += n
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {counts[-1]}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+def _labels_key(labels) -> str:
+    return json.dumps(labels, sort_keys=True)
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _connection_lines():
+    # Connections of the whole database, read at scrape time (PostgreSQL only)
+    if connection.vendor != "postgresql":
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity "
+            "WHERE datname = current_database() GROUP BY 1"
+        )
+        rows = cursor.fetchall()
+        cursor.execute("SHOW max_connections")
+        max_connections = cursor.fetchone()[0]
+    lines = [
+        "# HELP db_connections Database connections by state (pg_stat_activity).",
+        "# TYPE db_connections gauge",
+    ]
+    lines += [f"db_connections{_format_labels({'state': state})} {n}" for state, n in rows]
+    lines += [
+        "# HELP db_max_connections max_connections of the database server.",
+        "# TYPE db_max_connections gauge",
+        f"db_max_connections {max_connections}",
+    ]
+    return lines
+
+
+bookings_created = Counter("booking_bookings_created_total", "Bookings created.")
+bookings_cancelled = Counter(
+    "booking_bookings_cancelled_total",
+    "Bookings cancelled, by the user or with their timeslot (by=user|timeslot).",
+)
+bookings_rejected = Counter(
+    "booking_bookings_rejected_total",
+    "Booking attempts rejected, by reason (full, closed, past, duplicate).",
+)
+lock_wait = Histogram(
+    "booking_lock_wait_seconds",
+    "Time spent waiting for row locks (select_for_update / the seat claim UPDATE), by view.",
+    LOCK_WAIT_BUCKETS,
+)
+request_latency = Histogram(
+    "http_request_duration_seconds",
+    "View latency by URL name.",
+    LATENCY_BUCKETS,
+)
+db_queries = Counter("db_queries_total", "SQL queries run by requests, by URL name.")
+db_time = Counter("db_query_seconds_total", "Time spent in SQL queries by requests, by URL name.")
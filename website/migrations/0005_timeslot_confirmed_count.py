@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_confirmed_count(apps, schema_editor):
+    Timeslot = apps.get_model("website", "Timeslot")
+    Booking = apps.get_model("website", "Booking")
+    confirmed = (
+        Booking.objects.filter(timeslot=OuterRef("pk"), status="confirmed")
+        .order_by()
+        .values("timeslot")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    Timeslot.objects.update(confirmed_count=Coalesce(Subquery(confirmed), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0004_timeslot_event_description_timeslot_event_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timeslot',
+            name='confirmed_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_confirmed_count, migrations.RunPython.noop),
+    ]
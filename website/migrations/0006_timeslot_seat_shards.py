@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 10:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0005_timeslot_confirmed_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timeslot',
+            name='seat_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TimeslotSeatShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('capacity', models.PositiveIntegerField(default=0)),
+                ('confirmed_count', models.PositiveIntegerField(default=0)),
+                ('timeslot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='website.timeslot')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('timeslot', 'index'), name='uniq_seat_shard_per_timeslot'), models.CheckConstraint(condition=models.Q(('confirmed_count__lte', models.F('capacity'))), name='seat_shard_confirmed_lte_capacity')],
+            },
+        ),
+    ]
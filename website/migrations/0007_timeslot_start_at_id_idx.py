@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0006_timeslot_seat_shards'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(fields=['start_at', 'id'], name='timeslot_start_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0007_timeslot_start_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimeslotSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('custom', 'Custom days')], max_length=20)),
+                ('weekdays', models.CharField(blank=True, max_length=13)),
+                ('until', models.DateField(blank=True, null=True)),
+                ('count', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('skip_dates', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'timeslot series',
+            },
+        ),
+        migrations.AddField(
+            model_name='timeslot',
+            name='series',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='timeslots', to='website.timeslotseries'),
+        ),
+    ]
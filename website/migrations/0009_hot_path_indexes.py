@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 12:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0008_timeslot_series'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='website_boo_timeslo_365978_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='website_boo_user_id_77f5e3_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'timeslot', 'booked_at'], include=('status',), name='booking_user_timeslot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(condition=models.Q(('status', 'open')), fields=['start_at', 'id'], include=('end_at',), name='timeslot_open_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(fields=['end_at'], name='timeslot_end_at_idx'),
+        ),
+    ]
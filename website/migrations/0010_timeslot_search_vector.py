@@ -0,0 +1,70 @@
+# Generated by Django 6.0 on 2026-10-18 13:10
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# PostgreSQL only: the trigger that keeps search_vector up to date, its GIN
+# index and trigram indexes for typo-tolerant matching (website.search)
+SEARCH_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE FUNCTION website_timeslot_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('german', coalesce(NEW.event_name, '')), 'A') ||
+            setweight(to_tsvector('german', coalesce(NEW.address, '')), 'B') ||
+            setweight(to_tsvector('german', coalesce(NEW.event_description, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    -- Not on other columns: seat counter updates must stay cheap
+    CREATE TRIGGER website_timeslot_search_vector_trg
+    BEFORE INSERT OR UPDATE OF event_name, event_description, address ON website_timeslot
+    FOR EACH ROW EXECUTE FUNCTION website_timeslot_search_vector()
+    """,
+    # Fires the trigger for the existing rows
+    "UPDATE website_timeslot SET event_name = event_name",
+    "CREATE INDEX timeslot_search_vector_idx ON website_timeslot USING gin (search_vector)",
+    "CREATE INDEX timeslot_event_name_trgm_idx ON website_timeslot USING gin (event_name gin_trgm_ops)",
+    "CREATE INDEX timeslot_address_trgm_idx ON website_timeslot USING gin (address gin_trgm_ops)",
+]
+
+DROP_SQL = [
+    "DROP INDEX IF EXISTS timeslot_address_trgm_idx",
+    "DROP INDEX IF EXISTS timeslot_event_name_trgm_idx",
+    "DROP INDEX IF EXISTS timeslot_search_vector_idx",
+    "DROP TRIGGER IF EXISTS website_timeslot_search_vector_trg ON website_timeslot",
+    "DROP FUNCTION IF EXISTS website_timeslot_search_vector()",
+]
+
+
+def create_search(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in SEARCH_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0009_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timeslot',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
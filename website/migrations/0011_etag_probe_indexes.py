@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 14:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0010_timeslot_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('cancelled_at__isnull', False)), fields=['cancelled_at'], name='booking_cancelled_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(fields=['updated_at'], name='timeslot_updated_at_idx'),
+        ),
+    ]
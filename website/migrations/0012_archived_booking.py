@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 14:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0011_etag_probe_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('message', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('confirmed', 'Confirmed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('booked_at', models.DateTimeField()),
+                ('cancelled_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('timeslot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to='website.timeslot')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_timeslot_bookings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-booked_at'],
+                'indexes': [models.Index(fields=['user', 'timeslot'], include=('status',), name='archived_booking_user_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 6.0 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+FILL_SQL = """
+UPDATE website_booking SET timeslot_start_at = (
+    SELECT start_at FROM website_timeslot WHERE website_timeslot.id = website_booking.timeslot_id
+)
+"""
+
+# Moving a timeslot moves its bookings' copy of start_at (and on PostgreSQL
+# the rows into the matching partition), whichever way the timeslot was
+# updated: form, admin or the UPDATE that shifts a whole series
+TRIGGER_SQL = {
+    "postgresql": [
+        """
+        CREATE FUNCTION website_timeslot_start_at_sync() RETURNS trigger AS $$
+        BEGIN
+            UPDATE website_booking SET timeslot_start_at = NEW.start_at
+            WHERE timeslot_id = NEW.id AND timeslot_start_at IS DISTINCT FROM NEW.start_at;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER website_timeslot_start_at_trg
+        AFTER UPDATE OF start_at ON website_timeslot
+        FOR EACH ROW WHEN (OLD.start_at IS DISTINCT FROM NEW.start_at)
+        EXECUTE FUNCTION website_timeslot_start_at_sync()
+        """,
+    ],
+    # Dropped when a later migration rebuilds website_timeslot on SQLite,
+    # website.partitions.ensure_sqlite_trigger creates it again after migrate
+    "sqlite": [
+        """
+        CREATE TRIGGER website_timeslot_start_at_trg
+        AFTER UPDATE OF start_at ON website_timeslot
+        FOR EACH ROW WHEN OLD.start_at IS NOT NEW.start_at
+        BEGIN
+            UPDATE website_booking SET timeslot_start_at = NEW.start_at WHERE timeslot_id = NEW.id;
+        END
+        """,
+    ],
+}
+
+DROP_SQL = {
+    "postgresql": [
+        "DROP TRIGGER IF EXISTS website_timeslot_start_at_trg ON website_timeslot",
+        "DROP FUNCTION IF EXISTS website_timeslot_start_at_sync()",
+    ],
+    "sqlite": ["DROP TRIGGER IF EXISTS website_timeslot_start_at_trg"],
+}
+
+
+def create_trigger(apps, schema_editor):
+    for sql in TRIGGER_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_trigger(apps, schema_editor):
+    for sql in DROP_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0012_archived_booking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='timeslot_start_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunSQL(FILL_SQL, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='booking',
+            name='timeslot_start_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
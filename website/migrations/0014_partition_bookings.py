@@ -0,0 +1,107 @@
+# Generated by Django 6.0 on 2026-10-18 15:10
+
+import re
+
+from django.db import migrations
+
+# PostgreSQL only: rebuild website_booking as a table partitioned by range of
+# timeslot_start_at, with a DEFAULT partition holding every row for now.
+# `manage.py booking_partitions` splits it into monthly partitions afterwards
+# (see website.partitions). The table is copied, so run this during a
+# maintenance window, after `manage.py archive_bookings`.
+#
+# PostgreSQL wants the partition key in every unique index, so the primary
+# key becomes (id, timeslot_start_at) and uniq_confirmed_booking_per_user_timeslot
+# gets timeslot_start_at appended; a timeslot has only one start, so both
+# still mean the same. Nothing references bookings by foreign key.
+
+TABLE = "website_booking"
+KEY = "timeslot_start_at"
+
+
+def _definitions(cursor):
+    """CREATE INDEX and ADD CONSTRAINT statements of the table, without the primary key."""
+    cursor.execute(
+        "SELECT pg_get_indexdef(indexrelid), indisunique FROM pg_index"
+        " WHERE indrelid = %s::regclass AND NOT indisprimary",
+        [TABLE],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint"
+        " WHERE conrelid = %s::regclass AND contype IN ('f', 'c')",
+        [TABLE],
+    )
+    constraints = [f'ALTER TABLE {TABLE} ADD CONSTRAINT "{name}" {definition}' for name, definition in cursor.fetchall()]
+    return indexes, constraints
+
+
+def _rebuild(schema_editor, partitioned: bool):
+    with schema_editor.connection.cursor() as cursor:
+        indexes, constraints = _definitions(cursor)
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        # "public.website_booking_id_seq" -> website_booking_id_seq
+        sequence = cursor.fetchone()[0].rsplit(".", 1)[-1].strip('"')
+
+    old = f"{TABLE}_old"
+    schema_editor.execute(f"ALTER TABLE {TABLE} RENAME TO {old}")
+    if partitioned:
+        schema_editor.execute(f"CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE ({KEY})")
+        schema_editor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+    else:
+        schema_editor.execute(f"CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS)")
+    schema_editor.execute(f"INSERT INTO {TABLE} SELECT * FROM {old}")
+
+    # The id sequence belongs to the old table and would be dropped with it
+    schema_editor.execute(f"CREATE SEQUENCE {TABLE}_id_new_seq AS bigint OWNED BY {TABLE}.id")
+    schema_editor.execute(
+        f"SELECT setval('{TABLE}_id_new_seq', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)"
+    )
+    schema_editor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_new_seq')")
+    schema_editor.execute(f"DROP TABLE {old}")
+    schema_editor.execute(f"ALTER SEQUENCE {TABLE}_id_new_seq RENAME TO {sequence}")
+
+    schema_editor.execute(
+        f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, {KEY})" if partitioned
+        else f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id)"
+    )
+    for definition, unique in indexes:
+        # Indexes of a partitioned table print as "ON ONLY <table>"
+        definition = definition.replace(" ON ONLY ", " ON ", 1)
+        if unique:
+            definition = _with_key(definition) if partitioned else _without_key(definition)
+        schema_editor.execute(definition)
+    for definition in constraints:
+        schema_editor.execute(definition)
+
+
+def _with_key(definition: str) -> str:
+    # "... USING btree (timeslot_id, user_id) WHERE ..." -> "(timeslot_id, user_id, timeslot_start_at)"
+    return re.sub(r"USING (\w+) \(([^)]*)\)", rf"USING \1 (\2, {KEY})", definition, count=1)
+
+
+def _without_key(definition: str) -> str:
+    return definition.replace(f", {KEY})", ")", 1)
+
+
+def partition(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0013_booking_timeslot_start_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 15:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0014_partition_bookings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'confirmed')), fields=['user', 'timeslot_start_at'], name='booking_user_confirmed_idx'),
+        ),
+    ]
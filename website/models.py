@@ -1,9 +1,13 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q, Count, F
+from django.db import models, transaction
+from django.db.models import Q, Case, Count, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Now
 from django.utils import timezone
 
+from . import fragment_cache
+
 
 class TimeslotStatus(models.TextChoices):
     OPEN = "open", "Open"
@@ -15,24 +19,95 @@ class BookingStatus(models.TextChoices):
     CONFIRMED = "confirmed", "Confirmed"
     CANCELLED = "cancelled", "Cancelled"
 
+
+class SeriesFrequency(models.TextChoices):
+    DAILY = "daily", "Daily"
+    WEEKLY = "weekly", "Weekly"
+    CUSTOM = "custom", "Custom days"
+
+def counted_confirmed_bookings():
+    """Subquery counting the confirmed bookings of the outer timeslot, archived ones included."""
+    return (
+        # The partition key lets PostgreSQL look into one bookings partition only
+        _counted_confirmed(Booking.objects.filter(timeslot_start_at=OuterRef("start_at")))
+        + _counted_confirmed(ArchivedBooking.objects.all())
+    )
+
+
+def _counted_confirmed(bookings):
+    return Coalesce(
+        Subquery(
+            bookings.filter(timeslot=OuterRef("pk"), status=BookingStatus.CONFIRMED)
+            .order_by()
+            .values("timeslot")
+            .annotate(n=Count("pk"))
+            .values("n")
+        ),
+        Value(0),
+    )
+
+
+def sharded_confirmed_seats():
+    """Subquery summing the seat shards of the outer timeslot."""
+    return Coalesce(
+        Subquery(
+            TimeslotSeatShard.objects.filter(timeslot=OuterRef("pk"))
+            .order_by()
+            .values("timeslot")
+            .annotate(n=Sum("confirmed_count"))
+            .values("n")
+        ),
+        Value(0),
+    )
+
+
 class TimeslotQuerySet(models.QuerySet):
-    def with_confirmed_count(self):
+    def with_free_spots(self):
+        # Sharded timeslots sum their shard rows, all others read the column.
+        # Only booked_db is selected, free_spots_db derives from it: an SQL
+        # capacity - booked_db would repeat the shard subquery for every row
+        return self.annotate(
+            booked_db=Case(
+                When(seat_shards__gt=0, then=sharded_confirmed_seats()),
+                default=F("confirmed_count"),
+            ),
+        )
+
+    def with_user_booking(self, user):
+        # The viewer's confirmed booking id and latest booking status, in the same SELECT
+        if not user.is_authenticated:
+            return self
+        own = Booking.objects.filter(timeslot=OuterRef("pk"), timeslot_start_at=OuterRef("start_at"), user=user)
         return self.annotate(
-            confirmed_count=Count(
-                "bookings",
-                filter=Q(bookings__status=BookingStatus.CONFIRMED),
-                distinct=True,
-            )
+            my_booking_id=Subquery(
+                own.filter(status=BookingStatus.CONFIRMED).values("pk")[:1]
+            ),
+            my_booking_status=Subquery(
+                own.order_by("-booked_at").values("status")[:1]
+            ),
         )
 
+    def with_counted_bookings(self):
+        # Real count from the bookings table, only used to detect counter drift
+        return self.annotate(counted_bookings=counted_confirmed_bookings())
+
+    def recount_confirmed(self) -> int:
+        # Rewrite the stored counter from the booking rows (one UPDATE)
+        return self.update(confirmed_count=counted_confirmed_bookings(), updated_at=Now())
+
+    def recount_seats(self) -> None:
+        # Like recount_confirmed(), but also rebuilds the shards of sharded timeslots
+        fragment_cache.timeslots_changed()
+        with transaction.atomic():
+            self.filter(seat_shards=0).recount_confirmed()
+            for ts in self.filter(seat_shards__gt=0):
+                ts.rebalance_seat_shards(recount=True)
+
     def future(self):
         now = timezone.now()
         return (
-            self.filter(end_at__gte=now)           
-            .with_confirmed_count()
-            .annotate(
-                free_spots_db=F("capacity") - F("confirmed_count")
-            )
+            self.filter(end_at__gte=now)
+            .with_free_spots()
             .order_by("start_at")
         )
 
@@ -47,6 +122,15 @@ class Timeslot(models.Model):
     address = models.CharField(max_length=255)
     capacity = models.PositiveIntegerField(default=1)
 
+    # Denormalized number of CONFIRMED bookings, kept up to date by every
+    # booking/cancel path in the same transaction (see reconcile_confirmed_counts)
+    confirmed_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Opt-in for very large events: 0 keeps the single counter above, N > 0
+    # splits the capacity over N TimeslotSeatShard rows so bookings don't all
+    # serialize on this row (confirmed_count is then only a snapshot)
+    seat_shards = models.PositiveSmallIntegerField(default=0)
+
     status = models.CharField(
         max_length=20,
         choices=TimeslotStatus.choices,
@@ -54,6 +138,21 @@ class Timeslot(models.Model):
         db_index=True,
     )
 
+    # Set for timeslots created as part of a recurring series
+    series = models.ForeignKey(
+        "TimeslotSeries",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="timeslots",
+    )
+
+    # event_name, address and event_description for full-text search (website.search).
+    # Filled by a database trigger on PostgreSQL, unused elsewhere; its GIN index
+    # is created by migration 0010, not here, as other databases can't build it
+    search_vector = SearchVectorField(null=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -68,6 +167,22 @@ class Timeslot(models.Model):
                 name="timeslot_capacity_gte_1",
             ),
         ]
+        indexes = [
+            # Keyset pagination of the booking list, see website.pagination
+            models.Index(fields=["start_at", "id"], name="timeslot_start_at_id_idx"),
+            # Same for the public list, which only shows OPEN timeslots; end_at
+            # is in the index for the future() filter (covering on PostgreSQL)
+            models.Index(
+                fields=["start_at", "id"],
+                include=["end_at"],
+                condition=Q(status=TimeslotStatus.OPEN),
+                name="timeslot_open_start_idx",
+            ),
+            # future() over all statuses (staff) and my_bookings' timeslot__end_at
+            models.Index(fields=["end_at"], name="timeslot_end_at_idx"),
+            # MAX(updated_at) of the ETag version probe, see website.etags
+            models.Index(fields=["updated_at"], name="timeslot_updated_at_idx"),
+        ]
 
 
     def __str__(self) -> str:
@@ -80,12 +195,143 @@ class Timeslot(models.Model):
     def active_bookings_count(self) -> int:
         return self.bookings.filter(status=BookingStatus.CONFIRMED).count()
 
+    def booked_seats(self) -> int:
+        if self.seat_shards:
+            return self.shards.aggregate(n=Sum("confirmed_count"))["n"] or 0
+        return self.confirmed_count
+
     def free_spots(self) -> int:
-        return max(0, self.capacity - self.active_bookings_count())
-    
+        return max(0, self.capacity - self.booked_seats())
+
+    @property
+    def free_spots_db(self) -> int:
+        # From the booked_db annotation of with_free_spots(), no query
+        return self.capacity - self.booked_db
+
+    def clean(self) -> None:
+        # Every shard needs at least one seat
+        if self.seat_shards and self.capacity and self.seat_shards > self.capacity:
+            raise ValidationError({"seat_shards": "Can't be more than the capacity."})
+
+    def save(self, *args, **kwargs):
+        # The seat counter is owned by the booking paths. A full save() of an
+        # instance loaded earlier (forms, admin) must not write back a stale value.
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != "confirmed_count"
+            ]
+        super().save(*args, **kwargs)
+        fragment_cache.timeslots_changed()
+
+    def delete(self, *args, **kwargs):
+        fragment_cache.timeslots_changed()
+        return super().delete(*args, **kwargs)
+
+    def rebalance_seat_shards(self, recount: bool = False) -> None:
+        """
+        Spread capacity and the seats already taken evenly over `seat_shards`
+        shard rows (or fold them back into confirmed_count when seat_shards is 0).
+
+        Call inside a transaction after capacity or seat_shards changed. With
+        `recount` the taken seats are recounted from the booking rows.
+        """
+        # Lock the timeslot (single-counter bookers) and its shards (sharded bookers)
+        list(Timeslot.objects.select_for_update().filter(pk=self.pk).values_list("pk"))
+        shards = list(self.shards.select_for_update().order_by("index"))
+
+        if recount:
+            booked = self.active_bookings_count()
+        elif shards:
+            booked = sum(shard.confirmed_count for shard in shards)
+        else:
+            booked = Timeslot.objects.filter(pk=self.pk).values_list("confirmed_count", flat=True).get()
+
+        Timeslot.objects.filter(pk=self.pk).update(confirmed_count=booked, updated_at=timezone.now())
+        self.confirmed_count = booked
+
+        count = self.seat_shards
+        if not count:
+            TimeslotSeatShard.objects.filter(timeslot=self).delete()
+            return
+
+        by_index = {shard.index: shard for shard in shards}
+        to_update, to_create = [], []
+        for index, (capacity, taken) in enumerate(self.shard_sizes(booked)):
+            shard = by_index.get(index)
+            if shard is None:
+                to_create.append(TimeslotSeatShard(
+                    timeslot=self, index=index, capacity=capacity, confirmed_count=taken,
+                ))
+            else:
+                shard.capacity, shard.confirmed_count = capacity, taken
+                to_update.append(shard)
+
+        TimeslotSeatShard.objects.filter(timeslot=self, index__gte=count).delete()
+        TimeslotSeatShard.objects.bulk_update(to_update, ["capacity", "confirmed_count"])
+        TimeslotSeatShard.objects.bulk_create(to_create)
+
+    def shard_sizes(self, booked: int = 0) -> list[tuple[int, int]]:
+        """(capacity, taken) of each of the `seat_shards` shards."""
+        count = self.seat_shards
+        # Taken seats fill the first shards, free seats the last ones
+        taken_each, taken_rest = divmod(booked, count)
+        free_each, free_rest = divmod(max(0, self.capacity - booked), count)
+        sizes = []
+        for index in range(count):
+            taken = taken_each + (1 if index < taken_rest else 0)
+            free = free_each + (1 if index >= count - free_rest else 0)
+            sizes.append((taken + free, taken))
+        return sizes
+
     objects = TimeslotQuerySet.as_manager()
 
 
+class TimeslotSeries(models.Model):
+    """The recurrence rule a group of timeslots was created from."""
+
+    frequency = models.CharField(max_length=20, choices=SeriesFrequency.choices)
+    # Monday=0 ... Sunday=6, comma separated (only for CUSTOM)
+    weekdays = models.CharField(max_length=13, blank=True)
+    until = models.DateField(null=True, blank=True)
+    count = models.PositiveSmallIntegerField(null=True, blank=True)
+    skip_dates = models.JSONField(default=list, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "timeslot series"
+
+    def __str__(self) -> str:
+        return f"{self.get_frequency_display()} series #{self.pk}"
+
+
+class TimeslotSeatShard(models.Model):
+    timeslot = models.ForeignKey(
+        Timeslot,
+        on_delete=models.CASCADE,
+        related_name="shards",
+    )
+    index = models.PositiveSmallIntegerField()
+    capacity = models.PositiveIntegerField(default=0)
+    confirmed_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["timeslot", "index"],
+                name="uniq_seat_shard_per_timeslot",
+            ),
+            models.CheckConstraint(
+                condition=Q(confirmed_count__lte=models.F("capacity")),
+                name="seat_shard_confirmed_lte_capacity",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.timeslot_id}#{self.index}: {self.confirmed_count}/{self.capacity}"
+
+
 class Booking(models.Model):
     timeslot = models.ForeignKey(
         Timeslot,
@@ -109,8 +355,16 @@ class Booking(models.Model):
     booked_at = models.DateTimeField(auto_now_add=True)
     cancelled_at = models.DateTimeField(null=True, blank=True)
 
+    # Copy of timeslot.start_at, the partition key on PostgreSQL (see
+    # website.partitions). save() fills it unless it is set (book_timeslot
+    # reads it under the seat claim's lock), bulk writers have to set it, a
+    # trigger follows when a timeslot is moved.
+    timeslot_start_at = models.DateTimeField(editable=False)
+
     class Meta:
         ordering = ["-booked_at"]
+        # On PostgreSQL the unique index and the primary key also contain
+        # timeslot_start_at, see migration 0014_partition_bookings
         constraints = [
             # A user can only have ONE active booking per timeslot
             models.UniqueConstraint(
@@ -119,14 +373,43 @@ class Booking(models.Model):
                 name="uniq_confirmed_booking_per_user_timeslot",
             ),
         ]
+        # Confirmed bookings of a timeslot (seat counts) are found through the
+        # partial unique index of uniq_confirmed_booking_per_user_timeslot
         indexes = [
-            models.Index(fields=["timeslot", "status"]),
-            models.Index(fields=["user", "status"]),
+            # my_bookings and the viewer's booking on every card (with_user_booking)
+            models.Index(
+                fields=["user", "timeslot", "booked_at"],
+                include=["status"],
+                name="booking_user_timeslot_idx",
+            ),
+            # The upcoming and past tabs of my_bookings: a user's confirmed
+            # bookings by timeslot start, without the cancelled ones
+            models.Index(
+                fields=["user", "timeslot_start_at"],
+                condition=Q(status=BookingStatus.CONFIRMED),
+                name="booking_user_confirmed_idx",
+            ),
+            # MAX(cancelled_at) of the ETag version probe, see website.etags
+            models.Index(
+                fields=["cancelled_at"],
+                condition=Q(cancelled_at__isnull=False),
+                name="booking_cancelled_at_idx",
+            ),
         ]
 
     def __str__(self) -> str:
         return f"{self.user} -> {self.timeslot} ({self.status})"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "timeslot_start_at" in update_fields:
+            if Booking.timeslot.is_cached(self):
+                self.timeslot_start_at = self.timeslot.start_at
+            elif self.timeslot_start_at is None:
+                # A value, not an expression: the instance has to match its row after the save
+                self.timeslot_start_at = Timeslot.objects.values_list("start_at", flat=True).get(pk=self.timeslot_id)
+        super().save(*args, **kwargs)
+
     def clean(self) -> None:
         # Only validate when creating/confirming
         if self.status != BookingStatus.CONFIRMED:
@@ -141,3 +424,46 @@ class Booking(models.Model):
         # Overbooking guard (best effort; still do atomic check in the booking service/view)
         if self.pk is None and self.timeslot.free_spots() <= 0:
             raise ValidationError("This timeslot is fully booked.")
+
+
+class ArchivedBooking(models.Model):
+    """
+    A Booking of a finished timeslot, moved here by `manage.py archive_bookings`.
+
+    Same columns and id as the Booking it was, so the live table only holds
+    bookings that can still change while the history stays queryable (my
+    bookings, exports, the seat counts of the timeslot).
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    timeslot = models.ForeignKey(
+        Timeslot,
+        on_delete=models.CASCADE,
+        related_name="archived_bookings",
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="archived_timeslot_bookings",
+    )
+
+    message = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=BookingStatus.choices)
+
+    booked_at = models.DateTimeField()
+    cancelled_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["-booked_at"]
+        indexes = [
+            # The past and cancelled tabs of my_bookings
+            models.Index(
+                fields=["user", "timeslot"],
+                include=["status"],
+                name="archived_booking_user_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user} -> {self.timeslot} ({self.status}, archived)"
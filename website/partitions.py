@@ -0,0 +1,143 @@
+"""
+Monthly range partitions of the bookings table (PostgreSQL).
+
+Migration 0014 turns website_booking into a table partitioned by
+timeslot_start_at (the booking's copy of its timeslot's start) with a single
+DEFAULT partition. `manage.py booking_partitions` keeps one partition per
+calendar month (UTC) next to it: it splits the months that have rows in the
+default partition off into their own, creates the coming months ahead of
+time and drops months older than the retention. Queries that bound
+timeslot_start_at (seat counts, the viewer's booking on every card, my
+bookings, archival) are pruned to the partitions in range.
+
+Timeslot is not partitioned: bookings, seat shards and the archive reference
+timeslot ids, and PostgreSQL can only enforce a unique key (and so a foreign
+key target) on a partitioned table if it contains the partition key.
+
+On SQLite the table isn't partitioned, but timeslot_start_at still has to
+follow its timeslot. SQLite drops a table's triggers whenever a migration
+rebuilds the table, so ensure_sqlite_trigger() recreates the trigger of
+migration 0013 after every migrate (post_migrate, see apps.py).
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+
+from .models import Booking, BookingStatus, Timeslot
+
+TABLE = Booking._meta.db_table
+DEFAULT = f"{TABLE}_default"
+KEY = "timeslot_start_at"
+
+_NAME = re.compile(rf"^{TABLE}_p(\d{{4}})(\d{{2}})$")
+
+# Migration 0013's SQLite trigger
+SQLITE_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS website_timeslot_start_at_trg
+AFTER UPDATE OF start_at ON website_timeslot
+FOR EACH ROW WHEN OLD.start_at IS NOT NEW.start_at
+BEGIN
+    UPDATE website_booking SET timeslot_start_at = NEW.start_at WHERE timeslot_id = NEW.id;
+END
+"""
+
+
+def month_start(value: datetime) -> datetime:
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month: datetime, n: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + n
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE])
+        return cursor.fetchone() is not None
+
+
+def partitions() -> dict[datetime, str]:
+    """The monthly partitions by their first day."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+            " WHERE i.inhparent = %s::regclass",
+            [TABLE],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+    return {
+        datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc): name
+        for name in names
+        if (match := _NAME.match(name))
+    }
+
+
+def default_months() -> list[datetime]:
+    """Months that still have rows in the DEFAULT partition."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', {KEY} AT TIME ZONE 'UTC') FROM {DEFAULT} ORDER BY 1"
+        )
+        return [month.replace(tzinfo=dt_timezone.utc) for (month,) in cursor.fetchall()]
+
+
+def create_partition(month: datetime) -> int:
+    """Create the partition of a month, moving its rows out of the DEFAULT partition; returns how many."""
+    name, bounds = partition_name(month), [month, add_months(month, 1)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        # No bookings for that month can go into the default partition meanwhile
+        cursor.execute(f"LOCK TABLE {DEFAULT} IN EXCLUSIVE MODE")
+        cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {DEFAULT} WHERE {KEY} >= %s AND {KEY} < %s RETURNING *)"
+            f" INSERT INTO {name} SELECT * FROM moved",
+            bounds,
+        )
+        moved = cursor.rowcount
+        # Builds the table's indexes and checks its rows against the bounds
+        cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+    return moved
+
+
+def partition_rows(name: str) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {name}")
+        return cursor.fetchone()[0]
+
+
+def drop_partition(name: str) -> int:
+    """
+    Drop a monthly partition with its rows. The seats of timeslots that lose
+    confirmed bookings with it are recounted; returns how many timeslots.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SELECT DISTINCT timeslot_id FROM {name} WHERE status = %s", [BookingStatus.CONFIRMED])
+        timeslot_ids = [pk for (pk,) in cursor.fetchall()]
+        cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
+        if timeslot_ids:
+            Timeslot.objects.filter(pk__in=timeslot_ids).recount_seats()
+    return len(timeslot_ids)
+
+
+def ensure_sqlite_trigger(using=DEFAULT_DB_ALIAS, **kwargs) -> None:
+    """post_migrate receiver: create the SQLite start_at trigger if a table rebuild dropped it."""
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        # Not before migration 0013 (or after reverting it)
+        if TABLE not in connection.introspection.table_names(cursor):
+            return
+        if KEY not in {column.name for column in connection.introspection.get_table_description(cursor, TABLE)}:
+            return
+        cursor.execute(SQLITE_TRIGGER)
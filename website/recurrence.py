@@ -0,0 +1,64 @@
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import SeriesFrequency
+
+# Upper bound for one series (a semester of daily slots fits comfortably)
+MAX_OCCURRENCES = 200
+
+
+def local_datetime(day: date, at: time) -> datetime:
+    """Date + wall clock time, aware in the current timezone when USE_TZ is on."""
+    value = datetime.combine(day, at)
+    if settings.USE_TZ:
+        value = timezone.make_aware(value, timezone.get_current_timezone())
+    return value
+
+
+def occurrence_dates(
+    first: date,
+    frequency: str,
+    weekdays=(),
+    until: date | None = None,
+    count: int | None = None,
+    skip=(),
+) -> list[date]:
+    """
+    Dates of a series starting on `first`.
+
+    DAILY repeats every day, WEEKLY on the weekday of `first` and CUSTOM on
+    `weekdays` (Monday=0). The series ends after `until` or after `count`
+    occurrences, whichever comes first; dates in `skip` are left out and do
+    not count. Stops at MAX_OCCURRENCES + 1 dates, more than a series may
+    have, so callers can reject it instead of silently cutting it short.
+    """
+    if frequency == SeriesFrequency.DAILY:
+        days = set(range(7))
+    elif frequency == SeriesFrequency.WEEKLY:
+        days = {first.weekday()}
+    else:
+        days = {int(d) for d in weekdays}
+    if not days:
+        return []
+    limit = min(count or MAX_OCCURRENCES + 1, MAX_OCCURRENCES + 1)
+    skip = set(skip)
+
+    dates = []
+    day = first
+    while len(dates) < limit and (until is None or day <= until):
+        if day.weekday() in days and day not in skip:
+            dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+
+def overlapping(occurrences, existing) -> list[tuple[datetime, datetime]]:
+    """The occurrences (start, end) that overlap any of the `existing` (start, end) ranges."""
+    existing = list(existing)
+    conflicts = []
+    for start, end in occurrences:
+        if any(other_start < end and start < other_end for other_start, other_end in existing):
+            conflicts.append((start, end))
+    return conflicts
@@ -0,0 +1,36 @@
+"""
+Event search over event_name, event_description and address.
+
+On PostgreSQL a search matches the full-text vector Timeslot.search_vector
+(filled by a trigger, GIN index) or, for typos, is trigram-similar to a word
+of event_name or address (pg_trgm GIN indexes); see migration
+0010_timeslot_search_vector; the trigram lookups come from
+django.contrib.postgres. Other databases fall back to icontains on the
+three fields. Results keep the queryset's ordering, so the booking list stays
+chronological and keyset-paginated.
+"""
+from django.contrib.postgres.search import SearchQuery
+from django.db import connections
+from django.db.models import Q
+
+# Text search configuration, the trigger in the migration uses the same one
+CONFIG = "german"
+
+MAX_LENGTH = 100
+
+
+def search_timeslots(queryset, q: str):
+    """Timeslots of `queryset` matching the search text `q` (unchanged for an empty one)."""
+    q = q.strip()[:MAX_LENGTH]
+    if not q:
+        return queryset
+
+    if connections[queryset.db].vendor != "postgresql":
+        return queryset.filter(
+            Q(event_name__icontains=q) | Q(event_description__icontains=q) | Q(address__icontains=q)
+        )
+    return queryset.filter(
+        Q(search_vector=SearchQuery(q, config=CONFIG, search_type="websearch"))
+        | Q(event_name__trigram_word_similar=q)
+        | Q(address__trigram_word_similar=q)
+    )
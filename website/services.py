@@ -0,0 +1,134 @@
+import random
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import fragment_cache, live, metrics
+from .models import Booking, BookingStatus, Timeslot, TimeslotSeatShard, TimeslotStatus
+
+
+def book_timeslot(timeslot_id: int, user, message: str = "") -> Booking:
+    """
+    Claim one seat of a timeslot and create the booking.
+
+    The seat is claimed with a single conditional UPDATE (open, not ended,
+    confirmed_count < capacity), so no row is locked before the write and no
+    COUNT/EXISTS pre-queries are needed. Sharded timeslots claim from a random
+    seat shard instead, with the timeslot row only share-locked. Either way
+    the timeslot can't be cancelled or moved before the booking commits, so
+    its timeslot_start_at is current. Double bookings are rejected by the
+    uniq_confirmed_booking_per_user_timeslot constraint.
+
+    Raises ValidationError with code "full", "closed", "past" or "duplicate",
+    and Timeslot.DoesNotExist for an unknown timeslot.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            # The claim UPDATE is where concurrent bookers queue for the row lock
+            with metrics.lock_wait.time(view="timeslot_book"):
+                start_at = _claim_seat(timeslot_id, now)
+            if start_at is None:
+                rejection = _rejection(timeslot_id, now)
+                metrics.bookings_rejected.inc(reason=rejection.code)
+                raise rejection
+
+            booking = Booking.objects.create(
+                timeslot_id=timeslot_id,
+                timeslot_start_at=start_at,
+                user=user,
+                status=BookingStatus.CONFIRMED,
+                message=message,
+            )
+            fragment_cache.timeslots_changed()
+            live.seats_changed(timeslot_id)
+    except IntegrityError:
+        # The claimed seat is released by the rollback
+        metrics.bookings_rejected.inc(reason="duplicate")
+        raise ValidationError("You already booked this timeslot.", code="duplicate")
+    metrics.bookings_created.inc()
+    return booking
+
+
+def release_seat(timeslot_id: int) -> None:
+    """Give back a seat claimed by book_timeslot, inside the cancelling transaction."""
+    fragment_cache.timeslots_changed()
+    live.seats_changed(timeslot_id)
+    if Timeslot.objects.filter(
+        pk=timeslot_id, seat_shards=0, confirmed_count__gt=0
+    ).update(confirmed_count=F("confirmed_count") - 1, updated_at=timezone.now()):
+        return
+
+    shard_ids = list(
+        TimeslotSeatShard.objects.filter(timeslot_id=timeslot_id, confirmed_count__gt=0)
+        .values_list("pk", flat=True)
+    )
+    random.shuffle(shard_ids)
+    for shard_id in shard_ids:
+        if TimeslotSeatShard.objects.filter(
+            pk=shard_id, confirmed_count__gt=0
+        ).update(confirmed_count=F("confirmed_count") - 1):
+            return
+
+
+def _claim_seat(timeslot_id: int, now):
+    """Claim a seat; returns the timeslot's start_at, None when there is none to claim."""
+    bookable = Timeslot.objects.filter(pk=timeslot_id, status=TimeslotStatus.OPEN, end_at__gte=now)
+    start_at = Timeslot.objects.filter(pk=timeslot_id).values_list("start_at", flat=True)
+
+    # Single counter: one conditional UPDATE on the timeslot row. It keeps the
+    # row locked, so the start_at read after it is the one committed with it.
+    if bookable.filter(seat_shards=0, confirmed_count__lt=F("capacity")).update(
+        confirmed_count=F("confirmed_count") + 1, updated_at=now
+    ):
+        return start_at.get()
+
+    # Sharded: FOR SHARE, so concurrent bookers don't wait for each other but
+    # timeslot_cancel and moves (UPDATE) wait for them to commit, and vice versa
+    locked = bookable.filter(seat_shards__gt=0).values_list("start_at", flat=True)
+    if connection.vendor == "postgresql":
+        sql, params = locked.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"{sql} FOR SHARE", params)
+            row = cursor.fetchone()
+        locked_start_at = row[0] if row else None
+    else:
+        # SQLite serializes writers anyway
+        locked_start_at = locked.first()
+    if locked_start_at is None:
+        return None
+
+    # The same conditional UPDATE against a random shard with room. Shards
+    # filled up by concurrent bookers in the meantime are skipped, and the
+    # UPDATE checks the timeslot again (on SQLite it isn't locked).
+    shard_ids = list(
+        TimeslotSeatShard.objects.filter(
+            timeslot_id=timeslot_id,
+            confirmed_count__lt=F("capacity"),
+        ).values_list("pk", flat=True)
+    )
+    random.shuffle(shard_ids)
+    for shard_id in shard_ids:
+        if TimeslotSeatShard.objects.filter(
+            pk=shard_id,
+            confirmed_count__lt=F("capacity"),
+            timeslot__status=TimeslotStatus.OPEN,
+            timeslot__end_at__gte=now,
+        ).update(confirmed_count=F("confirmed_count") + 1):
+            return locked_start_at
+    return None
+
+
+def _rejection(timeslot_id: int, now) -> ValidationError:
+    # Only runs when the claim failed, to tell the user why
+    ts = Timeslot.objects.filter(pk=timeslot_id).values("status", "end_at").first()
+    if ts is None:
+        raise Timeslot.DoesNotExist(f"Timeslot {timeslot_id} does not exist.")
+
+    if ts["status"] != TimeslotStatus.OPEN:
+        return ValidationError("This timeslot is not open for booking.", code="closed")
+    if ts["end_at"] < now:
+        return ValidationError("This timeslot is in the past.", code="past")
+    return ValidationError("This timeslot is fully booked.", code="full")
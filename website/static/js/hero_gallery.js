@@ -1,14 +1,14 @@
 (function () {
+  function init(gallery) {
     // Prevent double-init (useful if scripts get loaded twice)
-    if (window.__heroGalleryInit) return;
-    window.__heroGalleryInit = true;
+    if (gallery.dataset.init) return;
+    gallery.dataset.init = "1";
   
-    const gallery = document.getElementById("hero-gallery");
-    const slides = Array.from(document.querySelectorAll(".gallery-slide"));
-    const prevBtn = document.getElementById("gallery-prev");
-    const nextBtn = document.getElementById("gallery-next");
+    const slides = Array.from(gallery.querySelectorAll(".gallery-slide"));
+    const prevBtn = gallery.querySelector("#gallery-prev");
+    const nextBtn = gallery.querySelector("#gallery-next");
   
-    if (!gallery || slides.length <= 1) return;
+    if (slides.length <= 1) return;
   
     const INTERVAL_MS = 7000;
     const SWIPE_THRESHOLD_PX = 40;
@@ -27,6 +27,24 @@
       });
     }
   
+    // Slides after the first come with data-src/data-srcset (also on their
+    // <source>s), so only the visible and the next slide are downloaded
+    function load(i) {
+      const img = slides[(i + slides.length) % slides.length];
+      const picture = img.closest("picture");
+      const elements = picture ? [...picture.querySelectorAll("source"), img] : [img];
+      elements.forEach((el) => {
+        if (el.dataset.srcset) {
+          el.srcset = el.dataset.srcset;
+          delete el.dataset.srcset;
+        }
+        if (el.dataset.src) {
+          el.src = el.dataset.src;
+          delete el.dataset.src;
+        }
+      });
+    }
+  
     function show(nextIndex, { animated = true } = {}) {
       setTransitionEnabled(animated);
   
@@ -34,8 +52,10 @@
       slides[index].classList.add("opacity-0");
   
       index = (nextIndex + slides.length) % slides.length;
+      load(index);
       slides[index].classList.remove("opacity-0");
       slides[index].classList.add("opacity-100");
+      load(index + 1);
   
       if (!animated) requestAnimationFrame(() => setTransitionEnabled(true));
     }
@@ -46,6 +66,8 @@
     function start() {
       stop();
       timer = setInterval(() => {
+        // Navigated away (HTMX swapped the page)
+        if (!gallery.isConnected) return stop();
         if (!isPaused) next(true); // auto uses fade
       }, INTERVAL_MS);
     }
@@ -112,6 +134,20 @@
       }
     });
   
+    // The next slide once the page itself is done
+    if (document.readyState === "complete") load(1);
+    else window.addEventListener("load", () => load(1), { once: true });
+  
     start();
-  })();
+  }
+
+  const gallery = document.getElementById("hero-gallery");
+  if (gallery) init(gallery);
+
+  // Pages loaded by HTMX navigation (hx-boost)
+  document.addEventListener("htmx:load", (event) => {
+    const gallery = event.target.querySelector && event.target.querySelector("#hero-gallery");
+    if (gallery) init(gallery);
+  });
+})();
   
\ No newline at end of file
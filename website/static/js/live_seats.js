@@ -0,0 +1,35 @@
+(function () {
+    // Live seat badges on the booking page: the booking/events/ stream
+    // (website/live.py) sends "seats-<id>" events with the new badge HTML
+    const list = document.querySelector("[data-seat-events]");
+    if (!list || !window.EventSource) return;
+
+    // A 204 (no ASGI server) closes the stream for good, errors reconnect
+    const source = new EventSource(list.dataset.seatEvents);
+    const listening = new Set();
+
+    function listen() {
+        // Cards also arrive later (infinite scroll, search)
+        list.querySelectorAll("[data-seats]").forEach((badge) => {
+            const id = badge.dataset.seats;
+            if (listening.has(id)) return;
+            listening.add(id);
+
+            source.addEventListener(`seats-${id}`, (event) => {
+                list.querySelectorAll(`[data-seats="${id}"]`).forEach((el) => {
+                    el.innerHTML = event.data;
+                });
+            });
+        });
+    }
+
+    listen();
+    document.body.addEventListener("htmx:afterSettle", listen);
+
+    // HTMX navigation to another page removes the list, and with it the stream
+    list.addEventListener("htmx:beforeCleanupElement", (event) => {
+        if (event.target !== list) return;
+        source.close();
+        document.body.removeEventListener("htmx:afterSettle", listen);
+    });
+})();
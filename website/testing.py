@@ -0,0 +1,54 @@
+import re
+
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin that fails when a view runs more queries than its budget.
+
+    Budgets are per URL name, so an N+1 that sneaks into a view fails CI
+    with the list of queries it ran.
+    """
+
+    # URL name -> max number of queries
+    query_budgets: dict[str, int] = {}
+
+    def assertQueryBudget(self, url_name, *args, method="get", data=None, budget=None, **extra):
+        budget = self.query_budgets[url_name] if budget is None else budget
+        url = reverse(url_name, args=args)
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, **extra)
+            queries = [q["sql"] for q in ctx.captured_queries]
+
+        if len(queries) > budget:
+            listing = "\n".join(f"{n}. {sql}" for n, sql in enumerate(queries, start=1))
+            self.fail(f"{url_name} ran {len(queries)} queries, its budget is {budget}:\n{listing}")
+        return response
+
+
+# Table scans in EXPLAIN output. SQLite's "SCAN t USING INDEX i" walks an
+# index in order and is not a table scan.
+_SEQ_SCAN = {
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+    "sqlite": re.compile(r"\bSCAN (\w+)\b(?! USING (?:COVERING )?INDEX)(?! USING INTEGER PRIMARY KEY)"),
+}
+
+
+def seq_scans(queryset) -> list[str]:
+    """Tables the database would read in full to run `queryset`."""
+    pattern = _SEQ_SCAN.get(connections[queryset.db].vendor)
+    if pattern is None:
+        return []
+    return pattern.findall(queryset.explain())
+
+
+class QueryPlanMixin:
+    """TestCase mixin that fails when a queryset's plan reads a whole table."""
+
+    def assertNoSeqScan(self, queryset, label=""):
+        tables = seq_scans(queryset)
+        if tables:
+            self.fail(f"{label or queryset.model.__name__} scans {', '.join(tables)}:\n{queryset.explain()}")
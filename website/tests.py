@@ -1,8 +1,51 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
-from website.models import Timeslot, Booking
-from django.contrib.auth import get_user_model
+from PIL import Image
+
+from config.db_router import PIN_COOKIE, ReplicaStickinessMiddleware, use_primary
+from website import exports, fragment_cache, images, imports, live, metrics, partitions, staticfiles
+from website.admin import BookingInline
+from website.archive import archive_batch, booking_history
+from website.forms import TimeslotCreateForm
+from website.management.commands.bench_booking import check_invariants
+from website.models import ArchivedBooking, Booking, BookingStatus, Timeslot, TimeslotSeatShard, TimeslotStatus
+from website.pagination import EstimatedCountPaginator
+from website.recurrence import MAX_OCCURRENCES, occurrence_dates
+from website.services import book_timeslot, release_seat
+from website.testing import QueryBudgetMixin, QueryPlanMixin
+
+User = get_user_model()
+
+
+def setUpModule():
+    # Keep the per-request log lines out of the test output
+    logging.getLogger("website.requests").setLevel(logging.WARNING)
+
 
 class BookingAuthTest(TestCase):
     def test_booking_requires_login(self):
@@ -23,8 +66,6 @@ class BookingAuthTest(TestCase):
         self.assertIn("/accounts/login/", response.url)
 
 
-User = get_user_model()
-
 class BookingCapacityTest(TestCase):
     def test_timeslot_capacity_not_exceeded(self):
         user1 = User.objects.create_user(username="u1", password="test")
@@ -49,3 +90,1475 @@ class BookingCapacityTest(TestCase):
             Booking.objects.filter(timeslot=ts, status="confirmed").count(),
             1
         )
+
+
+class ConfirmedCountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="u1", password="test")
+        self.ts = Timeslot.objects.create(
+            event_name="Test Event",
+            start_at=timezone.now() + timezone.timedelta(days=1),
+            end_at=timezone.now() + timezone.timedelta(days=1, hours=1),
+            address="Test Address",
+            capacity=2,
+        )
+
+    def test_counter_follows_book_and_cancel(self):
+        self.client.login(username="u1", password="test")
+        self.client.post(reverse("timeslot_book", args=[self.ts.id]))
+        self.ts.refresh_from_db()
+        self.assertEqual(self.ts.confirmed_count, 1)
+        self.assertEqual(self.ts.free_spots(), 1)
+
+        booking = Booking.objects.get(timeslot=self.ts, user=self.user)
+        self.client.post(reverse("booking_cancel", args=[booking.id]))
+        self.ts.refresh_from_db()
+        self.assertEqual(self.ts.confirmed_count, 0)
+
+    def test_timeslot_cancel_resets_counter(self):
+        staff = User.objects.create_user(username="staff", password="test", is_staff=True)
+        Booking.objects.create(timeslot=self.ts, user=self.user)
+        Timeslot.objects.filter(pk=self.ts.pk).recount_confirmed()
+
+        self.client.force_login(staff)
+        self.client.post(reverse("timeslot_cancel", args=[self.ts.id]))
+        self.ts.refresh_from_db()
+        self.assertEqual(self.ts.confirmed_count, 0)
+
+    def test_reconcile_command_repairs_drift(self):
+        Booking.objects.create(timeslot=self.ts, user=self.user)  # bypasses the counter
+        call_command("reconcile_confirmed_counts", stdout=StringIO())
+        self.ts.refresh_from_db()
+        self.assertEqual(self.ts.confirmed_count, 1)
+
+
+class BookTimeslotServiceTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="u1", password="test")
+        self.ts = Timeslot.objects.create(
+            event_name="Test Event",
+            start_at=timezone.now() + timezone.timedelta(days=1),
+            end_at=timezone.now() + timezone.timedelta(days=1, hours=1),
+            address="Test Address",
+            capacity=1,
+        )
+
+    def assertRejected(self, code, user=None):
+        with self.assertRaises(ValidationError) as ctx:
+            book_timeslot(self.ts.id, user or self.user)
+        self.assertEqual(ctx.exception.code, code)
+
+    def test_books_and_claims_seat(self):
+        booking = book_timeslot(self.ts.id, self.user, "hi")
+        self.assertEqual(booking.message, "hi")
+        self.ts.refresh_from_db()
+        self.assertEqual(self.ts.confirmed_count, 1)
+
+    def test_duplicate_rolls_back_claim(self):
+        self.ts.capacity = 2
+        self.ts.save()
+        book_timeslot(self.ts.id, self.user)
+        self.assertRejected("duplicate")
+        self.ts.refresh_from_db()
+        self.assertEqual(self.ts.confirmed_count, 1)
+
+    def test_full(self):
+        book_timeslot(self.ts.id, User.objects.create_user(username="u2", password="test"))
+        self.assertRejected("full")
+
+    def test_closed_and_past(self):
+        Timeslot.objects.filter(pk=self.ts.pk).update(status=TimeslotStatus.HIDDEN)
+        self.assertRejected("closed")
+
+        Timeslot.objects.filter(pk=self.ts.pk).update(
+            status=TimeslotStatus.OPEN,
+            start_at=timezone.now() - timezone.timedelta(hours=2),
+            end_at=timezone.now() - timezone.timedelta(hours=1),
+        )
+        self.assertRejected("past")
+
+
+class SeatShardTest(TestCase):
+    def setUp(self):
+        self.ts = Timeslot.objects.create(
+            event_name="Big Event",
+            start_at=timezone.now() + timezone.timedelta(days=1),
+            end_at=timezone.now() + timezone.timedelta(days=1, hours=1),
+            address="Stadium",
+            capacity=10,
+            seat_shards=3,
+        )
+        self.ts.rebalance_seat_shards()
+
+    def test_rebalance_splits_capacity(self):
+        self.assertEqual(
+            sorted(self.ts.shards.values_list("capacity", flat=True)), [3, 3, 4]
+        )
+
+    def test_bookings_never_exceed_capacity(self):
+        users = [User.objects.create_user(username=f"u{i}", password="test") for i in range(12)]
+        booked = 0
+        for user in users:
+            try:
+                book_timeslot(self.ts.id, user)
+                booked += 1
+            except ValidationError as e:
+                self.assertEqual(e.code, "full")
+        self.assertEqual(booked, 10)
+        self.assertEqual(self.ts.booked_seats(), 10)
+
+        release_seat(self.ts.id)
+        self.assertEqual(self.ts.free_spots(), 1)
+
+    def test_cancel_after_the_shard_pick_wins(self):
+        def cancel(shard_ids):
+            # timeslot_cancel commits between picking the shards and claiming one
+            Timeslot.objects.filter(pk=self.ts.pk).update(status=TimeslotStatus.CANCELLED)
+            self.ts.shards.update(confirmed_count=0)
+
+        user = User.objects.create_user(username="u1", password="test")
+        with mock.patch("website.services.random.shuffle", side_effect=cancel):
+            with self.assertRaises(ValidationError) as raised:
+                book_timeslot(self.ts.id, user)
+        self.assertEqual(raised.exception.code, "closed")
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(self.ts.booked_seats(), 0)
+
+    def test_switching_modes_keeps_taken_seats(self):
+        for i in range(4):
+            book_timeslot(self.ts.id, User.objects.create_user(username=f"u{i}", password="test"))
+
+        self.ts.seat_shards = 2
+        self.ts.capacity = 6
+        self.ts.save()
+        self.ts.rebalance_seat_shards()
+        self.assertEqual(self.ts.booked_seats(), 4)
+        self.assertEqual(sum(self.ts.shards.values_list("capacity", flat=True)), 6)
+
+        self.ts.seat_shards = 0
+        self.ts.save()
+        self.ts.rebalance_seat_shards()
+        self.ts.refresh_from_db()
+        self.assertEqual(self.ts.confirmed_count, 4)
+        self.assertFalse(self.ts.shards.exists())
+
+    def test_free_spots_sum_the_shards_once(self):
+        book_timeslot(self.ts.id, User.objects.create_user(username="u", password="test"))
+        queryset = Timeslot.objects.with_free_spots()
+        self.assertEqual(str(queryset.query).count('FROM "website_timeslotseatshard"'), 1)
+        ts = queryset.get(pk=self.ts.pk)
+        self.assertEqual((ts.booked_db, ts.free_spots_db), (1, 9))
+
+    def test_shards_are_capped_by_capacity(self):
+        form = TimeslotCreateForm(data={
+            "event_name": "Big Event", "address": "Stadium", "capacity": 2, "seat_shards": 3,
+            "date": "2030-01-07", "start_time": "18:00", "end_time": "19:00",
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn("seat_shards", form.errors)
+
+        self.ts.seat_shards = 11
+        with self.assertRaises(ValidationError) as ctx:
+            self.ts.full_clean()
+        self.assertIn("seat_shards", ctx.exception.message_dict)
+
+
+class TimeslotPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def card_ids(self, response):
+        return [int(pk) for pk in re.findall(r'id="timeslot-(\d+)"', response.content.decode())]
+
+    def test_keyset_pages_cover_every_timeslot_once(self):
+        start = timezone.now() + timezone.timedelta(days=1)
+        # Pairs of slots share a start time, so the id tie-breaker matters
+        for i in range(25):
+            Timeslot.objects.create(
+                event_name=f"Event {i}",
+                start_at=start + timezone.timedelta(hours=i // 2),
+                end_at=start + timezone.timedelta(hours=i // 2 + 1),
+                address="Test Address",
+            )
+
+        response = self.client.get(reverse("timeslots"))
+        first_page = self.card_ids(response)
+        self.assertEqual(len(first_page), 20)
+        next_cursor = re.search(r"after=([\d-]+)", response.content.decode()).group(1)
+
+        response = self.client.get(reverse("timeslots_page"), {"after": next_cursor})
+        second_page = self.card_ids(response)
+        self.assertEqual(len(second_page), 5)
+        self.assertNotContains(response, 'hx-trigger="revealed"')
+        self.assertEqual(
+            set(first_page) | set(second_page),
+            set(Timeslot.objects.values_list("id", flat=True)),
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("timeslots_page"), {"after": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+
+class BookingListQueryTest(TestCase):
+    def test_list_is_one_timeslot_query_for_logged_in_users(self):
+        user = User.objects.create_user(username="u1", password="test")
+        start = timezone.now() + timezone.timedelta(days=1)
+        timeslots = [
+            Timeslot.objects.create(
+                event_name=f"Event {i}",
+                start_at=start + timezone.timedelta(hours=i),
+                end_at=start + timezone.timedelta(hours=i + 1),
+                address="Test Address",
+                capacity=5,
+            )
+            for i in range(5)
+        ]
+        booking = book_timeslot(timeslots[2].id, user)
+        self.client.force_login(user)
+
+        # ETag probe + session + user + timeslots (with the user's booking annotated)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("timeslots"))
+
+        self.assertContains(response, reverse("booking_cancel", args=[booking.id]))
+        self.assertNotContains(response, f'href="{reverse("timeslot_book", args=[timeslots[2].id])}"')
+
+
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        start = timezone.now() + timezone.timedelta(days=1)
+        self.timeslots = [
+            Timeslot.objects.create(
+                event_name=f"Event {i}",
+                start_at=start + timezone.timedelta(hours=i),
+                end_at=start + timezone.timedelta(hours=i + 1),
+                address="Test Address",
+                capacity=5,
+            )
+            for i in range(3)
+        ]
+        self.booker = User.objects.create_user(username="booker", password="test")
+        self.viewer = User.objects.create_user(username="viewer", password="test")
+
+    def test_anonymous_list_is_served_from_cache(self):
+        self.client.get(reverse("timeslots"))
+        # Only the ETag version probe
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("timeslots"))
+        self.assertContains(response, "Event 2")
+        self.assertEqual(fragment_cache.stats()["list_hits"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_timeslot(self.timeslots[0].id, self.booker)
+        response = self.client.get(reverse("timeslots"))
+        self.assertContains(response, "1/5 Plätze besetzt")
+
+    def test_booking_invalidates_only_its_card(self):
+        self.client.force_login(self.viewer)
+        self.client.get(reverse("timeslots"))
+        self.assertEqual(fragment_cache.stats()["card_misses"], 3)
+
+        book_timeslot(self.timeslots[1].id, self.booker)
+        self.client.get(reverse("timeslots"))
+        stats = fragment_cache.stats()
+        self.assertEqual(stats["card_hits"], 2)
+        self.assertEqual(stats["card_misses"], 4)
+
+    def test_cached_cards_get_the_viewers_csrf_token(self):
+        book_timeslot(self.timeslots[0].id, self.viewer)
+        self.client.force_login(self.viewer)
+        self.client.get(reverse("timeslots"))
+        response = self.client.get(reverse("timeslots"))
+        self.assertNotContains(response, fragment_cache.CSRF_PLACEHOLDER)
+        self.assertContains(response, 'name="csrfmiddlewaretoken"', count=2)  # cancel + logout
+
+
+class HtmxCardActionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        start = timezone.now() + timezone.timedelta(days=1)
+        self.ts = Timeslot.objects.create(
+            event_name="Event",
+            start_at=start,
+            end_at=start + timezone.timedelta(hours=1),
+            address="Test Address",
+            capacity=1,
+        )
+        self.user = User.objects.create_user(username="u", password="test")
+        self.client.force_login(self.user)
+
+    def test_book_returns_card_and_messages(self):
+        response = self.client.post(
+            reverse("timeslot_book", args=[self.ts.id]), HTTP_HX_REQUEST="true"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'id="timeslot-{self.ts.id}"')
+        self.assertContains(response, "Stornieren")
+        self.assertContains(response, 'hx-swap-oob="true"')
+        self.assertContains(response, "Booking created!")
+        self.assertNotContains(response, "<html")
+
+    def test_book_link_loads_the_form_into_the_card(self):
+        card = self.client.get(reverse("timeslots")).content.decode()
+        self.assertIn(f'hx-get="{reverse("timeslot_book", args=[self.ts.id])}"', card)
+        self.assertNotIn(f'hx-post="{reverse("timeslot_book", args=[self.ts.id])}"', card)
+
+        response = self.client.get(reverse("timeslot_book", args=[self.ts.id]), HTTP_HX_REQUEST="true")
+        self.assertContains(response, 'name="message"')
+        self.assertContains(response, f'hx-target="#timeslot-{self.ts.id}"')
+        self.assertNotContains(response, "<html")
+        self.assertIn("HX-Request", response["Vary"])
+        self.assertFalse(Booking.objects.exists())
+
+        response = self.client.post(
+            reverse("timeslot_book", args=[self.ts.id]), {"message": "Vegetarian"}, HTTP_HX_REQUEST="true"
+        )
+        self.assertContains(response, "Stornieren")
+        self.assertEqual(Booking.objects.get().message, "Vegetarian")
+
+    def test_cancel_returns_card(self):
+        booking = book_timeslot(self.ts.id, self.user)
+        response = self.client.post(
+            reverse("booking_cancel", args=[booking.id]), HTTP_HX_REQUEST="true"
+        )
+        self.assertContains(response, "Booking cancelled.")
+        self.assertContains(response, "Du hast storniert.")
+        self.ts.refresh_from_db()
+        self.assertEqual(self.ts.confirmed_count, 0)
+
+    def test_full_timeslot_error_is_shown_in_place(self):
+        other = User.objects.create_user(username="other", password="test")
+        book_timeslot(self.ts.id, other)
+        response = self.client.post(
+            reverse("timeslot_book", args=[self.ts.id]), HTTP_HX_REQUEST="true"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "This timeslot is fully booked.")
+        self.assertFalse(Booking.objects.filter(user=self.user).exists())
+
+
+class AdminQueryCountTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin", password="test")
+        self.client.force_login(self.admin)
+        self.users = [User.objects.create_user(username=f"u{i}", password="test") for i in range(8)]
+
+    def add_timeslots(self, n):
+        start = timezone.now() + timezone.timedelta(days=1)
+        for i in range(n):
+            ts = Timeslot.objects.create(
+                event_name=f"Event {i}",
+                start_at=start + timezone.timedelta(hours=i),
+                end_at=start + timezone.timedelta(hours=i + 1),
+                address="Test Address",
+                capacity=10,
+            )
+            for user in self.users[:4]:
+                book_timeslot(ts.id, user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelists_do_not_grow_with_rows(self):
+        self.add_timeslots(2)
+        timeslots = self.count_queries(reverse("admin:website_timeslot_changelist"))
+        bookings = self.count_queries(reverse("admin:website_booking_changelist"))
+
+        self.add_timeslots(6)
+        self.assertEqual(self.count_queries(reverse("admin:website_timeslot_changelist")), timeslots)
+        self.assertEqual(self.count_queries(reverse("admin:website_booking_changelist")), bookings)
+
+    def test_booking_count_is_one_query(self):
+        self.add_timeslots(2)
+        with self.assertNumQueries(1):
+            self.assertEqual(EstimatedCountPaginator(Booking.objects.all(), 20).count, 8)
+
+        # Beyond the limit PostgreSQL estimates, never below the rows counted so far
+        with mock.patch.object(EstimatedCountPaginator, "EXACT_COUNT_LIMIT", 5):
+            for bookings in (Booking.objects.all(), Booking.objects.filter(status=BookingStatus.CONFIRMED)):
+                count = EstimatedCountPaginator(bookings, 20).count
+                if connection.vendor == "postgresql":
+                    self.assertGreaterEqual(count, 6)
+                else:
+                    self.assertEqual(count, bookings.count())
+
+    def test_booking_inline_is_capped(self):
+        self.add_timeslots(1)
+        ts = Timeslot.objects.get()
+        for user in self.users[4:]:
+            book_timeslot(ts.id, user)
+
+        with mock.patch.object(BookingInline, "max_shown", 5):
+            response = self.client.get(reverse("admin:website_timeslot_change", args=[ts.id]))
+        formset = next(
+            f.formset for f in response.context["inline_admin_formsets"] if f.formset.model is Booking
+        )
+        self.assertEqual(formset.initial_form_count(), 5)
+
+
+class TimeslotSeriesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username="staff", password="test", is_staff=True)
+        self.client.force_login(self.staff)
+        # A Monday
+        self.first = timezone.localdate() + timezone.timedelta(days=7 - timezone.localdate().weekday())
+
+    def post_series(self, **extra):
+        data = {
+            "event_name": "Kurs",
+            "address": "Halle 1",
+            "capacity": 10,
+            "seat_shards": 0,
+            "date": self.first.isoformat(),
+            "start_time": "18:00",
+            "end_time": "19:30",
+            "frequency": "weekly",
+            "count": 10,
+        }
+        data.update(extra)
+        return self.client.post(reverse("timeslot_series_create"), data)
+
+    def test_weekly_series_is_created_in_one_insert(self):
+        skipped = self.first + timezone.timedelta(weeks=2)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post_series(skip_dates=skipped.isoformat())
+        inserts = [q for q in ctx.captured_queries if 'INSERT INTO "website_timeslot" ' in q["sql"]]
+        self.assertEqual(len(inserts), 1)
+        self.assertRedirects(response, reverse("timeslots"))
+
+        dates = [timezone.localtime(ts.start_at).date() for ts in Timeslot.objects.order_by("start_at")]
+        self.assertEqual(len(dates), 10)
+        self.assertNotIn(skipped, dates)
+        self.assertEqual(len({ts.series_id for ts in Timeslot.objects.all()}), 1)
+
+    def test_skipped_dates_do_not_count(self):
+        skipped = [self.first + timezone.timedelta(weeks=n) for n in (2, 9)]
+        self.post_series(skip_dates=" ".join(day.isoformat() for day in skipped))
+        dates = [timezone.localtime(ts.start_at).date() for ts in Timeslot.objects.order_by("start_at")]
+        self.assertEqual(len(dates), 10)
+        self.assertEqual(dates[-1], self.first + timezone.timedelta(weeks=11))
+
+        # Monday and Wednesday, the first three of them skipped
+        skip = [self.first, self.first + timezone.timedelta(days=2), self.first + timezone.timedelta(days=7)]
+        self.assertEqual(
+            occurrence_dates(self.first, "custom", ["0", "2"], count=3, skip=skip),
+            [self.first + timezone.timedelta(days=n) for n in (9, 14, 16)],
+        )
+
+    def test_series_over_the_limit_is_rejected(self):
+        response = self.post_series(
+            frequency="daily", count="", until=(self.first + timezone.timedelta(days=MAX_OCCURRENCES)).isoformat(),
+        )
+        self.assertContains(response, f"at most {MAX_OCCURRENCES} timeslots")
+        self.assertFalse(Timeslot.objects.exists())
+
+    def test_custom_days_until(self):
+        self.post_series(
+            frequency="custom", weekdays=["0", "2"], count="", seat_shards=2,
+            until=(self.first + timezone.timedelta(days=13)).isoformat(),
+        )
+        self.assertEqual(Timeslot.objects.count(), 4)
+        for ts in Timeslot.objects.all():
+            self.assertEqual(sorted(ts.shards.values_list("capacity", flat=True)), [5, 5])
+
+    def test_preview_and_conflicts_save_nothing(self):
+        response = self.client.post(
+            reverse("timeslot_series_create"),
+            {
+                "event_name": "Kurs", "address": "Halle 1", "capacity": 10, "seat_shards": 0,
+                "date": self.first.isoformat(), "start_time": "18:00", "end_time": "19:30",
+                "frequency": "daily", "count": 3, "preview": "1",
+            },
+            HTTP_HX_REQUEST="true",
+        )
+        self.assertContains(response, "3 timeslots")
+        self.assertFalse(Timeslot.objects.exists())
+
+        self.post_series(count=2)
+        response = self.post_series(frequency="daily", count=3)
+        self.assertContains(response, "Overlaps existing timeslots")
+        self.assertContains(response, "(belegt)")
+        self.assertEqual(Timeslot.objects.count(), 2)
+
+    def test_edit_this_and_following(self):
+        self.post_series(count=4)
+        slots = list(Timeslot.objects.order_by("start_at"))
+        response = self.client.post(reverse("timeslot_edit", args=[slots[1].id]), {
+            "event_name": "Kurs neu",
+            "address": "Halle 2",
+            "capacity": 12,
+            "seat_shards": 0,
+            "date": timezone.localtime(slots[1].start_at).date().isoformat(),
+            "start_time": "18:30",
+            "end_time": "20:00",
+            "scope": "following",
+        })
+        self.assertRedirects(response, reverse("timeslots"))
+
+        slots = list(Timeslot.objects.order_by("start_at"))
+        self.assertEqual(slots[0].event_name, "Kurs")
+        for ts in slots[1:]:
+            self.assertEqual((ts.event_name, ts.address, ts.capacity), ("Kurs neu", "Halle 2", 12))
+            self.assertEqual(f"{timezone.localtime(ts.start_at):%H:%M}", "18:30")
+            self.assertEqual(f"{timezone.localtime(ts.end_at):%H:%M}", "20:00")
+
+
+class ExportImportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username="staff", password="test", is_staff=True)
+        start = timezone.now() + timezone.timedelta(days=1)
+        self.ts = Timeslot.objects.create(
+            event_name="Event",
+            start_at=start,
+            end_at=start + timezone.timedelta(hours=1),
+            address="Test Address",
+            capacity=2,
+        )
+        self.alice = User.objects.create_user(username="alice", password="test")
+        book_timeslot(self.ts.id, self.alice)
+
+    def test_streaming_exports(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            reverse("data_export", args=["bookings", "csv"]), {"timeslot": self.ts.id}
+        )
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "timeslot_id", "timeslot_event_name"])
+        self.assertEqual(len(lines), 2)
+        self.assertIn("alice", lines[1])
+
+        response = self.client.get(reverse("data_export", args=["timeslots", "json"]))
+        rows = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(rows[0]["booked"], 1)
+
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse("data_export", args=["timeslots", "csv"]))
+        self.assertEqual(response.status_code, 302)
+
+    def test_import_timeslots_reports_bad_rows(self):
+        data = StringIO(
+            "event_name,start_at,end_at,address,capacity\n"
+            "Kurs,2030-01-01 10:00,2030-01-01 11:00,Halle,5\n"
+            "Kurs,2030-01-01 10:00,2030-01-01 09:00,Halle,5\n"
+            "Kurs,2030-01-01 10:00,2030-01-01 11:00,Halle,0\n"
+            "Kurs,morgen,2030-01-01 11:00,Halle,5\n"
+            "Kurs,2030-01-02 10:00,2030-01-02 11:00,Halle,7\n"
+        )
+        report = imports.import_timeslots(imports.read_rows(data, "csv"), batch_size=1)
+        self.assertEqual(report.created, 2)
+        self.assertEqual([line for line, _ in report.errors], [3, 4, 5])
+        self.assertEqual(Timeslot.objects.filter(address="Halle").count(), 2)
+
+    def test_import_bookings_respects_seats(self):
+        bob = User.objects.create_user(username="bob", password="test")
+        User.objects.create_user(username="carol", password="test")
+        rows = [
+            {"timeslot_id": self.ts.id, "username": "alice"},
+            {"timeslot_id": self.ts.id, "username": "bob"},
+            {"timeslot_id": self.ts.id, "username": "carol"},
+            {"timeslot_id": self.ts.id, "username": "nobody"},
+            {"timeslot_id": self.ts.id, "username": "carol", "status": "cancelled"},
+        ]
+        report = imports.import_bookings(imports.read_rows(StringIO(json.dumps(rows)), "json"))
+        self.assertEqual(report.created, 2)
+        self.assertEqual(
+            [message for _, message in report.errors],
+            [
+                f"alice already booked timeslot {self.ts.id}.",
+                f"Timeslot {self.ts.id} is fully booked.",
+                "Unknown user 'nobody'.",
+            ],
+        )
+        self.ts.refresh_from_db()
+        self.assertEqual(self.ts.confirmed_count, 2)
+        self.assertTrue(Booking.objects.filter(user=bob, status=BookingStatus.CONFIRMED).exists())
+
+    def test_import_bookings_only_into_open_timeslots(self):
+        bob = User.objects.create_user(username="bob", password="test")
+        start = timezone.now() - timezone.timedelta(days=1)
+        ended = Timeslot.objects.create(
+            event_name="Event", start_at=start, end_at=start + timezone.timedelta(hours=1), address="Test Address",
+        )
+        Timeslot.objects.filter(pk=self.ts.pk).update(status=TimeslotStatus.CANCELLED)
+        report = imports.import_bookings([
+            (2, {"timeslot_id": self.ts.id, "username": "bob"}),
+            (3, {"timeslot_id": ended.id, "username": "bob"}),
+            (4, {"timeslot_id": ended.id, "username": "bob", "status": "cancelled"}),
+        ])
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.errors, [
+            (2, f"Timeslot {self.ts.id} is not open for booking."),
+            (3, f"Timeslot {ended.id} is in the past."),
+        ])
+        self.assertFalse(Booking.objects.filter(user=bob, status=BookingStatus.CONFIRMED).exists())
+
+    def test_json_is_read_item_by_item(self):
+        rows = [{"username": "ä" * 10, "n": 12345}, [], 678, {"nested": {"list": [1, 2]}}]
+        data = StringIO(" [ " + " , ".join(json.dumps(row) for row in rows) + " ]\n")
+        with mock.patch.object(imports, "JSON_CHUNK_SIZE", 5):
+            self.assertEqual(
+                list(imports.read_rows(data, "json")),
+                [(1, rows[0]), (2, {}), (3, {}), (4, rows[3])],
+            )
+        for broken in ("{}", "[{}", "[{} {}]"):
+            with self.assertRaises(ValueError):
+                list(imports.read_rows(StringIO(broken), "json"))
+
+
+class BenchInvariantsTest(TestCase):
+    def test_over_capacity_and_drift_are_reported(self):
+        start = timezone.now() + timezone.timedelta(days=1)
+        ts = Timeslot.objects.create(
+            event_name="Event",
+            start_at=start,
+            end_at=start + timezone.timedelta(hours=1),
+            address="Test Address",
+            capacity=1,
+        )
+        self.assertEqual(
+            check_invariants([ts.id]),
+            {"over_capacity": [], "counter_drift": [], "booked_after_cancel": []},
+        )
+        # Bypasses the seat counter on purpose
+        for name in ("a", "b"):
+            Booking.objects.create(timeslot=ts, user=User.objects.create_user(username=name))
+        broken = check_invariants([ts.id])
+        self.assertEqual(broken["over_capacity"], [ts.id])
+        self.assertEqual(broken["counter_drift"], [ts.id])
+
+
+class RequestMetricsTest(QueryBudgetMixin, TestCase):
+    query_budgets = {
+        # Session, user and the ETag probe are three of them
+        "timeslots": 4,
+        # ... plus the paginator's COUNT
+        "my_bookings": 5,
+        "admin:website_timeslot_changelist": 7,
+        # The count is one query on every database, see EstimatedCountPaginator
+        "admin:website_booking_changelist": 4,
+    }
+
+    def setUp(self):
+        cache.clear()
+        start = timezone.now() + timezone.timedelta(days=1)
+        self.users = [User.objects.create_user(username=f"u{i}", password="test") for i in range(5)]
+        for i in range(5):
+            ts = Timeslot.objects.create(
+                event_name=f"Event {i}",
+                start_at=start + timezone.timedelta(hours=i),
+                end_at=start + timezone.timedelta(hours=i + 1),
+                address="Test Address",
+                capacity=10,
+            )
+            for user in self.users:
+                book_timeslot(ts.id, user)
+
+    def test_server_timing_and_log_line(self):
+        self.client.force_login(self.users[0])
+        with self.assertLogs("website.requests", "INFO") as logs:
+            response = self.client.get(reverse("timeslots"))
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, view;dur=[\d.]+$',
+        )
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line["url_name"], "timeslots")
+        self.assertEqual(line["status"], 200)
+        self.assertGreater(line["queries"], 0)
+        self.assertGreater(line["template_ms"], 0)
+
+    def test_query_budgets(self):
+        self.client.force_login(self.users[0])
+        self.assertQueryBudget("timeslots")
+        self.assertQueryBudget("my_bookings")
+
+        self.client.force_login(User.objects.create_superuser(username="admin", password="test"))
+        self.assertQueryBudget("admin:website_timeslot_changelist")
+        self.assertQueryBudget("admin:website_booking_changelist")
+
+        # Same budget once the bookings are estimated instead of counted
+        with mock.patch.object(EstimatedCountPaginator, "EXACT_COUNT_LIMIT", 10):
+            self.assertQueryBudget("admin:website_booking_changelist")
+
+
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        settings_override = override_settings(METRICS_DIR=self.dir, METRICS_TOKEN="secret")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        metrics.REGISTRY.reset()
+
+        self.ts = Timeslot.objects.create(
+            event_name="Test Event",
+            start_at=timezone.now() + timezone.timedelta(days=1),
+            end_at=timezone.now() + timezone.timedelta(days=1, hours=1),
+            address="Test Address",
+            capacity=1,
+        )
+        self.staff = User.objects.create_user(username="staff", password="test", is_staff=True)
+
+    def scrape(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        return response.content.decode()
+
+    def test_booking_counters_and_lock_wait(self):
+        book_timeslot(self.ts.id, User.objects.create_user(username="u1", password="test"))
+        with self.assertRaises(ValidationError):
+            book_timeslot(self.ts.id, User.objects.create_user(username="u2", password="test"))
+
+        body = self.scrape()
+        self.assertIn("booking_bookings_created_total 1\n", body)
+        self.assertIn('booking_bookings_rejected_total{reason="full"} 1\n', body)
+        self.assertIn('booking_lock_wait_seconds_bucket{view="timeslot_book",le="+Inf"} 2\n', body)
+        self.assertIn('booking_lock_wait_seconds_count{view="timeslot_book"} 2\n', body)
+
+    def test_request_latency_recorded(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse("timeslots"))
+        body = self.scrape()
+        self.assertIn('http_request_duration_seconds_count{view="timeslots"} 1\n', body)
+        self.assertRegex(body, r'db_queries_total\{view="timeslots"\} [1-9]')
+
+    def test_other_processes_are_added(self):
+        metrics.bookings_created.inc()
+        with open(os.path.join(self.dir, "999999.json"), "w") as f:
+            json.dump({"booking_bookings_created_total": {"{}": 5}}, f)
+        self.assertIn("booking_bookings_created_total 6\n", self.scrape())
+
+    def test_flush_writes_own_file(self):
+        metrics.bookings_cancelled.inc(by="user")
+        metrics.REGISTRY.flush()
+        with open(os.path.join(self.dir, f"{os.getpid()}.json")) as f:
+            data = json.load(f)
+        self.assertEqual(data["booking_bookings_cancelled_total"], {'{"by": "user"}': 1})
+
+    def test_access(self):
+        # Prometheus' default path, no trailing slash
+        url = reverse("metrics")
+        self.assertEqual(url, "/metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user(username="u1", password="test"))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTest(SimpleTestCase):
+    # SimpleTestCase: no transaction around the test, which would pin reads to the primary
+
+    def call(self, view, cookies=None, method="get"):
+        request = getattr(RequestFactory(), method)("/")
+        request.COOKIES.update(cookies or {})
+        return ReplicaStickinessMiddleware(view)(request)
+
+    def test_reads_go_to_replica_writes_to_primary(self):
+        self.assertEqual(Timeslot.objects.all().db, "replica")
+        self.assertEqual(Timeslot.objects.select_for_update().db, "default")
+        with use_primary():
+            self.assertEqual(Timeslot.objects.all().db, "default")
+
+    def test_reads_after_write_stick_to_primary(self):
+        seen = []
+
+        def view(request):
+            seen.append(Booking.objects.all().db)
+            seen.append(Booking.objects.select_for_update().db)  # a write
+            seen.append(Booking.objects.all().db)
+            return HttpResponse()
+
+        response = self.call(view, method="post")
+        self.assertEqual(seen, ["replica", "default", "default"])
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 5)
+
+        # The next request of that user reads from the primary, others don't
+        seen.clear()
+        self.call(lambda request: seen.append(Timeslot.objects.all().db) or HttpResponse(), {PIN_COOKIE: "1"})
+        response = self.call(lambda request: seen.append(Timeslot.objects.all().db) or HttpResponse())
+        self.assertEqual(seen, ["default", "replica"])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class QueryPlanTest(QueryPlanMixin, TestCase):
+    """The hot querysets must be served by indexes, not by reading whole tables."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Mostly past timeslots and cancelled bookings, like a long-running site
+        now = timezone.now()
+        timeslots = Timeslot.objects.bulk_create(
+            Timeslot(
+                event_name=f"Event {i}",
+                start_at=now + timezone.timedelta(hours=i - 1800),
+                end_at=now + timezone.timedelta(hours=i - 1799),
+                address="Test Address",
+                capacity=50,
+                status=TimeslotStatus.OPEN if i % 10 else TimeslotStatus.HIDDEN,
+            )
+            for i in range(2000)
+        )
+        # A quarter of them sharded, so the seat counts have shard rows to look up
+        TimeslotSeatShard.objects.bulk_create(
+            TimeslotSeatShard(timeslot=ts, index=index, capacity=5)
+            for ts in timeslots[::4]
+            for index in range(10)
+        )
+        Timeslot.objects.filter(pk__in=[ts.pk for ts in timeslots[::4]]).update(seat_shards=10)
+        # About ten bookings per user
+        cls.users = User.objects.bulk_create(User(username=f"u{i}") for i in range(1000))
+        Booking.objects.bulk_create(
+            Booking(
+                timeslot=timeslots[(i * 7) % len(timeslots)],
+                timeslot_start_at=timeslots[(i * 7) % len(timeslots)].start_at,
+                user=cls.users[i % len(cls.users)],
+                # (timeslot, user) pairs repeat every 2000 rows, only the first round confirms
+                status=BookingStatus.CONFIRMED if i < 2000 and i % 2 else BookingStatus.CANCELLED,
+            )
+            for i in range(10000)
+        )
+        Timeslot.objects.recount_confirmed()
+        # Bookings of timeslots that ended a week ago went to the archive
+        while archive_batch(now - timezone.timedelta(days=7)):
+            pass
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def test_hot_querysets_use_indexes(self):
+        user = self.users[0]
+        open_page = Timeslot.objects.future().filter(status=TimeslotStatus.OPEN).order_by("start_at", "id")
+        querysets = {
+            "booking list": open_page.with_user_booking(user)[:13],
+            "booking list (staff)": Timeslot.objects.future().order_by("start_at", "id")[:13],
+            "my_bookings": booking_history(user, "upcoming")[:20],
+            "my_bookings (past)": booking_history(user, "past")[:20],
+            "my_bookings (cancelled)": booking_history(user, "cancelled")[:20],
+            "confirmed bookings of a timeslot": Booking.objects.filter(
+                timeslot_id=open_page[0].pk, status=BookingStatus.CONFIRMED
+            ),
+            "seat recount": Timeslot.objects.filter(pk=open_page[0].pk).with_counted_bookings(),
+        }
+        for label, queryset in querysets.items():
+            with self.subTest(label):
+                self.assertNoSeqScan(queryset, label)
+
+
+class BookingArchiveTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.user = User.objects.create_user(username="u1", password="test")
+        other = User.objects.create_user(username="u2")
+        self.past, self.future = (
+            Timeslot.objects.create(
+                event_name=name,
+                start_at=now + timezone.timedelta(days=days),
+                end_at=now + timezone.timedelta(days=days, hours=1),
+                address="Test Address",
+                capacity=5,
+            )
+            for name, days in (("Past Event", -10), ("Future Event", 1))
+        )
+        # Created directly, booking a finished timeslot is refused
+        self.archived_ids = {
+            Booking.objects.create(timeslot=self.past, user=self.user).pk,
+            Booking.objects.create(timeslot=self.past, user=other).pk,
+            Booking.objects.create(
+                timeslot=self.past, user=other, status=BookingStatus.CANCELLED, cancelled_at=now
+            ).pk,
+        }
+        Timeslot.objects.recount_confirmed()
+        self.upcoming = book_timeslot(self.future.id, self.user)
+
+    def test_moves_bookings_of_finished_timeslots(self):
+        out = StringIO()
+        call_command("archive_bookings", days=7, batch_size=2, stdout=out)
+        self.assertIn("Archived 3 booking(s) in 2 batch(es).", out.getvalue())
+
+        self.assertEqual(list(Booking.objects.values_list("pk", flat=True)), [self.upcoming.pk])
+        self.assertEqual(set(ArchivedBooking.objects.values_list("pk", flat=True)), self.archived_ids)
+        # The seat counts still see the archived bookings
+        out = StringIO()
+        call_command("reconcile_confirmed_counts", stdout=out)
+        self.assertIn("All confirmed counters match.", out.getvalue())
+        _, rows = exports.export_rows("bookings", timeslot_id=self.past.id)
+        self.assertEqual({row[0] for row in rows}, self.archived_ids)
+
+        call_command("archive_bookings", days=0, stdout=out)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_tabs_read_live_and_archived_bookings(self):
+        call_command("archive_bookings", days=7, stdout=StringIO())
+        Booking.objects.create(
+            timeslot=self.future, user=self.user, status=BookingStatus.CANCELLED, cancelled_at=timezone.now()
+        )
+        self.client.force_login(self.user)
+
+        def events(tab):
+            response = self.client.get(reverse("my_bookings"), {"tab": tab})
+            return [row["event_name"] for row in response.context["page"]]
+
+        self.assertEqual(events("upcoming"), ["Future Event"])
+        self.assertEqual(events("past"), ["Past Event"])
+        self.assertEqual(events("cancelled"), ["Future Event"])
+        self.assertEqual(events("nope"), ["Future Event"])
+
+    def test_pagination(self):
+        start = timezone.now() + timezone.timedelta(days=2)
+        for i in range(25):
+            ts = Timeslot.objects.create(
+                event_name=f"Event {i}",
+                start_at=start + timezone.timedelta(hours=i),
+                end_at=start + timezone.timedelta(hours=i + 1),
+                address="Test Address",
+                capacity=5,
+            )
+            book_timeslot(ts.id, self.user)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("my_bookings"), {"page": 2})
+        self.assertEqual(len(response.context["page"]), 6)
+        self.assertContains(response, "Seite 2 von 2")
+        self.assertContains(response, "?tab=upcoming&amp;page=1")
+
+
+class BookingPartitionKeyTest(TestCase):
+    def setUp(self):
+        start = timezone.now() + timezone.timedelta(days=1)
+        self.user = User.objects.create_user(username="u1")
+        self.ts = Timeslot.objects.create(
+            event_name="Event",
+            start_at=start,
+            end_at=start + timezone.timedelta(hours=1),
+            address="Test Address",
+            capacity=5,
+        )
+
+    def start_ats(self):
+        return set(Booking.objects.values_list("timeslot_start_at", flat=True))
+
+    def test_bookings_copy_and_follow_the_timeslot_start(self):
+        booking = book_timeslot(self.ts.id, self.user)
+        # Saved without the timeslot loaded, the instance still holds the value
+        self.assertEqual(booking.timeslot_start_at, self.ts.start_at)
+        imports.import_bookings([(2, {"timeslot_id": str(self.ts.id), "username": "u1", "status": "cancelled"})])
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertEqual(self.start_ats(), {self.ts.start_at})
+
+        # Moved by the trigger, however the timeslot is updated
+        self.ts.start_at += timezone.timedelta(hours=2)
+        self.ts.end_at += timezone.timedelta(hours=2)
+        self.ts.save()
+        self.assertEqual(self.start_ats(), {self.ts.start_at})
+        Timeslot.objects.filter(pk=self.ts.pk).update(start_at=F("start_at") - timezone.timedelta(minutes=30))
+        self.ts.refresh_from_db()
+        self.assertEqual(self.start_ats(), {self.ts.start_at})
+        self.assertEqual(Timeslot.objects.with_counted_bookings().get().counted_bookings, 1)
+
+    def test_months(self):
+        december = partitions.month_start(datetime(2026, 12, 31, 23, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitions.add_months(december, 1), datetime(2027, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitions.add_months(december, -12), datetime(2025, 12, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partitions.partition_name(december), "website_booking_p202612")
+
+    @skipUnless(connection.vendor == "sqlite", "The SQLite trigger")
+    def test_trigger_is_back_after_a_table_rebuild(self):
+        book_timeslot(self.ts.id, self.user)
+        # What SQLite does to the triggers of a table a migration rebuilds
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER website_timeslot_start_at_trg")
+        call_command("migrate", verbosity=0)
+
+        Timeslot.objects.filter(pk=self.ts.pk).update(start_at=F("start_at") - timezone.timedelta(hours=1))
+        self.ts.refresh_from_db()
+        self.assertEqual(self.start_ats(), {self.ts.start_at})
+
+    @skipIf(connection.vendor == "postgresql", "PostgreSQL partitions the bookings")
+    def test_partition_command_needs_postgresql(self):
+        with self.assertRaisesMessage(CommandError, "website_booking is not partitioned"):
+            call_command("booking_partitions", stdout=StringIO())
+
+    @skipUnless(connection.vendor == "postgresql", "Partitioning needs PostgreSQL")
+    def test_partition_command_creates_and_drops_months(self):
+        start = timezone.now() - timezone.timedelta(days=100)
+        old = Timeslot.objects.create(
+            event_name="Old Event",
+            start_at=start,
+            end_at=start + timezone.timedelta(hours=1),
+            address="Test Address",
+            capacity=5,
+            confirmed_count=1,
+        )
+        Booking.objects.create(timeslot=old, user=self.user)
+        book_timeslot(self.ts.id, self.user)
+        old_name = partitions.partition_name(partitions.month_start(old.start_at))
+        new_name = partitions.partition_name(partitions.month_start(self.ts.start_at))
+
+        out = StringIO()
+        call_command("booking_partitions", ahead=0, stdout=out)
+        self.assertIn(f"Created {old_name} (1 bookings moved from the default partition)", out.getvalue())
+        self.assertIn(f"Created {new_name} (1 bookings moved from the default partition)", out.getvalue())
+        self.assertEqual(partitions.partition_rows(partitions.DEFAULT), 0)
+        self.assertEqual(partitions.partition_rows(old_name), 1)
+        # Pruned to the month's partition
+        plan = Booking.objects.filter(timeslot_start_at__gte=self.ts.start_at).explain()
+        self.assertIn(new_name, plan)
+        self.assertNotIn(old_name, plan)
+
+        err = StringIO()
+        call_command("booking_partitions", ahead=0, retention=1, stdout=StringIO(), stderr=err)
+        self.assertIn(f"Kept {old_name}: 1 bookings", err.getvalue())
+        call_command("booking_partitions", ahead=0, retention=1, force=True, stdout=out)
+        # Its seat went with the booking
+        self.assertIn(f"Dropped {old_name} (1 bookings), recounted the seats of 1 timeslots", out.getvalue())
+        old.refresh_from_db()
+        self.assertEqual(old.confirmed_count, 0)
+        self.assertNotIn(old_name, partitions.partitions().values())
+        self.assertEqual(list(Booking.objects.values_list("timeslot_id", flat=True)), [self.ts.id])
+
+
+class SeedBookingsTest(TestCase):
+    def seed(self, prefix):
+        call_command(
+            "seed_bookings", users=30, timeslots=20, bookings=300, capacity=(20, 40),
+            prefix=prefix, seed=7, stdout=StringIO(),
+        )
+        return list(
+            Timeslot.objects.filter(bookings__user__username__startswith=f"{prefix}-").distinct()
+            .order_by("pk").values_list("capacity", "confirmed_count", "status")
+        )
+
+    def test_respects_constraints_and_is_reproducible(self):
+        first = self.seed("a")
+        timeslot_ids = list(Timeslot.objects.values_list("pk", flat=True))
+        self.assertEqual(check_invariants(timeslot_ids), {
+            "over_capacity": [], "counter_drift": [], "booked_after_cancel": [],
+        })
+        self.assertEqual(Booking.objects.count(), 300)
+        self.assertTrue(Timeslot.objects.filter(end_at__lt=timezone.now()).exists())
+        self.assertTrue(Timeslot.objects.filter(start_at__gt=timezone.now()).exists())
+
+        self.assertEqual(self.seed("b"), first)
+
+    def test_refuses_existing_prefix(self):
+        User.objects.create_user(username="seed-0")
+        with self.assertRaisesMessage(CommandError, "pick another --prefix"):
+            call_command("seed_bookings", users=1, timeslots=1, bookings=1, stdout=StringIO())
+
+
+class BenchPagesTest(TestCase):
+    @override_settings(ALLOWED_HOSTS=["localhost"])
+    def test_table_thresholds_and_cleanup(self):
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, "my_bookings at 3 timeslots: 4 queries"):
+            call_command(
+                "bench_pages", scales=[2, 3], users=5, repeat=1, warmup=0, max_queries=3,
+                stdout=out, stderr=StringIO(),
+            )
+        self.assertRegex(out.getvalue(), r"\nqueries\s+2\s+3\n")
+        self.assertIn("admin bookings", out.getvalue())
+        self.assertFalse(Timeslot.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+
+class TimeslotSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        start = timezone.now() + timezone.timedelta(days=1)
+        for i, (name, description, address) in enumerate([
+            ("Yoga am Morgen", "Sanfter Start in den Tag", "Hauptstraße 1"),
+            ("Kochkurs", "Italienische Pasta", "Marktplatz 3"),
+            ("Vortrag", "Geschichte der Stadt", "Rathaus, Hauptstraße 5"),
+        ]):
+            Timeslot.objects.create(
+                event_name=name,
+                event_description=description,
+                start_at=start + timezone.timedelta(hours=i),
+                end_at=start + timezone.timedelta(hours=i + 1),
+                address=address,
+                capacity=5,
+            )
+
+    def search(self, q):
+        response = self.client.get(reverse("timeslot_search"), {"q": q}, HTTP_HX_REQUEST="true")
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_matches_name_description_and_address(self):
+        html = self.search("pasta")
+        self.assertIn("Kochkurs", html)
+        self.assertNotIn("Yoga am Morgen", html)
+        self.assertNotIn("<html", html)
+
+        html = self.search("hauptstraße")
+        self.assertIn("Yoga am Morgen", html)
+        self.assertIn("Vortrag", html)
+        self.assertNotIn("Kochkurs", html)
+
+        self.assertIn("Keine Treffer", self.search("Tango"))
+
+    def test_search_results_are_not_cached_for_anonymous(self):
+        self.search("pasta")
+        html = self.client.get(reverse("timeslots")).content.decode()
+        self.assertIn("Yoga am Morgen", html)
+        self.assertIn("Kochkurs", html)
+
+    def test_next_page_keeps_query(self):
+        with mock.patch("website.views.TIMESLOT_PAGE_SIZE", 1):
+            html = self.search("hauptstraße")
+        self.assertIn("&amp;q=hauptstra%C3%9Fe", html)
+
+    def test_admin_uses_same_search(self):
+        self.client.force_login(User.objects.create_superuser(username="admin", password="test"))
+        response = self.client.get(reverse("admin:website_timeslot_changelist"), {"q": "pasta"})
+        self.assertEqual(response.context["cl"].result_count, 1)
+
+
+@skipUnless(connection.vendor == "postgresql", "Row locks need PostgreSQL")
+class ShardedBookingLockTest(TransactionTestCase):
+    def test_timeslot_stays_locked_until_the_booking_commits(self):
+        ts = Timeslot.objects.create(
+            event_name="Big Event",
+            start_at=timezone.now() + timezone.timedelta(days=1),
+            end_at=timezone.now() + timezone.timedelta(days=1, hours=1),
+            address="Stadium",
+            capacity=10,
+            seat_shards=2,
+        )
+        with transaction.atomic():
+            ts.rebalance_seat_shards()
+        user = User.objects.create_user(username="u1", password="test")
+
+        # timeslot_cancel and moves can't get the row before the booking commits
+        other = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            with transaction.atomic():
+                booking = book_timeslot(ts.id, user)
+                with other.cursor() as cursor, self.assertRaises(OperationalError):
+                    cursor.execute("SELECT 1 FROM website_timeslot WHERE id = %s FOR UPDATE NOWAIT", [ts.id])
+        finally:
+            other.close()
+        self.assertEqual(booking.timeslot_start_at, ts.start_at)
+        self.assertEqual(ts.booked_seats(), 1)
+
+
+class LiveSeatsTest(TransactionTestCase):
+    # Commits for real: PostgreSQL only delivers a NOTIFY when its transaction commits
+
+    def setUp(self):
+        self.ts = Timeslot.objects.create(
+            event_name="Test Event",
+            start_at=timezone.now() + timezone.timedelta(days=1),
+            end_at=timezone.now() + timezone.timedelta(days=1, hours=1),
+            address="Test Address",
+            capacity=5,
+        )
+        self.user = User.objects.create_user(username="u1", password="test")
+
+    def tearDown(self):
+        # The listener disconnects within one poll once its last stream is gone
+        if live._listener is not None:
+            live._listener.join(10)
+
+    def wait_for_listener(self):
+        for _ in range(100):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM pg_stat_activity WHERE application_name = %s AND query = %s",
+                    [live.LISTENER_NAME, f"LISTEN {live.CHANNEL}"],
+                )
+                if cursor.fetchone():
+                    return
+            time.sleep(0.05)
+        self.fail("The seat listener didn't connect.")
+
+    def book_and_cancel(self):
+        book_timeslot(self.ts.id, self.user)
+        self.client.force_login(User.objects.create_user(username="staff", password="test", is_staff=True))
+        self.client.post(reverse("timeslot_cancel", args=[self.ts.id]))
+
+    async def test_stream_pushes_seat_badges(self):
+        response = await self.async_client.get(reverse("timeslot_events"))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 5000\n\n")
+        if connection.vendor == "postgresql":
+            await sync_to_async(self.wait_for_listener)()
+
+        await sync_to_async(self.book_and_cancel)()
+        booked = (await asyncio.wait_for(anext(stream), 5)).decode()
+        self.assertTrue(booked.startswith(f"event: seats-{self.ts.id}\ndata: "))
+        self.assertIn("1/5 Plätze besetzt", booked)
+        self.assertTrue(booked.endswith("\n\n"))
+        cancelled = (await asyncio.wait_for(anext(stream), 5)).decode()
+        self.assertIn("Abgesagt", cancelled)
+
+        # The ASGI handler cancels the stream when the browser goes away
+        reader = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+        self.assertFalse(live.BROKER._subscribers)
+
+    def test_nothing_is_read_without_streams(self):
+        # PostgreSQL can't tell from here whether another process listens, it asks in the one statement
+        with self.assertNumQueries(1 if connection.vendor == "postgresql" else 0):
+            live.publish(self.ts.id)
+
+    def test_wsgi_gets_no_stream(self):
+        self.assertEqual(self.client.get(reverse("timeslot_events")).status_code, 204)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        start = timezone.now() + timezone.timedelta(days=1)
+        self.timeslots = [
+            Timeslot.objects.create(
+                event_name=f"Event {i}",
+                start_at=start + timezone.timedelta(hours=i),
+                end_at=start + timezone.timedelta(hours=i + 1),
+                address="Test Address",
+                capacity=5,
+                seat_shards=2 * i,
+            )
+            for i in range(2)
+        ]
+        self.timeslots[1].rebalance_seat_shards()
+        self.user = User.objects.create_user(username="u1", password="test")
+        self.other = User.objects.create_user(username="u2", password="test")
+
+    def assertRevalidated(self, url, etag):
+        # The probe and the session/user lookups, not the page's own queries
+        with self.assertNumQueries(3):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_unchanged_pages_are_not_modified(self):
+        self.client.force_login(self.user)
+        for url in (reverse("timeslots"), reverse("my_bookings"), reverse("timeslot_book", args=[self.timeslots[0].id])):
+            response = self.client.get(url)
+            self.assertTrue(response["ETag"].startswith('"'))
+            self.assertIn("no-cache", response["Cache-Control"])
+            self.assertIn("private", response["Cache-Control"])
+            self.assertRevalidated(url, response["ETag"])
+
+    def test_new_login_gets_the_new_csrf_token(self):
+        browser = Client(enforce_csrf_checks=True)
+        browser.force_login(self.user)
+        url = reverse("timeslots")
+        etag = browser.get(url)["ETag"]
+
+        # Logging in again (same user) rotates the CSRF token
+        token = str(browser.get(reverse("accounts:login")).context["csrf_token"])
+        browser.post(reverse("accounts:login"), {"username": "u1", "password": "test", "csrfmiddlewaretoken": token})
+        response = browser.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        token = re.search(r'"X-CSRFToken": "(\w+)"', response.content.decode())[1]
+        response = browser.post(
+            reverse("timeslot_book", args=[self.timeslots[0].id]), {"message": ""}, HTTP_X_CSRFTOKEN=token
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_bookings_and_cancellations_change_the_etag(self):
+        self.client.force_login(self.user)
+        other = Client()
+        other.force_login(self.other)
+        url = reverse("timeslots")
+        etags = [self.client.get(url)["ETag"]]
+        for ts in self.timeslots:
+            # The single-counter timeslot and the sharded one
+            booking = book_timeslot(ts.id, self.other)
+            etags.append(self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1])["ETag"])
+            other.post(reverse("booking_cancel", args=[booking.id]))
+            etags.append(self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1])["ETag"])
+        self.assertEqual(len(set(etags)), 5)
+
+    def test_etag_depends_on_viewer_and_messages(self):
+        url = reverse("timeslots")
+        anonymous = self.client.get(url)["ETag"]
+        self.client.force_login(self.user)
+        user = self.client.get(url)["ETag"]
+        self.client.force_login(self.other)
+        self.assertEqual(len({anonymous, user, self.client.get(url)["ETag"]}), 3)
+
+        # A flash message is rendered, not answered with 304
+        self.client.post(reverse("timeslot_book", args=[self.timeslots[0].id]), {"message": ""})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=user)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+        self.assertContains(response, "Booking created!")
+
+
+class StaticFilesTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        cls.root = directory.name
+        cls.enterClassContext(override_settings(STATIC_ROOT=cls.root, ALLOWED_HOSTS=["localhost"]))
+        call_command("collectstatic", interactive=False, verbosity=0)
+        cls.css = staticfiles_storage.url("css/tailwind.css")
+
+    def get(self, url, **headers):
+        response = Client(SERVER_NAME="localhost").get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_templates_link_hashed_files(self):
+        self.assertRegex(self.css, r"^/static/css/tailwind\.[0-9a-f]{12}\.css$")
+        html = render_to_string("base.html")
+        self.assertIn(self.css, html)
+        # The official build, until it is vendored unchanged
+        self.assertIn('src="https://unpkg.com/htmx.org@1.9.12"', html)
+
+    def test_precompressed_and_immutable(self):
+        with open(os.path.join(self.root, "css", "tailwind.css"), "rb") as f:
+            original = f.read()
+
+        response = self.get(self.css, HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+        body = b"".join(response.streaming_content)
+        if staticfiles.brotli is not None:
+            self.assertEqual(response["Content-Encoding"], "br")
+            self.assertEqual(staticfiles.brotli.decompress(body), original)
+        else:
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertEqual(gzip.decompress(body), original)
+        self.assertLess(len(body), len(original) / 4)
+        self.assertEqual(response["Content-Type"], "text/css")
+        self.assertEqual(response["Cache-Control"], staticfiles.IMMUTABLE)
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+        response = self.get(self.css, HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(b"".join(response.streaming_content), original)
+
+    def test_unhashed_names_are_cached_briefly(self):
+        response = self.get("/static/css/tailwind.css")
+        self.assertEqual(response["Cache-Control"], staticfiles.SHORT)
+
+    def test_unknown_files_fall_through(self):
+        client = Client(SERVER_NAME="localhost")
+        self.assertEqual(client.get("/static/css/missing.css").status_code, 404)
+        self.assertEqual(client.get("/static/../manage.py").status_code, 404)
+
+
+class ResponsiveImagesTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source = os.path.join(directory.name, "src")
+        self.output = os.path.join(directory.name, "img")
+        os.makedirs(os.path.join(self.source, "hero"))
+        Image.new("RGB", (2000, 1000), "teal").save(os.path.join(self.source, "hero", "a-lake.jpg"))
+        Image.new("RGB", (600, 300), "orange").save(os.path.join(self.source, "hero", "b-small.png"))
+        call_command(
+            "build_images", source=self.source, output=self.output, widths=[480, 1600],
+            formats=["webp", "jpg"], stdout=StringIO(),
+        )
+        patcher = mock.patch("website.images.MANIFEST", os.path.join(self.output, "manifest.json"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_variants_are_cropped_and_never_enlarged(self):
+        self.assertEqual(sorted(os.listdir(os.path.join(self.output, "hero"))), [
+            "a-lake-1600.jpg", "a-lake-1600.webp", "a-lake-480.jpg", "a-lake-480.webp",
+            "b-small-480.jpg", "b-small-480.webp", "b-small-600.jpg", "b-small-600.webp",
+        ])
+        with Image.open(os.path.join(self.output, "hero", "a-lake-1600.webp")) as image:
+            self.assertEqual(image.size, (1600, 640))
+
+        slides = images.slides("hero")
+        self.assertEqual([(s["width"], s["height"]) for s in slides], [(2000, 800), (600, 240)])
+        self.assertEqual(slides[0]["sources"], [{
+            "type": "image/webp",
+            "srcset": "/static/img/hero/a-lake-480.webp 480w, /static/img/hero/a-lake-1600.webp 1600w",
+        }])
+        self.assertEqual(slides[0]["src"], "/static/img/hero/a-lake-1600.jpg")
+
+    def test_only_the_first_slide_loads_with_the_page(self):
+        html = self.client.get(reverse("home")).content.decode()
+        self.assertNotIn("picsum.photos", html)
+        self.assertEqual(html.count('fetchpriority="high"'), 1)
+        self.assertIn('srcset="/static/img/hero/a-lake-480.webp 480w', html)
+        self.assertIn('data-srcset="/static/img/hero/b-small-480.webp 480w', html)
+        self.assertIn('data-src="/static/img/hero/b-small-600.jpg"', html)
+
+    def test_placeholders_are_sized_too(self):
+        with mock.patch("website.images.MANIFEST", os.path.join(self.output, "missing.json")):
+            html = self.client.get(reverse("home")).content.decode()
+        self.assertNotIn("/1600/900", html)
+        self.assertEqual(html.count('fetchpriority="high"'), 1)
+        self.assertIn('srcset="https://picsum.photos/id/1018/480/192.webp 480w', html)
+        self.assertIn('data-srcset="https://picsum.photos/id/1015/480/192.jpg 480w', html)
+        self.assertIn('data-src="https://picsum.photos/id/1015/1120/448.jpg"', html)
+        self.assertIn('sizes="(min-width: 1152px) 1120px, calc(100vw - 2rem)"', html)
+
+
+class HtmxNavigationTest(TestCase):
+    boosted = {"HTTP_HX_REQUEST": "true", "HTTP_HX_BOOSTED": "true"}
+
+    def setUp(self):
+        self.ts = Timeslot.objects.create(
+            event_name="Test Event",
+            start_at=timezone.now() + timezone.timedelta(days=1),
+            end_at=timezone.now() + timezone.timedelta(days=1, hours=1),
+            address="Test Address",
+            capacity=5,
+        )
+        self.user = User.objects.create_user(username="u1", password="test")
+        self.client.force_login(self.user)
+
+    def test_boosted_navigation_renders_only_the_page_blocks(self):
+        for url in (reverse("home"), reverse("timeslots"), reverse("my_bookings"), reverse("accounts:account")):
+            response = self.client.get(url, **self.boosted)
+            html = response.content.decode()
+            self.assertNotIn("<html", html)
+            self.assertNotIn("<footer", html)
+            self.assertIn('id="main-content"', html)
+            self.assertIn('<header id="site-header"', html)
+            self.assertIn('hx-swap-oob="true"', html)
+            self.assertEqual(response["HX-Retarget"], "#main")
+            self.assertEqual(response["HX-Push-Url"], url)
+            self.assertIn("HX-Boosted", response["Vary"])
+
+        html = self.client.get(reverse("timeslots")).content.decode()
+        self.assertIn("<footer", html)
+        self.assertIn('hx-boost="true"', html)
+
+    def test_history_restore_gets_the_full_page(self):
+        response = self.client.get(reverse("timeslots"), HTTP_HX_HISTORY_RESTORE_REQUEST="true", **self.boosted)
+        self.assertContains(response, "<footer")
+        self.assertFalse(response.has_header("HX-Retarget"))
+
+    def test_partial_and_full_page_have_different_etags(self):
+        full = self.client.get(reverse("timeslots"))["ETag"]
+        response = self.client.get(reverse("timeslots"), HTTP_IF_NONE_MATCH=full, **self.boosted)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], full)
+
+    def test_boosted_form_redirects_to_the_next_page(self):
+        response = self.client.post(
+            reverse("timeslot_book", args=[self.ts.id]), {"message": ""}, follow=True, **self.boosted
+        )
+        self.assertEqual(response.redirect_chain, [(reverse("timeslots"), 302)])
+        self.assertContains(response, "Booking created!")
+        self.assertNotContains(response, "<footer")
+        self.assertEqual(response["HX-Push-Url"], reverse("timeslots"))
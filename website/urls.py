@@ -8,8 +8,16 @@ urlpatterns = [
 
     # Booking / Timeslots
     path("booking/", views.booking, name="timeslots"),
+    path("booking/page/", views.timeslots_page, name="timeslots_page"),
+    path("booking/search/", views.timeslot_search, name="timeslot_search"),
+    path("booking/events/", views.timeslot_events, name="timeslot_events"),
+    path("booking/cache-stats/", views.fragment_cache_stats, name="fragment_cache_stats"),
+    path("metrics", views.metrics_view, name="metrics"),
     path("booking/create/", views.timeslot_create, name="timeslot_create"),
+    path("booking/create/series/", views.timeslot_series_create, name="timeslot_series_create"),
     path("booking/<int:pk>/", views.timeslot_book, name="timeslot_book"),
+    path("booking/export/<slug:kind>.<slug:fmt>", views.data_export, name="data_export"),
+    path("booking/import/", views.data_import, name="data_import"),
     path("my_bookings/", views.my_bookings, name="my_bookings"),
     path("booking/<int:pk>/edit/", views.timeslot_edit, name="timeslot_edit"),
 
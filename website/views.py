@@ -1,102 +1,213 @@
+import asyncio
+import csv
+import hmac
+import io
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
 from django.utils import timezone
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.http import require_POST
-from django.http import HttpResponseForbidden
-
-from .forms import BookingCreateForm, TimeslotCreateForm
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import archive, etags, exports, fragment_cache, images, imports, live, metrics
+from .forms import BookingCreateForm, DataImportForm, TimeslotCreateForm, TimeslotSeriesForm
 from .models import Booking, BookingStatus, Timeslot, TimeslotStatus
+from .pagination import decode_cursor, keyset_page
+from .search import search_timeslots
+from .services import book_timeslot, release_seat
+
+
+def _is_htmx(request) -> bool:
+    # An HTMX action (card buttons, search, ...); boosted page navigation
+    # renders the normal page, see website.htmx
+    return request.headers.get("HX-Request") == "true" and request.headers.get("HX-Boosted") != "true"
 
 
 def home(request):
-    if request.headers.get("HX-Request") == "true":
-        return render(request, "partials/_home_content.html")
-    return render(request, "home.html")
+    return render(request, "home.html", {"hero_slides": images.slides("hero") or images.placeholder_slides()})
 
 
 def about(request):
-    if request.headers.get("HX-Request") == "true":
-        return render(request, "partials/_about_content.html")
-    return render(request, "about.html")
+    return render(request, "about.html", {"hero_slides": images.slides("hero") or images.placeholder_slides()})
 
 
-def booking(request):
+TIMESLOT_PAGE_SIZE = 20
+MY_BOOKINGS_PAGE_SIZE = 20
+MY_BOOKINGS_TABS = [("upcoming", "Upcoming"), ("past", "Past"), ("cancelled", "Cancelled")]
+
+
+def _timeslot_card_response(request, timeslot_id: int):
+    """HTMX answer to a card action: the updated card plus the messages out of band."""
+    ts = (
+        Timeslot.objects.with_free_spots()
+        .with_user_booking(request.user)
+        .get(pk=timeslot_id)
+    )
+    card = fragment_cache.render_cards(request, [ts])[0]
+    flash = render_to_string("partials/_messages.html", {"oob": True}, request)
+    return HttpResponse(card + flash)
+
+
+def _visible_timeslots(request, q=""):
     qs = Timeslot.objects.future()
 
     # Hide cancelled events for non-staff users
     if not request.user.is_authenticated or not request.user.is_staff:
         qs = qs.filter(status=TimeslotStatus.OPEN)
+    return search_timeslots(qs, q)
+
+
+def _timeslot_page_html(request, cursor=None, q="") -> str:
+    # Cards of one page plus the infinite-scroll sentinel. Anonymous visitors
+    # all see the same page, so it's cached whole for them (not search results).
+    anonymous = not request.user.is_authenticated and not q
+    if anonymous:
+        html = fragment_cache.get_list(cursor)
+        if html is not None:
+            return html
+
+    timeslots, next_cursor = keyset_page(
+        _visible_timeslots(request, q).with_user_booking(request.user),
+        cursor,
+        TIMESLOT_PAGE_SIZE,
+    )
+    html = render_to_string(
+        "partials/_timeslot_page.html",
+        {
+            "cards": fragment_cache.render_cards(request, timeslots),
+            "cursor": cursor,
+            "next_cursor": next_cursor,
+            "q": q,
+        },
+    )
+    if anonymous:
+        fragment_cache.set_list(cursor, html)
+    return mark_safe(html)
 
-    timeslots = qs
 
-    my_booking_id_by_timeslot = {}
-    if request.user.is_authenticated:
-        my_booking_id_by_timeslot = dict(
-            Booking.objects.filter(
-                user=request.user,
-                status=BookingStatus.CONFIRMED,
-                timeslot_id__in=timeslots.values_list("id", flat=True),
-            ).values_list("timeslot_id", "id")
-        )
+# Browsers keep the page but ask every time; unchanged pages get a 304, see website.etags
+revalidate = cache_control(private=True, no_cache=True)
+
 
+@revalidate
+@condition(etag_func=etags.page_etag)
+def booking(request):
+    q = request.GET.get("q", "").strip()
     return render(
         request,
         "booking/timeslots.html",
-        {
-            "timeslots": timeslots,
-            "my_booking_id_by_timeslot": my_booking_id_by_timeslot,
-        },
+        {"timeslot_page": _timeslot_page_html(request, q=q), "q": q},
     )
 
 
+def timeslots_page(request):
+    # Next page of timeslot cards for the infinite scroll on the booking page
+    cursor = request.GET.get("after", "")
+    try:
+        decode_cursor(cursor)
+    except (ValueError, OverflowError):
+        return HttpResponseBadRequest("Invalid cursor.")
+    return HttpResponse(_timeslot_page_html(request, cursor, request.GET.get("q", "").strip()))
+
+
+# Comment line every so often, so proxies keep the stream open and closed tabs are noticed
+SSE_KEEPALIVE = 15
+
+
+async def timeslot_events(request):
+    # Seat/status changes for the booking page as Server-Sent Events, see website.live
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI every open stream would hold a worker; 204 stops the browser's retries
+        return HttpResponse(status=204)
+    user = await request.auser()
+    queue = live.BROKER.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+                except TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event.status == TimeslotStatus.HIDDEN and not user.is_staff:
+                    continue
+                yield event.sse()
+        finally:
+            live.BROKER.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def timeslot_search(request):
+    # Live search box: the first page of matching cards, replaces the list
+    return HttpResponse(_timeslot_page_html(request, q=request.GET.get("q", "").strip()))
+
+
+@staff_member_required
+def fragment_cache_stats(request):
+    return JsonResponse(fragment_cache.stats())
+
+
+def metrics_view(request):
+    # Prometheus scrapes with the bearer token, staff can look at it logged in
+    token = settings.METRICS_TOKEN
+    auth = request.headers.get("Authorization", "")
+    authorized = bool(token) and hmac.compare_digest(auth, f"Bearer {token}")
+    if not authorized and not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponseForbidden("Not allowed.")
+    return HttpResponse(metrics.REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @login_required
+@revalidate
+@condition(etag_func=etags.page_etag)
 def timeslot_book(request, pk: int):
     if request.method == "POST":
         form = BookingCreateForm(request.POST)
         if form.is_valid():
             try:
-                with transaction.atomic():
-                    ts = Timeslot.objects.select_for_update().get(pk=pk)
-
-                    if ts.status != TimeslotStatus.OPEN:
-                        raise ValidationError("This timeslot is not open for booking.")
-                    if not ts.is_future:
-                        raise ValidationError("This timeslot is in the past.")
-
-                    confirmed = Booking.objects.filter(
-                        timeslot=ts, status=BookingStatus.CONFIRMED
-                    ).count()
-                    if confirmed >= ts.capacity:
-                        raise ValidationError("This timeslot is fully booked.")
-
-                    if Booking.objects.filter(
-                        timeslot=ts, user=request.user, status=BookingStatus.CONFIRMED
-                    ).exists():
-                        raise ValidationError("You already booked this timeslot.")
-
-                    Booking.objects.create(
-                        timeslot=ts,
-                        user=request.user,
-                        status=BookingStatus.CONFIRMED,
-                        message=form.cleaned_data.get("message", ""),
-                    )
-
-                messages.success(request, "Booking created!")
-                return redirect("timeslots")
-
+                book_timeslot(pk, request.user, form.cleaned_data.get("message", ""))
+            except Timeslot.DoesNotExist:
+                raise Http404("No Timeslot matches the given query.")
             except ValidationError as e:
+                if _is_htmx(request):
+                    messages.error(request, e.message)
+                    return _timeslot_card_response(request, pk)
                 form.add_error(None, e.message)
+            else:
+                messages.success(request, "Booking created!")
+                if _is_htmx(request):
+                    return _timeslot_card_response(request, pk)
+                return redirect("timeslots")
     else:
-        ts = get_object_or_404(Timeslot, pk=pk)
         form = BookingCreateForm()
 
-    if request.method == "POST":
-        ts = get_object_or_404(Timeslot, pk=pk)
-
+    ts = get_object_or_404(Timeslot, pk=pk)
+    if _is_htmx(request):
+        # The Buchen link of a card, the form replaces it
+        return render(request, "partials/_booking_form.html", {"timeslot": ts, "form": form})
     return render(request, "booking/timeslot_book.html", {"timeslot": ts, "form": form})
 
 
@@ -115,6 +226,22 @@ def timeslot_create(request):
 
 
 
+@staff_member_required
+def timeslot_series_create(request):
+    if request.method == "POST":
+        form = TimeslotSeriesForm(request.POST)
+        if form.is_valid() and "preview" not in request.POST:
+            timeslots = form.save()
+            messages.success(request, f"{len(timeslots)} timeslots created!")
+            return redirect("timeslots")
+    else:
+        form = TimeslotSeriesForm()
+
+    if _is_htmx(request):
+        return render(request, "partials/_series_preview.html", {"form": form})
+    return render(request, "booking/timeslot_series_create.html", {"form": form})
+
+
 @staff_member_required
 def timeslot_edit(request, pk: int):
     ts = get_object_or_404(Timeslot, pk=pk)
@@ -134,34 +261,74 @@ def timeslot_edit(request, pk: int):
 
 
 
+@staff_member_required
+def data_export(request, kind: str, fmt: str):
+    if kind not in exports.KINDS or fmt not in exports.FORMATS:
+        raise Http404("Unknown export.")
+    timeslot_id = request.GET.get("timeslot")
+    if timeslot_id is not None and not timeslot_id.isdigit():
+        return HttpResponseBadRequest("Invalid timeslot.")
+
+    # Rows are written while they are read, the response is never built in memory
+    response = StreamingHttpResponse(
+        exports.stream(kind, fmt, int(timeslot_id) if timeslot_id else None),
+        content_type="text/csv" if fmt == "csv" else "application/json",
+    )
+    name = f"{kind}-{timeslot_id}" if timeslot_id else kind
+    response["Content-Disposition"] = f'attachment; filename="{name}.{fmt}"'
+    return response
+
+
+@staff_member_required
+def data_import(request):
+    report = None
+    if request.method == "POST":
+        form = DataImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data["file"]
+            fmt = "json" if upload.name.lower().endswith(".json") else "csv"
+            rows = imports.read_rows(io.TextIOWrapper(upload.file, encoding="utf-8-sig"), fmt)
+            try:
+                if form.cleaned_data["kind"] == "timeslots":
+                    report = imports.import_timeslots(rows)
+                else:
+                    report = imports.import_bookings(rows)
+            except (ValueError, csv.Error) as e:
+                form.add_error("file", f"Could not read the file: {e}")
+            else:
+                messages.success(request, f"Import: {report}.")
+    else:
+        form = DataImportForm()
+
+    return render(request, "booking/data_import.html", {"form": form, "report": report})
+
+
 @login_required
+@revalidate
+@condition(etag_func=etags.page_etag)
 def my_bookings(request):
-    bookings = (
-        Booking.objects
-        .filter(
-            user=request.user,
-            timeslot__end_at__gte=timezone.now(),
-            status__in=[BookingStatus.CONFIRMED, BookingStatus.CANCELLED],
-        )
-        .select_related("timeslot")
-        .order_by("timeslot__start_at")
-        )
+    tab = request.GET.get("tab")
+    if tab not in archive.TABS:
+        tab = "upcoming"
+    page = Paginator(archive.booking_history(request.user, tab), MY_BOOKINGS_PAGE_SIZE).get_page(
+        request.GET.get("page")
+    )
     return render(
         request,
         "booking/my_bookings.html",
-        {"bookings": bookings},
+        {"page": page, "tab": tab, "tabs": MY_BOOKINGS_TABS},
     )
 
 
-
 @login_required
 @require_POST
 @transaction.atomic
 def booking_cancel(request, booking_id: int):
-    booking = get_object_or_404(
-        Booking.objects.select_for_update().select_related("timeslot"),
-        pk=booking_id,
-    )
+    with metrics.lock_wait.time(view="booking_cancel"):
+        booking = get_object_or_404(
+            Booking.objects.select_for_update().select_related("timeslot"),
+            pk=booking_id,
+        )
 
     # user can cancel only own booking (staff could be allowed too if you want)
     if booking.user_id != request.user.id and not request.user.is_staff:
@@ -169,13 +336,19 @@ def booking_cancel(request, booking_id: int):
 
     if booking.status == BookingStatus.CANCELLED:
         messages.info(request, "Booking already cancelled.")
+        if _is_htmx(request):
+            return _timeslot_card_response(request, booking.timeslot_id)
         return redirect("timeslots")
 
     booking.status = BookingStatus.CANCELLED
     booking.cancelled_at = timezone.now()
     booking.save(update_fields=["status", "cancelled_at"])
+    release_seat(booking.timeslot_id)
+    metrics.bookings_cancelled.inc(by="user")
 
     messages.success(request, "Booking cancelled.")
+    if _is_htmx(request):
+        return _timeslot_card_response(request, booking.timeslot_id)
     return redirect("timeslots")
 
 
@@ -183,45 +356,32 @@ def booking_cancel(request, booking_id: int):
 @require_POST
 @transaction.atomic
 def timeslot_cancel(request, pk: int):
-    ts = get_object_or_404(Timeslot.objects.select_for_update(), pk=pk)
-
-    if ts.status == TimeslotStatus.CANCELLED:
-        messages.info(request, "Timeslot already cancelled.")
-        return redirect("timeslots")
-
-    ts.status = TimeslotStatus.CANCELLED
-    ts.save(update_fields=["status"])
-
-    # cancel all confirmed bookings in that timeslot
-    Booking.objects.filter(timeslot=ts, status=BookingStatus.CONFIRMED).update(
-        status=BookingStatus.CANCELLED,
-        cancelled_at=timezone.now(),
-    )
-
-    messages.success(request, "Timeslot cancelled (all bookings cancelled).")
-    return redirect("timeslots")
-
-
-
-@staff_member_required
-@require_POST
-@transaction.atomic
-def timeslot_cancel(request, pk: int):
-    ts = get_object_or_404(Timeslot.objects.select_for_update(), pk=pk)
+    with metrics.lock_wait.time(view="timeslot_cancel"):
+        ts = get_object_or_404(Timeslot.objects.select_for_update(), pk=pk)
 
     if ts.status == TimeslotStatus.CANCELLED:
         messages.info(request, "Event ist bereits abgesagt.")
+        if _is_htmx(request):
+            return _timeslot_card_response(request, pk)
         return redirect("timeslots")
 
     # Cancel the timeslot itself
     ts.status = TimeslotStatus.CANCELLED
-    ts.save(update_fields=["status"])
+    ts.confirmed_count = 0
+    ts.save(update_fields=["status", "confirmed_count", "updated_at"])
+    ts.shards.update(confirmed_count=0)
 
     # Cancel all confirmed bookings for that timeslot
-    Booking.objects.filter(timeslot=ts, status=BookingStatus.CONFIRMED).update(
+    cancelled = Booking.objects.filter(
+        timeslot=ts, timeslot_start_at=ts.start_at, status=BookingStatus.CONFIRMED
+    ).update(
         status=BookingStatus.CANCELLED,
         cancelled_at=timezone.now(),
     )
+    live.seats_changed(ts.pk)
+    metrics.bookings_cancelled.inc(cancelled, by="timeslot")
 
     messages.success(request, "Event wurde abgesagt.")
+    if _is_htmx(request):
+        return _timeslot_card_response(request, pk)
     return redirect("timeslots")